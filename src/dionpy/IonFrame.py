@@ -1,39 +1,39 @@
 from __future__ import annotations
-from __future__ import annotations
 
+import asyncio
 import itertools
 import warnings
 import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from multiprocessing import Pool, cpu_count
-from typing import Tuple
+from multiprocessing import Pool
+from typing import List, Tuple
 from typing import Union, Sequence
 
 import h5py
-import healpy as hp
 import iricore.iri
 from iricore.iri import indices_uptodate
 import numpy as np
 
-from .modules.helpers import eval_layer, R_EARTH
-from .modules.helpers import none_or_array, altaz_mesh, open_save_file
+from .executor import IonExecutor, pool_context, nworkers
+from .modules.aio import default_executor, run_cancellable
+from .modules.cache import ProfileCache, ResultCache, array_digest
+from .modules.geometry import FrameGeometry, frame_geometry
+from .modules.helpers import eval_layer
+from .modules.helpers import none_or_array, altaz_mesh, open_save_file, frame_dataset_options
+from .modules.interpolation import interp_obs
 from .modules.ion_tools import trop_refr, plasfreq
-from .modules.parallel import create_shared_block
-from .modules.parallel import shared_array
-from .modules.parallel_iri import parallel_iri, parallel_echaim
+from .modules.parallel import SharedBlock
+from .modules.parallel_iri import parallel_iri_star, parallel_echaim_star
 from .modules.plotting import polar_plot
+from .modules.scheduler import ProfileJob, calc_frames
 
 
-def _estimate_ahd(htop: float, hint: float = 0, r: float = R_EARTH * 1e-3):
+def _squeeze_tail(arr: np.ndarray) -> np.ndarray:
     """
-    Estimates the angular horizontal distance (ahd) between the top point of an atmospheric
-    layer and the Earth's surface.
-
-    :param htop: The height of the top point of the atmospheric layer in [km].
-    :param hint: The height above the Earth's surface in [km].
-    :param r: The radius of the Earth in [km].
+    Removes single-dimensional entries from the shape of an array, except for the first axis.
     """
-    return np.rad2deg(np.arccos(r / (r + hint)) + np.arccos(r / (r + htop)))
+    return np.squeeze(arr, axis=tuple(i for i in range(1, arr.ndim) if arr.shape[i] == 1))
 
 
 class IonFrame:
@@ -56,6 +56,10 @@ class IonFrame:
                         to IRI-2020.
     :param echaim: Use ECHAIM model for electron density estimation.
     :param autocalc: If True - the model will be calculated immediately after definition.
+    :param executor: An :class:`IonExecutor` whose workers are used for calculations instead of a temporary
+                     pool of processes.
+    :param profile_cache: A :class:`~dionpy.ProfileCache` to read IRI/E-CHAIM profiles from, and store newly
+                          calculated ones to.
     """
 
     def __init__(
@@ -71,9 +75,11 @@ class IonFrame:
             iriversion: int = 20,
             autocalc: bool = True,
             echaim: bool = False,
+            executor: IonExecutor | None = None,
+            profile_cache: ProfileCache | None = None,
             _pool: Union[mp.Pool, None] = None,
     ):
-        self.rdeg = _estimate_ahd(htop, position[-1] * 1e-3) + rdeg_offset
+        self._geometry = frame_geometry(position, nside, htop, rdeg_offset)
         self.rdeg_offset = rdeg_offset
 
         if echaim:
@@ -90,21 +96,15 @@ class IonFrame:
         else:
             raise ValueError("Parameter dt must be a datetime object.")
 
-        indices_uptodate(dt)
-
         self.position = position
         self.name = name
         self.echaim = echaim
+        self.executor = executor
+        self.profile_cache = profile_cache
 
         self.nside = nside
         self.iriversion = iriversion
-        self._posvec = hp.ang2vec(self.position[1], self.position[0], lonlat=True)
-        self._obs_pixels = hp.query_disc(
-            self.nside, self._posvec, np.deg2rad(self.rdeg), inclusive=True
-        )
-        self._obs_lons, self._obs_lats = hp.pix2ang(
-            self.nside, self._obs_pixels, lonlat=True
-        )
+        self._shared = {}
         self.edens = np.zeros((len(self._obs_pixels), nlayers), dtype=np.float32)
         self.etemp = np.zeros((len(self._obs_pixels), nlayers), dtype=np.float32)
 
@@ -114,46 +114,240 @@ class IonFrame:
     def __call__(self,
                  alt: float | np.ndarray,
                  az: float | np.ndarray,
-                 freq: float,
+                 freq: float | np.ndarray,
                  col_freq: str = "default",
                  troposphere: bool = True,
                  height_profile: bool = False,
+                 backend: str = "numpy",
+                 parallel: str = "process",
+                 executor: IonExecutor | None = None,
+                 cache: bool | ResultCache = False,
                  _pool: Union[Pool, None] = None,
                  ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
-        from .raytracing import raytrace_star
+        from .raytracing import raytrace_cache, resolve_backend
+        backend = resolve_backend(backend)
+        if parallel not in ("process", "thread"):
+            raise ValueError(f"Parameter parallel must be 'process' or 'thread', got '{parallel}'.")
+        if cache is False:
+            return self._raytrace(alt, az, freq, col_freq, troposphere, height_profile, backend, parallel, executor,
+                                  _pool)
+
+        cache = raytrace_cache if cache is True else cache
+        key = self._raytrace_key(alt, az, freq, col_freq, troposphere, height_profile, backend)
+        res = cache.get(key)
+        if res is None:
+            res = self._raytrace(alt, az, freq, col_freq, troposphere, height_profile, backend, parallel, executor,
+                                 _pool)
+            cache.put(key, res)
+        # Cached arrays must not be modified by the caller
+        return tuple(np.array(x) for x in res)
+
+    def _raytrace_key(self, alt, az, freq, col_freq, troposphere, height_profile, backend) -> str:
+        """
+        Key of raytracing results in a :class:`ResultCache`: a hash of the frame data, geometry and call parameters.
+        """
+        params = (self.position, self.nside, self.hbot, self.htop, self.nlayers, self.rdeg_offset, col_freq,
+                  bool(troposphere), bool(height_profile), backend)
+        return array_digest(
+            np.frombuffer(repr(params).encode(), dtype=np.uint8),
+            self.edens,
+            self.etemp,
+            np.asarray(alt, dtype=np.float64),
+            np.asarray(az, dtype=np.float64),
+            np.asarray(freq, dtype=np.float64),
+        )
+
+    def _raytrace(self, alt, az, freq, col_freq, troposphere, height_profile, backend, parallel, executor, _pool):
+        from .raytracing import INPROCESS_MAX_RAYS, raytrace_shared_star, raytrace_frame
         b_alt = np.atleast_1d(alt).astype(np.float64)
         b_az = np.atleast_1d(az).astype(np.float64)
-        nproc = np.min([len(b_alt), cpu_count()])
+
+        if backend == "numba" or b_alt.size * np.size(freq) <= INPROCESS_MAX_RAYS:
+            # The compiled kernels are parallel over rays, and small requests are faster to trace here than to send
+            # to workers, no need in a pool
+            res = [raytrace_frame(self, b_alt, b_az, freq, col_freq, troposphere, height_profile, backend)]
+            return self._join_chunks(res, freq)
+
+        executor = executor or self.executor
+        nproc = np.min([len(b_alt), nworkers(executor, _pool)])
+        if parallel == "thread":
+            # NumPy and healpy release the GIL, so chunks are traced concurrently against this very frame
+            with ThreadPoolExecutor(max_workers=nproc) as threads:
+                res = list(threads.map(
+                    lambda c_alt, c_az: raytrace_frame(self, c_alt, c_az, freq, col_freq, troposphere,
+                                                       height_profile, backend),
+                    np.array_split(b_alt, nproc),
+                    np.array_split(b_az, nproc),
+                ))
+            return self._join_chunks(res, freq)
+
+        # Results of all chunks are written to a single (3, nfreq, ...) block by workers
+        out_shape = (3, np.size(freq), *b_alt.shape) + ((self.nlayers,) if height_profile else ())
+        b_start = [len(x) for x in np.array_split(b_alt, nproc)]
+        b_start = np.cumsum([0] + b_start[:-1])
         b_alt = np.array_split(b_alt, nproc)
         b_az = np.array_split(b_az, nproc)
 
-        # pool = Pool(processes=nproc) if _pool is None else _pool
-        pool = _pool or mp.get_context('fork').Pool(processes=nproc)
-
-        sh_edens = shared_array(self.edens)
-        sh_etemp = shared_array(self.etemp)
+        data_specs = self._share()
         init_dict = self.get_init_dict()
 
-        res = list(
-            pool.imap(
-                raytrace_star,
-                zip(
-                    itertools.repeat(init_dict),
-                    itertools.repeat(sh_edens),
-                    itertools.repeat(sh_etemp),
-                    b_alt,
-                    b_az,
-                    itertools.repeat(freq),
-                    itertools.repeat(col_freq),
-                    itertools.repeat(troposphere),
-                    itertools.repeat(height_profile),
-                ),
-            )
-        )
-        dtheta = np.squeeze(np.concatenate([x[0] for x in res], axis=0))
-        atten = np.squeeze(np.concatenate([x[1] for x in res], axis=0))
-        emiss = np.squeeze(np.concatenate([x[2] for x in res], axis=0))
-        return dtheta, atten, emiss
+        with SharedBlock(out_shape, np.float64) as out:
+            with pool_context(executor, _pool, nproc) as pool:
+                list(
+                    pool.imap(
+                        raytrace_shared_star,
+                        zip(
+                            itertools.repeat(init_dict),
+                            itertools.repeat(data_specs),
+                            itertools.repeat(out.spec),
+                            b_start,
+                            b_alt,
+                            b_az,
+                            itertools.repeat(np.atleast_1d(freq)),
+                            itertools.repeat(col_freq),
+                            itertools.repeat(troposphere),
+                            itertools.repeat(height_profile),
+                            itertools.repeat(backend),
+                        ),
+                    )
+                )
+            # The results are views of the block, which stays mapped until they are deleted
+            res = tuple(out.array)
+        if np.ndim(freq) == 0:
+            return tuple(np.squeeze(x) for x in res)
+        return tuple(_squeeze_tail(x) for x in res)
+
+    @staticmethod
+    def _join_chunks(res, freq):
+        """
+        Concatenates raytracing results calculated for chunks of directions.
+        """
+        if np.ndim(freq) == 0:
+            return tuple(np.squeeze(np.concatenate([x[i] for x in res], axis=0)) for i in range(3))
+        # Keep the leading frequency axis for multichannel results
+        return tuple(_squeeze_tail(np.concatenate([x[i] for x in res], axis=1)) for i in range(3))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Shared memory blocks and worker pools stay with the current process
+        state["_shared"] = {}
+        for key in ("edens", "etemp"):
+            data = getattr(self, "_" + key)
+            # Data in shared memory or in a file is copied
+            if key in self._shared or isinstance(data, h5py.Dataset):
+                state["_" + key] = np.array(data)
+        state["executor"] = None
+        return state
+
+    @property
+    def edens(self) -> np.ndarray:
+        """
+        Electron density in [m^-3] in the observed pixels, an array of shape (npixels, nlayers).
+        """
+        return self._edens
+
+    @edens.setter
+    def edens(self, value: np.ndarray):
+        self._release_block("edens")
+        self._edens = value
+
+    @property
+    def etemp(self) -> np.ndarray:
+        """
+        Electron temperature in [K] in the observed pixels, an array of shape (npixels, nlayers).
+        """
+        return self._etemp
+
+    @etemp.setter
+    def etemp(self, value: np.ndarray):
+        self._release_block("etemp")
+        self._etemp = value
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Memory taken by electron density and temperature in bytes. Data read lazily from a file is not counted.
+        """
+        return sum(x.nbytes for x in (self._edens, self._etemp) if isinstance(x, np.ndarray))
+
+    @property
+    def geometry(self) -> FrameGeometry:
+        """
+        Observed pixels of the frame and their coordinates, shared by all frames with the same position and grid.
+        """
+        return self._geometry
+
+    @property
+    def rdeg(self) -> float:
+        """
+        Angular horizon distance of the calculated ionosphere in [degrees].
+        """
+        return self._geometry.rdeg
+
+    @property
+    def _posvec(self) -> np.ndarray:
+        return self._geometry.posvec
+
+    @property
+    def _obs_pixels(self) -> np.ndarray:
+        return self._geometry.obs_pixels
+
+    @property
+    def _obs_lons(self) -> np.ndarray:
+        return self._geometry.obs_lons
+
+    @property
+    def _obs_lats(self) -> np.ndarray:
+        return self._geometry.obs_lats
+
+    def _share(self):
+        """
+        Moves electron density and temperature to shared memory, so that worker processes can read them without
+        copying. The data stays there until the frame is deleted, the arrays are reassigned or
+        :func:`release_shared` is called. Data which is a view of another array (e.g. of the stacked data of an
+        :class:`IonModel`) is not moved; a copy of it in shared memory is refreshed on every call instead.
+
+        :return: Specs of the (edens, etemp) shared blocks.
+        """
+        for key in ("edens", "etemp"):
+            data = np.asarray(getattr(self, "_" + key))
+            block = self._shared.get(key)
+            if block is None:
+                block = self._shared[key] = SharedBlock.from_array(data)
+                if data.base is None:
+                    setattr(self, "_" + key, block.array)
+            elif block.array is not data:
+                block.array[:] = data
+        return self._shared["edens"].spec, self._shared["etemp"].spec
+
+    def _release_block(self, key):
+        block = self._shared.pop(key, None)
+        if block is not None:
+            block.close()
+
+    def release_shared(self):
+        """
+        Moves electron density and temperature from shared memory back to the memory of the current process.
+        Shared memory is used by raytracing in a pool of processes; frees it if the frame is not raytraced again soon.
+        """
+        for key in list(self._shared):
+            data = getattr(self, "_" + key)
+            if data is self._shared[key].array:
+                data = np.array(data)
+            self._release_block(key)
+            setattr(self, "_" + key, data)
+
+    def _view(self, dt: datetime, edens: np.ndarray, etemp: np.ndarray) -> IonFrame:
+        """
+        Creates a frame at another time, which shares geometry (observed pixels and their coordinates) with this
+        frame and holds the given arrays as its data without copying.
+        """
+        frame = object.__new__(type(self))
+        frame.__dict__.update(self.__dict__)
+        frame.dt = dt
+        frame._shared = {}
+        frame._edens, frame._etemp = edens, etemp
+        return frame
 
     def __str__(self):
         return (
@@ -192,91 +386,68 @@ class IonFrame:
             autocalc=False,
         )
 
-    def _batch_split(self, batch):
-        nbatches = len(self._obs_pixels) // batch + 1
-        nproc = np.min([mp.cpu_count(), nbatches])
-        blat = np.array_split(self._obs_lats, nbatches)
-        blon = np.array_split(self._obs_lons, nbatches)
-        return nbatches, nproc, blat, blon
+    def _profile_key(self, model: str) -> str:
+        """
+        Key of the profiles of this frame in a :class:`ProfileCache`. Does not depend on the position of the frame.
+        """
+        return f"{model}_{self.dt:%Y%m%dT%H%M%S}_nside{self.nside}_h{self.hbot:g}-{self.htop:g}x{self.nlayers}"
 
-    def calc(self, _pool=None):
-        heights = (
+    def _profile_jobs(self) -> List[ProfileJob]:
+        """
+        Returns calculations needed to fill the frame data: IRI electron density and temperature and, if enabled,
+        E-CHAIM electron density, which replaces the IRI one.
+        """
+        # Checked here rather than on creation, so that frames built only to hold or raytrace data skip it
+        indices_uptodate(self.dt)
+        iri_heights = (
             self.hbot,
             self.htop,
             (self.htop - self.hbot) / (self.nlayers - 1) - 1e-6,
         )
+        jobs = [ProfileJob(
+            self,
+            "iri",
+            self._profile_key(f"iri{self.iriversion}"),
+            ("edens", "etemp"),
+            parallel_iri_star,
+            lambda lat, lon, start, edens, etemp: (self.dt, iri_heights, lat, lon, edens, etemp, start,
+                                                   self.iriversion),
+        )]
+        if self.echaim:
+            echaim_heights = np.linspace(self.hbot, self.htop, self.nlayers, endpoint=True)
+            jobs.append(ProfileJob(
+                self,
+                "echaim",
+                self._profile_key("echaim"),
+                ("edens",),
+                parallel_echaim_star,
+                lambda lat, lon, start, edens: (lat, lon, echaim_heights, self.dt, edens, start, True, True, True),
+            ))
+        return jobs
 
-        batch_size = 200
-        nbatches, nproc, batch_lat, batch_lon = self._batch_split(batch_size)
-        batch_i = np.zeros(nbatches, dtype=np.int32)
-        for i in range(nbatches - 1):
-            batch_i[i + 1] = batch_i[i] + len(batch_lat[i])
-        shm_edens, shedens = create_shared_block(self.edens)
-        shm_etemp, shetemp = create_shared_block(self.etemp)
-
-        pool = _pool or mp.get_context('fork').Pool(processes=nproc)
-        pool.starmap(
-            parallel_iri,
-            zip(
-                itertools.repeat(self.dt),
-                itertools.repeat(heights),
-                batch_lat,
-                batch_lon,
-                itertools.repeat(shm_edens.name),
-                itertools.repeat(shm_etemp.name),
-                itertools.repeat(self.edens.shape),
-                batch_i,
-                itertools.repeat(self.iriversion),
-            )
-        )
-
-        if _pool is None:
-            pool.close()
-
-        self.edens[:] = shedens[:]
-        self.etemp[:] = shetemp[:]
+    def calc(self, executor: IonExecutor | None = None, progress: bool = False, _pool=None):
+        """
+        Calculates electron density and temperature with IRI (and E-CHAIM if enabled). If the frame has a profile
+        cache, only profiles missing in the cache are calculated.
 
-        shm_edens.close()
-        shm_edens.unlink()
-        shm_etemp.close()
-        shm_etemp.unlink()
+        :param executor: An :class:`IonExecutor` to run the calculation in. Defaults to the executor the frame was
+                         created with; if there is none, a temporary pool of processes is used.
+        :param progress: If True - displays a progress bar.
+        """
+        calc_frames([self], executor or self.executor, progress=progress, _pool=_pool)
 
-        if self.echaim:
-            self._calc_echaim(_pool=_pool)
-
-    def _calc_echaim(self, _pool: Union[mp.Pool, None] = None):
-        """
-        Replace electron density with that calculated with ECHAIM.
-        """
-        heights = np.linspace(self.hbot, self.htop, self.nlayers, endpoint=True)
-        batch_size = 100
-        nbatches, nproc, batch_lat, batch_lon = self._batch_split(batch_size)
-
-        batch_i = np.zeros(nbatches, dtype=np.int32)
-        for i in range(nbatches - 1):
-            batch_i[i + 1] = batch_i[i] + len(batch_lat[i])
-        shm_edens, shedens = create_shared_block(self.edens)
-
-        pool = _pool or mp.get_context('fork').Pool(processes=nproc)
-        pool.starmap(
-            parallel_echaim,
-            zip(
-                batch_lat,
-                batch_lon,
-                itertools.repeat(heights),
-                itertools.repeat(self.dt),
-                itertools.repeat(shm_edens.name),
-                itertools.repeat(self.edens.shape),
-                batch_i,
-                itertools.repeat(True),
-                itertools.repeat(True),
-                itertools.repeat(True),
-            )
-        )
+    async def acalc(self, executor: IonExecutor | None = None, limit: asyncio.Semaphore | None = None):
+        """
+        Awaitable version of :func:`calc`, which does not block the event loop. Cancelling the awaiting task stops the
+        calculation; batches of profiles already sent to workers are abandoned.
 
-        if _pool is None:
-            pool.close()
-        self.edens[:] = shedens[:]
+        :param executor: An :class:`IonExecutor` to run the calculation in. Defaults to the executor the frame was
+                         created with; if there is none, a shared executor of awaitable calculations is used.
+        :param limit: A semaphore limiting the number of concurrent calculations, e.g. shared by many frames. Defaults
+                      to a limit of ``dionpy.modules.aio.DEFAULT_LIMIT`` calculations per event loop.
+        """
+        executor = executor or self.executor or default_executor()
+        await run_cancellable(lambda cancel: calc_frames([self], executor, _cancel=cancel), limit)
 
     def ed(
             self,
@@ -334,9 +505,7 @@ class IonFrame:
                       If None - an average over all layers is returned.
         :return: Electron density in the layer.
         """
-        map_ = np.zeros(hp.nside2npix(self.nside)) + hp.UNSEEN
-        map_[self._obs_pixels] = self.edens[:, layer]
-        return hp.pixelfunc.get_interp_val(map_, lon, lat, lonlat=True)
+        return interp_obs(self.nside, self._obs_pixels, self.edens[:, layer], lon, lat)
 
     def et(
             self,
@@ -377,9 +546,7 @@ class IonFrame:
                       If None - an average over all layers is returned.
         :return: Electron density in the layer.
         """
-        map_ = np.zeros(hp.nside2npix(self.nside)) + hp.UNSEEN
-        map_[self._obs_pixels] = self.etemp[:, layer]
-        return hp.pixelfunc.get_interp_val(map_, lon, lat, lonlat=True)
+        return interp_obs(self.nside, self._obs_pixels, self.etemp[:, layer], lon, lat)
 
     def get_heights(self):
         return np.linspace(self.hbot, self.htop, self.nlayers)
@@ -387,10 +554,14 @@ class IonFrame:
     def raytrace(self,
                  alt: float | np.ndarray,
                  az: float | np.ndarray,
-                 freq: float,
+                 freq: float | np.ndarray,
                  col_freq: str = "default",
                  troposphere: bool = True,
                  height_profile: bool = False,
+                 backend: str = "numpy",
+                 parallel: str = "process",
+                 executor: IonExecutor | None = None,
+                 cache: bool | ResultCache = False,
                  _pool: Union[Pool, None] = None,
                  ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
         """
@@ -399,7 +570,8 @@ class IonFrame:
 
         :param alt: Altitude (elevation) of observation in [deg].
         :param az: Azimuth of observation in [deg].
-        :param freq: Frequency of observation in [MHz].
+        :param freq: Frequency of observation in [MHz]. If an array of frequencies is given, all channels are traced
+                     in a single pass and all outputs get a leading frequency axis: (nfreq, ...).
         :param col_freq: Model of colission frequency. Available options: \n
                          "default" == "aggrawal" \n
                          "aggrawal": https://ui.adsabs.harvard.edu/abs/1979P%26SS...27..753A/abstract \n
@@ -408,9 +580,35 @@ class IonFrame:
         :param troposphere: Where to include the tropospheric refraction effect.
         :param height_profile: If True, returns arrays of attenuation and emission before integration and a cumulative
                                history of refraction.
+        :param backend: Implementation of the raytracing procedure: "numpy" - vectorized NumPy code executed in a
+                        pool of processes; "numba" - compiled kernels parallelized over rays in the current process
+                        (requires `pip install dionpy[numba]`, falls back to "numpy" if numba is not available).
+        :param parallel: How the "numpy" backend is parallelized: "process" - in a pool of processes; "thread" - in
+                         threads of the current process, which avoids starting processes and copying the frame data.
+                         Requests of at most ``dionpy.raytracing.INPROCESS_MAX_RAYS`` rays (directions x frequencies)
+                         are traced in the current process without parallelization.
+        :param executor: An :class:`IonExecutor` to run the "numpy" backend in. Defaults to the executor the frame
+                         was created with; if there is none, a temporary pool of processes is used.
+        :param cache: If True - results are stored in (and taken from) `dionpy.raytracing.raytrace_cache`, so repeated
+                      calls with the same frame data and parameters are not traced again. A custom
+                      :class:`~dionpy.ResultCache` can be passed instead, e.g. one with a disk store. The cache hashes
+                      the frame data on every call and returns copies of the results; it is not used by default.
+        :returns: (refraction, attenuation, emission)
+        """
+        return self.__call__(alt, az, freq, col_freq, troposphere, height_profile, backend=backend,
+                             parallel=parallel, executor=executor, cache=cache, _pool=_pool)
+
+    async def araytrace(self, alt: float | np.ndarray, az: float | np.ndarray, freq: float | np.ndarray,
+                        limit: asyncio.Semaphore | None = None, **kwargs) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Awaitable version of :func:`raytrace`, which does not block the event loop. Keyword arguments are passed to
+        :func:`raytrace`. Raytracing already in progress is finished before the awaiting task is cancelled.
+
+        :param limit: A semaphore limiting the number of concurrent calculations (see :func:`acalc`).
         :returns: (refraction, attenuation, emission)
         """
-        return self.__call__(alt, az, freq, col_freq, troposphere, height_profile, _pool)
+        kwargs.setdefault("executor", self.executor or default_executor())
+        return await run_cancellable(lambda cancel: self.raytrace(alt, az, freq, **kwargs), limit)
 
     # def radec2altaz(self, ra: float | np.ndarray, dec: float | np.ndarray):
     #     """
@@ -432,8 +630,10 @@ class IonFrame:
     #     aa_coord = skycoord.transform_to(altaz_cs)
     #     return aa_coord.alt.value, aa_coord.az.value
 
-    def write_self_to_file(self, file: h5py.File):
+    def write_self_to_file(self, file: h5py.File, compression: str | None = None):
         h5dir = f"{self.dt.year:04d}{self.dt.month:02d}{self.dt.day:02d}{self.dt.hour:02d}{self.dt.minute:02d}"
+        if h5dir in file:
+            del file[h5dir]
         grp = file.create_group(h5dir)
         meta = grp.create_dataset("meta", shape=(0,))
         meta.attrs["dt"] = self.dt.strftime("%Y-%m-%d %H:%M")
@@ -446,20 +646,23 @@ class IonFrame:
         meta.attrs["nlayers"] = self.nlayers
         meta.attrs["htop"] = self.htop
         meta.attrs["hbot"] = self.hbot
-        grp.create_dataset("edens", data=self.edens)
-        grp.create_dataset("etemp", data=self.etemp)
+        for key in ("edens", "etemp"):
+            data = np.asarray(getattr(self, key), dtype=np.float32)
+            grp.create_dataset(key, data=data, **frame_dataset_options(data.shape, compression))
 
-    def save(self, saveto: str = "./ionframe"):
+    def save(self, saveto: str = "./ionframe", compression: str | None = None):
         """
-        Save the model to HDF file.
+        Save the model to HDF file. Data is stored in float32 chunks, which allows reading single layers or
+        pixels without reading the whole frame (see `lazy` in :func:`load`).
 
         :param saveto: Path and name of the file.
+        :param compression: Compression of the data: "gzip", "lzf" or None.
         """
         with open_save_file(saveto) as file:
-            self.write_self_to_file(file)
+            self.write_self_to_file(file, compression)
 
     @classmethod
-    def read_self_from_file(cls, grp: h5py.Group):
+    def read_self_from_file(cls, grp: h5py.Group, lazy: bool = False):
         meta = grp.get("meta")
         meta_attrs = dict(meta.attrs)
         del meta_attrs['dt']
@@ -469,21 +672,29 @@ class IonFrame:
             dt=datetime.strptime(meta.attrs["dt"], "%Y-%m-%d %H:%M"),
             **meta_attrs
         )
-        obj.edens = none_or_array(grp.get("edens"))
-        obj.etemp = none_or_array(grp.get("etemp"))
+        if lazy:
+            obj.edens = grp.get("edens")
+            obj.etemp = grp.get("etemp")
+        else:
+            obj.edens = none_or_array(grp.get("edens"))
+            obj.etemp = none_or_array(grp.get("etemp"))
         return obj
 
     @classmethod
-    def load(cls, path: str):
+    def load(cls, path: str, lazy: bool = False):
         """
         Load a model from file.
 
         :param path: Path to a file (file extension is not required).
+        :param lazy: If True - electron density and temperature are not read into memory. The frame holds the
+                     datasets of the file instead, which are read only in parts accessed by calculations (e.g. a
+                     single layer in :func:`ed`). The file stays open while the frame exists.
         :return: :class:`IonModel` recovered from a file.
         """
         if not path.endswith(".h5"):
             path += ".h5"
-        with h5py.File(path, mode="r") as file:
+        file = h5py.File(path, mode="r")
+        try:
             groups = list(file.keys())
             if len(groups) > 1:
                 raise RuntimeError(
@@ -492,7 +703,12 @@ class IonFrame:
                 )
 
             grp = file[groups[0]]
-            obj = cls.read_self_from_file(grp)
+            obj = cls.read_self_from_file(grp, lazy)
+        except BaseException:
+            file.close()
+            raise
+        if not lazy:
+            file.close()
         return obj
 
     def plot_ed(self, gridsize: int = 200, layer: int | None = None, cmap='plasma', **kwargs):
@@ -576,7 +792,7 @@ class IonFrame:
         :return: A matplotlib figure.
         """
         alt, az = altaz_mesh(gridsize)
-        _, atten, _ = self(alt, az, freq, troposphere=troposphere)
+        _, atten, _ = self(alt, az, freq, troposphere=troposphere, cache=True)
         cblim = cblim or [None, 1]
         return polar_plot(
             (np.deg2rad(az), 90 - alt, atten),
@@ -602,7 +818,7 @@ class IonFrame:
         :return: A matplotlib figure.
         """
         alt, az = altaz_mesh(gridsize)
-        _, _, emiss = self(alt, az, freq, troposphere=troposphere)
+        _, _, emiss = self(alt, az, freq, troposphere=troposphere, cache=True)
         cblim = cblim or [0, None]
         barlabel = r"$K$"
         return polar_plot(
@@ -637,7 +853,7 @@ class IonFrame:
         """
         cblim = cblim or [0, None]
         alt, az = altaz_mesh(gridsize)
-        refr, _, _ = self(alt, az, freq, troposphere=troposphere)
+        refr, _, _ = self(alt, az, freq, troposphere=troposphere, cache=True)
         barlabel = r"$deg$"
         return polar_plot(
             (np.deg2rad(az), 90 - alt, refr),
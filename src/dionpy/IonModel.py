@@ -1,28 +1,42 @@
 from __future__ import annotations
 
-import multiprocessing as mp
+import asyncio
+import contextlib
+import itertools
 import os
 import shutil
 import tempfile
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from multiprocessing import Pool, cpu_count
-from typing import List, Sequence, Literal
+from typing import Iterator, List, Sequence, Literal, Tuple
 
 import numpy as np
+from iricore.iri import indices_uptodate
 from numpy import ndarray
+from scipy.interpolate import PchipInterpolator
 from tqdm import tqdm
 
 from .IonFrame import IonFrame
-from .modules.helpers import altaz_mesh, pic2vid, open_save_file
-from .modules.parallel import interp_val
+from .executor import IonExecutor, nworkers, pool_context
+from .modules.aio import default_executor, run_cancellable
+from .modules.cache import ProfileCache
+from .modules.lazy_frames import LazyFrames
+from .modules.parallel import SharedBlock
+from .modules.helpers import altaz_mesh, check_elaz_shape, pic2vid, open_save_file
 from .modules.plotting import polar_plot
+from .modules.scheduler import calc_frames, iter_calc_frames
 
+INTERP_KINDS = ("linear", "pchip")
 
 
 class IonModel:
     """
     A dynamic model of the ionosphere. Uses a sequence of :class:`IonFrame` objects to
-    interpolate ionospheric refraction and attenuation in the specified time range.
+    interpolate ionospheric refraction and attenuation in the specified time range. Electron density and
+    temperature of all frames are stored in stacked arrays of shape (ntime, npixels, nlayers) (see :attr:`edens`
+    and :attr:`etemp`); the frames are views of these arrays sharing the same geometry.
 
     :param dt_start: Start date/time of the model.
     :param dt_end: End date/time of the model.
@@ -39,6 +53,21 @@ class IonModel:
                     to IRI-2020.
     :param echaim: Use ECHAIM model for electron density estimation.
     :param autocalc: If True - the model will be calculated immediately after definition.
+    :param executor: An :class:`IonExecutor` whose workers are used for calculations instead of a temporary
+                     pool of processes. It is also passed to all frames of the model.
+    :param profile_cache: A :class:`~dionpy.ProfileCache` to read IRI/E-CHAIM profiles from, and store newly
+                          calculated ones to.
+    :param lazy: If True - frames are calculated only when they are accessed (e.g. by :func:`at`), regardless of
+                 `autocalc`, and only `max_memory` bytes of them are kept in memory. Evicted frames are restored from
+                 the profile cache; if none is given, a temporary one is created on disk and removed with the model.
+    :param max_memory: Memory budget for frames of a lazy model in bytes. If None - not limited.
+    :param prefetch: Number of frames a lazy model calculates ahead in the background when frames are accessed
+                     sequentially in time.
+    :param tolerance: If specified - the time grid is refined adaptively: frames are added in the middle of
+                      intervals where linear interpolation of electron density deviates from the calculated value by
+                      more than `tolerance` (relative to the maximum density of the frame).
+    :param min_mpf: The smallest interval between frames in minutes allowed by the adaptive refinement.
+    :param interp: Interpolation in time used by :func:`at`: "linear" or "pchip" (monotone cubic).
     """
 
     def __init__(
@@ -55,18 +84,30 @@ class IonModel:
             iriversion: Literal[16, 20] = 20,
             echaim: bool = False,
             autocalc: bool = True,
+            executor: IonExecutor | None = None,
+            profile_cache: ProfileCache | None = None,
+            lazy: bool = False,
+            max_memory: int | None = None,
+            prefetch: int = 2,
+            tolerance: float | None = None,
+            min_mpf: int = 1,
+            interp: Literal["linear", "pchip"] = "linear",
     ):
         if not isinstance(dt_start, datetime) or not isinstance(dt_end, datetime):
             raise ValueError("Parameters dt_start and dt_end must be datetime objects.")
+        if interp not in INTERP_KINDS:
+            raise ValueError(f"The interp parameter must be one of {INTERP_KINDS}.")
+        if lazy and tolerance is not None:
+            raise ValueError("Adaptive refinement of the time grid is not supported by lazy models.")
 
         self.dt_start = dt_start
         self.dt_end = dt_end
         nhours = (dt_end - dt_start).total_seconds() / 3600
         nmodels = int(nhours * 60 / mpf)
         tdelta = timedelta(hours=nhours / nmodels)
-        self._dts = np.asarray(
+        self._set_dts(np.asarray(
             [dt_start + tdelta * i for i in range(nmodels + 1)]
-        ).astype(datetime)
+        ).astype(datetime))
 
         self.hbot = hbot
         self.htop = htop
@@ -78,29 +119,171 @@ class IonModel:
         self.mpf = mpf
         self.nside = nside
         self.iriversion = iriversion
+        self.executor = executor
+        self.profile_cache = profile_cache
+        self.interp_kind = interp
+        self.tolerance = tolerance
+        self.min_mpf = min_mpf
         self.frames = []
+        self._template = None
+        self._edens = None
+        self._etemp = None
+        self._shared = {}
+
+        if lazy:
+            # Lazy frames are calculated on access, whether or not `autocalc` is set
+            if profile_cache is None:
+                tmpdir = tempfile.mkdtemp(prefix="dionpy-")
+                self._tmpdir_finalizer = weakref.finalize(self, shutil.rmtree, tmpdir, ignore_errors=True)
+                self.profile_cache = ProfileCache(os.path.join(tmpdir, "profiles.h5"))
+            self.frames = LazyFrames(self._dts, self._empty_frame, executor, maxbytes=max_memory, prefetch=prefetch)
+        elif autocalc:
+            self.calc()
+
+    def calc(self, executor: IonExecutor | None = None, progress: bool = True, _cancel: threading.Event | None = None):
+        """
+        Calculates all frames of the model in memory (called on creation if `autocalc` is True).
 
-        if autocalc:
-            nproc = np.min([cpu_count(), nmodels])
-            pool = mp.get_context('fork').Pool(processes=nproc)
-
-            for dt in tqdm(self._dts, desc="Calculating time frames"):
-                self.frames.append(
-                    IonFrame(
-                        dt=dt,
-                        position=position,
-                        nside=nside,
-                        hbot=hbot,
-                        htop=htop,
-                        nlayers=nlayers,
-                        rdeg_offset=rdeg_offset,
-                        iriversion=iriversion,
-                        echaim=echaim,
-                        autocalc=autocalc,
-                        _pool=pool,
-                    )
-                )
-            pool.close()
+        :param executor: An :class:`IonExecutor` to run the calculation in. Defaults to the executor of the model.
+        :param progress: If True - displays a progress bar.
+        """
+        executor = executor or self.executor
+        if self._lazy:
+            raise RuntimeError("Frames of a lazy model are calculated on access.")
+        self._alloc_stack(len(self._dts))
+        self.frames = [self.template._view(dt, self._edens[i], self._etemp[i]) for i, dt in enumerate(self._dts)]
+        # Batches of all frames go to a single queue, so workers are not idle between frames
+        calc_frames(self.frames, executor, progress=progress, desc="Calculating time frames", _cancel=_cancel)
+        if self.tolerance is not None:
+            self._refine(self.tolerance, self.min_mpf, executor, progress, _cancel)
+
+    async def acalc(self, limit: asyncio.Semaphore | None = None):
+        """
+        Awaitable version of :func:`calc` for models created with ``autocalc=False``, which does not block the event
+        loop. Cancelling the awaiting task stops the calculation.
+
+        :param limit: A semaphore limiting the number of concurrent calculations, e.g. shared by many models.
+                      Defaults to a limit of ``dionpy.modules.aio.DEFAULT_LIMIT`` calculations per event loop.
+        """
+        executor = self.executor or default_executor()
+        await run_cancellable(lambda cancel: self.calc(executor, progress=False, _cancel=cancel), limit)
+
+    @property
+    def template(self) -> IonFrame:
+        """
+        An uncalculated frame holding the geometry shared by all frames of the model.
+        """
+        if self._template is None:
+            self._template = IonFrame(
+                dt=self._dts[0],
+                position=self.position,
+                nside=self.nside,
+                hbot=self.hbot,
+                htop=self.htop,
+                nlayers=self.nlayers,
+                rdeg_offset=self.rdeg_offset,
+                iriversion=self.iriversion,
+                echaim=self.echaim,
+                autocalc=False,
+                executor=self.executor,
+                profile_cache=self.profile_cache,
+            )
+            # Frames check IRI indices only when calculated; the end of the model covers all of them
+            indices_uptodate(self._dts[-1])
+        return self._template
+
+    def _empty_frame(self, dt: datetime) -> IonFrame:
+        """
+        Creates a frame of the model without calculating it.
+        """
+        shape = (len(self.template._obs_pixels), self.nlayers)
+        return self.template._view(dt, np.zeros(shape, dtype=np.float32), np.zeros(shape, dtype=np.float32))
+
+    def _alloc_stack(self, ntime: int):
+        shape = (ntime, len(self.template._obs_pixels), self.nlayers)
+        self._shared = {}
+        self._edens = np.zeros(shape, dtype=np.float32)
+        self._etemp = np.zeros(shape, dtype=np.float32)
+
+    def _init_stack(self, frames: Sequence[IonFrame]):
+        """
+        Copies data of the given frames to the stacked arrays and replaces the frames with views sharing the
+        geometry of the first of them. The time grid of the model is set to the times of the frames.
+        """
+        self._set_dts(np.asarray([frame.dt for frame in frames]).astype(datetime))
+        self._template = frames[0]._view(frames[0].dt, None, None)
+        # Shared blocks of the old stack are released when no copy of the model refers to them
+        self._shared = {}
+        self._edens = np.stack([frame.edens for frame in frames]).astype(np.float32, copy=False)
+        self._etemp = np.stack([frame.etemp for frame in frames]).astype(np.float32, copy=False)
+        self.frames = [self._template._view(frame.dt, self._edens[i], self._etemp[i])
+                       for i, frame in enumerate(frames)]
+
+    def _share(self) -> Tuple[tuple, tuple]:
+        """
+        Moves the stacked electron density and temperature to shared memory on the first call, so that workers of
+        all later raytracing calls read them without copying. Frames of the model are replaced by views of the shared
+        data, which stays there until the stack is replaced or the model is deleted.
+
+        :return: Specs of the (edens, etemp) shared blocks.
+        """
+        if not self._shared:
+            for key in ("edens", "etemp"):
+                block = self._shared[key] = SharedBlock.from_array(getattr(self, "_" + key))
+                setattr(self, "_" + key, block.array)
+            self.frames = [self.template._view(frame.dt, self._edens[i], self._etemp[i])
+                           for i, frame in enumerate(self.frames)]
+        return self._shared["edens"].spec, self._shared["etemp"].spec
+
+    def _refine(self, tolerance: float, min_mpf: int, executor: IonExecutor | None = None, progress: bool = True,
+                _cancel: threading.Event | None = None):
+        """
+        Adds frames in the middle of intervals where the linear interpolation error exceeds `tolerance`, until the
+        error is below it everywhere or intervals reach `min_mpf` minutes.
+        """
+        frames = {frame.dt: frame for frame in self.frames}
+        intervals = list(zip(self._dts[:-1], self._dts[1:]))
+        while intervals:
+            # Middle points are rounded to whole minutes, as frames are saved with the precision of a minute
+            halves = [round((dt2 - dt1).total_seconds() / 120) for dt1, dt2 in intervals]
+            intervals = [(dt1, dt2, dt1 + timedelta(minutes=half))
+                         for (dt1, dt2), half in zip(intervals, halves) if half >= max(min_mpf, 1)]
+            new = [self._empty_frame(mid) for _, _, mid in intervals]
+            calc_frames(new, executor, progress=progress, desc="Refining time frames", _cancel=_cancel)
+            refine = []
+            for (dt1, dt2, mid), frame in zip(intervals, new):
+                frames[mid] = frame
+                w = np.float32((mid - dt1) / (dt2 - dt1))
+                lerp = frames[dt1].edens + w * (frames[dt2].edens - frames[dt1].edens)
+                scale = np.max(np.abs(frame.edens))
+                if scale > 0 and np.max(np.abs(frame.edens - lerp)) > tolerance * scale:
+                    refine += [(dt1, mid), (mid, dt2)]
+            intervals = refine
+        self._init_stack([frames[dt] for dt in sorted(frames)])
+
+    @property
+    def _lazy(self) -> bool:
+        # Frames are calculated on demand or read from a file on access
+        return isinstance(self.frames, LazyFrames) or (self._edens is None and len(self.frames) > 0)
+
+    def _stack(self, key: str) -> np.ndarray:
+        if self._lazy:
+            raise RuntimeError("Stacked data is not available in a lazy model; access frames instead.")
+        return getattr(self, key)
+
+    @property
+    def edens(self) -> np.ndarray:
+        """
+        Electron density in [m^-3] of all frames, an array of shape (ntime, npixels, nlayers).
+        """
+        return self._stack("_edens")
+
+    @property
+    def etemp(self) -> np.ndarray:
+        """
+        Electron temperature in [K] of all frames, an array of shape (ntime, npixels, nlayers).
+        """
+        return self._stack("_etemp")
 
     def __str__(self):
         frame_str = str(self.frames[0])
@@ -114,80 +297,377 @@ class IonModel:
                 "" + frame_str
         )
 
-    def at(self, dt: datetime, recalc: bool = False) -> IonFrame:
+    def at(self, dt: datetime, recalc: bool = False, kind: str | None = None) -> IonFrame:
         """
         :param dt: Date/time of the frame.
         :param recalc: If True - the :class:`IonFrame` object will be precisely calculated. If False - an interpolation
                        of two closest frames will be used.
+        :param kind: Interpolation in time: "linear" or "pchip". If None - the `interp` parameter of the model is
+                     used.
         :return: :class:`IonFrame` at specified time.
         """
-        if dt in self._dts:
-            idx = np.argwhere(self._dts == dt)
-            return self.frames[idx[0][0]]
-        frame_dict = self.frames[0].get_init_dict()
-        del frame_dict['dt']
-        del frame_dict['autocalc']
-        obj = IonFrame(
-            dt=dt,
-            **frame_dict,
-            autocalc=recalc,
-        )
         if recalc:
-            return obj
-        else:
-            idx = self._lr_ind(dt)
-            obj.edens = interp_val(
-                self.frames[idx[0]].edens,
-                self.frames[idx[1]].edens,
-                self._dts[idx[0]],
-                self._dts[idx[1]],
-                dt,
-            )
-            obj.etemp = interp_val(
-                self.frames[idx[0]].etemp,
-                self.frames[idx[1]].etemp,
-                self._dts[idx[0]],
-                self._dts[idx[1]],
-                dt,
-            )
-            return obj
+            frame = self._empty_frame(dt)
+            frame.calc()
+            return frame
+        return self.at_many([dt], kind)[0]
 
-    def save(self, saveto: str = "./ionmodel"):
+    async def aat(self, dt: datetime, recalc: bool = False, kind: str | None = None,
+                  limit: asyncio.Semaphore | None = None) -> IonFrame:
+        """
+        Awaitable version of :func:`at`, which does not block the event loop. Cancelling the awaiting task stops the
+        calculation of a frame with ``recalc=True``.
+
+        :param limit: A semaphore limiting the number of concurrent calculations (see :func:`acalc`).
+        """
+        if recalc:
+            frame = self._empty_frame(dt)
+            await frame.acalc(limit=limit)
+            return frame
+        return await run_cancellable(lambda cancel: self.at(dt, kind=kind), limit)
+
+    def at_many(self, dts: Sequence[datetime], kind: str | None = None) -> List[IonFrame]:
+        """
+        Interpolates the model at many times at once (see :func:`interp`).
+
+        :param dts: Dates/times of the frames.
+        :param kind: Interpolation in time: "linear" or "pchip". If None - the `interp` parameter of the model is
+                     used.
+        :return: List of :class:`IonFrame` objects sharing the geometry of the model. Frames at the times of stored
+                 frames are the stored frames themselves.
+        """
+        idx, weights = self._interp_weights(dts)
+        edens, etemp = self._interp_data(idx, weights, kind)
+        frames = []
+        for k, (dt, i, w) in enumerate(zip(dts, idx, weights)):
+            if w == 0 or w == 1:
+                frames.append(self.frames[i + int(w)])
+            else:
+                frames.append(self.template._view(dt, edens[k], etemp[k]))
+        return frames
+
+    def interp(self, dts: Sequence[datetime], kind: str | None = None) -> Tuple[ndarray, ndarray]:
+        """
+        Interpolation of electron density and temperature of the model in time.
+
+        :param dts: Dates/times to interpolate at.
+        :param kind: Interpolation in time: "linear" or "pchip" (monotone cubic, does not overshoot the data). If
+                     None - the `interp` parameter of the model is used.
+        :return: Electron density and temperature, arrays of shape (len(dts), npixels, nlayers).
+        """
+        return self._interp_data(*self._interp_weights(dts), kind)
+
+    def iter_frames(self, lookahead: int = 2, progress: bool = False) -> Iterator[IonFrame]:
+        """
+        Yields frames of the model in time order. If the model was created with ``autocalc=False``, frames are
+        calculated on the fly: each frame is yielded as soon as its profiles are ready, while up to `lookahead`
+        next frames are being calculated. Such frames are not stored in the model, so memory use does not grow
+        with the number of frames.
+
+        :param lookahead: Maximum number of frames calculated ahead of the consumer.
+        :param progress: If True - displays a progress bar of calculated profiles.
+        """
+        if len(self.frames) > 0:
+            yield from self.frames
+            return
+        total = len(self._dts) * len(self.template._obs_pixels) * (1 + self.echaim)
+        yield from iter_calc_frames((self._empty_frame(dt) for dt in self._dts), self.executor, progress,
+                                    desc="Calculating time frames", lookahead=lookahead, total=total)
+
+    def _set_dts(self, dts: ndarray):
+        self._dts = dts
+        # Numeric time axis in seconds from the start of the model
+        self._ts = self._seconds(dts)
+
+    def _seconds(self, dts: Sequence[datetime]) -> ndarray:
+        dts = np.asarray(dts, dtype="datetime64[us]")
+        return (dts - np.datetime64(self.dt_start, "us")) / np.timedelta64(1, "s")
+
+    def _interp_weights(self, dts: Sequence[datetime]) -> Tuple[ndarray, ndarray]:
+        """
+        Calculates indices of frames on the left of specified dates and interpolation weights of the frames on the
+        right of them, using the numeric time axis of the model.
+        """
+        ts = self._seconds(dts)
+        if np.any(ts < 0) or np.any(ts > self._seconds([self.dt_end])[0]):
+            raise ValueError(
+                f"Datetime must be within precalculated range "
+                f"{str(self.dt_start)} - {str(self.dt_end)}."
+            )
+        ts = np.clip(ts, self._ts[0], self._ts[-1])
+        idx = np.clip(np.searchsorted(self._ts, ts, side="right") - 1, 0, max(len(self._ts) - 2, 0))
+        span = np.diff(self._ts)[idx] if len(self._ts) > 1 else np.ones_like(ts)
+        return idx, (ts - self._ts[idx]) / span
+
+    def _rows(self, key: str, idx: ndarray) -> ndarray:
+        if self._lazy:
+            return np.stack([np.asarray(getattr(self.frames[i], key)) for i in idx])
+        return getattr(self, key)[idx]
+
+    def _interp_data(self, idx: ndarray, weights: ndarray, kind: str | None = None) -> Tuple[ndarray, ndarray]:
+        kind = kind or self.interp_kind
+        if kind not in INTERP_KINDS:
+            raise ValueError(f"The kind parameter must be one of {INTERP_KINDS}.")
+        if kind == "pchip" and len(self._ts) > 2:
+            return self._pchip(idx, weights)
+        right = np.minimum(idx + 1, len(self._ts) - 1)
+        w = weights.astype(np.float32)[:, None, None]
+        res = []
+        for key in ("edens", "etemp"):
+            lo = self._rows(key, idx)
+            # Frames on the right are not needed (and not calculated in lazy models) at exact frame times
+            hi = self._rows(key, np.where(weights > 0, right, idx))
+            res.append(lo + w * (hi - lo))
+        return tuple(res)
+
+    def _pchip(self, idx: ndarray, weights: ndarray) -> Tuple[ndarray, ndarray]:
         """
-        Save the model to a file.
+        Monotone cubic interpolation. Derivatives at a frame depend only on its neighbours, so the interpolant in an
+        interval is built from at most four frames around it.
+        """
+        n = len(self._ts)
+        ts = self._ts[idx] + weights * np.diff(self._ts)[idx]
+        shape = (len(idx), len(self.template._obs_pixels), self.nlayers)
+        res = np.empty(shape, dtype=np.float32), np.empty(shape, dtype=np.float32)
+        for i in np.unique(idx):
+            window = np.arange(max(i - 1, 0), min(i + 3, n))
+            queries = np.flatnonzero(idx == i)
+            for out, key in zip(res, ("edens", "etemp")):
+                out[queries] = PchipInterpolator(self._ts[window], self._rows(key, window), axis=0)(ts[queries])
+        return res
+
+    def raytrace(
+            self,
+            dts: Sequence[datetime] | None,
+            alt: float | np.ndarray,
+            az: float | np.ndarray,
+            freq: float | np.ndarray,
+            col_freq: str = "default",
+            troposphere: bool = True,
+            height_profile: bool = False,
+            backend: str = "numpy",
+            interp_results: bool = False,
+            executor: IonExecutor | None = None,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Raytracing through the model at many times. Data of all times is moved to shared memory once, and a single
+        pool of processes traces chunks of directions at all times. See :func:`IonFrame.raytrace` for the description
+        of raytracing parameters.
+
+        :param dts: Dates/times of observation. If None - times of the frames of the model are used.
+        :param alt: Altitude (elevation) of observation in [deg].
+        :param az: Azimuth of observation in [deg].
+        :param freq: Frequency of observation in [MHz].
+        :param col_freq: Model of collision frequency.
+        :param troposphere: Where to include the tropospheric refraction effect.
+        :param height_profile: If True, returns arrays of attenuation and emission before integration and a cumulative
+                               history of refraction.
+        :param backend: Implementation of the raytracing procedure: "numpy" or "numba".
+        :param interp_results: If True - raytracing is performed only at times of the frames around `dts`, and the
+                               results are linearly interpolated in time instead of the electron density and
+                               temperature.
+        :param executor: An :class:`IonExecutor` to run the "numpy" backend in. Defaults to the executor of the
+                         model; if there is none, a temporary pool of processes is used.
+        :returns: (refraction, attenuation, emission) with a leading time axis: (ntime, ...).
+        """
+        from .raytracing import resolve_backend
+        backend = resolve_backend(backend)
+        check_elaz_shape(alt, az)
+        dts = self._dts if dts is None else dts
+        idx, weights = self._interp_weights(dts)
+        if not interp_results:
+            if not self._lazy and np.all(np.isin(weights, (0, 1))):
+                # All times are on the grid of frames, whose data is traced directly
+                return self._raytrace_stack(None, idx + weights.astype(int), alt, az, freq, col_freq, troposphere,
+                                            height_profile, backend, executor)
+            data = self._interp_data(idx, weights)
+            return self._raytrace_stack(data, np.arange(len(dts)), alt, az, freq, col_freq, troposphere,
+                                        height_profile, backend, executor)
+
+        right = np.minimum(idx + 1, len(self._ts) - 1)
+        # Only frames with nonzero weights are traced
+        times, inv = np.unique(np.concatenate([idx, np.where(weights > 0, right, idx)]), return_inverse=True)
+        if self._lazy:
+            data, rows = (self._rows("edens", times), self._rows("etemp", times)), np.arange(len(times))
+        else:
+            data, rows = None, times
+        res = self._raytrace_stack(data, rows, alt, az, freq, col_freq, troposphere, height_profile, backend,
+                                   executor)
+        lo, hi = inv[:len(idx)], inv[len(idx):]
+        w = weights.reshape(-1, *([1] * (res[0].ndim - 1)))
+        return tuple(x[lo] + w * (x[hi] - x[lo]) for x in res)
+
+    def _raytrace_stack(self, data, rows, alt, az, freq, col_freq, troposphere, height_profile, backend, executor):
+        """
+        Raytracing of stacked (ntime, npixels, nlayers) data: the given `rows` of the (edens, etemp) arrays in `data`,
+        or of the model itself if `data` is None. Data of the model is moved to shared memory once and kept there
+        for later calls; other data is copied to temporary shared blocks.
+        """
+        from .raytracing import INPROCESS_MAX_RAYS, raytrace_frame, raytrace_stack_star
+        shape = np.shape(alt)
+        b_alt = np.ravel(alt).astype(np.float64)
+        b_az = np.ravel(az).astype(np.float64)
+        b_freq = np.atleast_1d(freq)
+        ntime, nrays = len(rows), len(b_alt)
+        out_shape = (3, ntime, len(b_freq), nrays) + ((self.nlayers,) if height_profile else ())
+
+        if backend == "numba" or ntime * nrays * len(b_freq) <= INPROCESS_MAX_RAYS:
+            # Compiled kernels are parallel over rays, and small requests are traced faster here than by workers
+            edens, etemp = (self._edens, self._etemp) if data is None else data
+            out = np.empty(out_shape)
+            for t, row in enumerate(rows):
+                frame = self.template._view(self.template.dt, edens[row], etemp[row])
+                out[:, t] = raytrace_frame(frame, b_alt, b_az, b_freq, col_freq, troposphere, height_profile, backend)
+            res = tuple(out)
+        else:
+            executor = executor or self.executor
+            workers = nworkers(executor)
+            # Rays are split only as much as needed to give every worker two tasks
+            nchunks = int(min(nrays, max(1, np.ceil(2 * workers / ntime))))
+            chunks = np.array_split(np.arange(nrays), nchunks)
+            init_dict = self.template.get_init_dict()
+            with contextlib.ExitStack() as stack:
+                if data is None:
+                    data_specs = self._share()
+                else:
+                    data_specs = tuple(stack.enter_context(SharedBlock.from_array(np.asarray(x, dtype=np.float32)))
+                                       .spec for x in data)
+                out = stack.enter_context(SharedBlock(out_shape, np.float64))
+                tasks = [
+                    (init_dict, data_specs, out.spec, t, int(rows[t]), chunk[0], b_alt[chunk], b_az[chunk], b_freq,
+                     col_freq, troposphere, height_profile, backend)
+                    for t, chunk in itertools.product(range(ntime), chunks)
+                ]
+                with pool_context(executor, nproc=min(workers, len(tasks))) as pool:
+                    list(pool.imap_unordered(raytrace_stack_star, tasks))
+                # The results are views of the block, which stays mapped until they are deleted
+                res = tuple(out.array)
+
+        tail = (self.nlayers,) if height_profile else ()
+        res = tuple(x.reshape(ntime, len(b_freq), *shape, *tail) for x in res)
+        if np.ndim(freq) == 0:
+            return tuple(x[:, 0] for x in res)
+        return res
+
+    def save(self, saveto: str = "./ionmodel", compression: str | None = None):
+        """
+        Save the model to a file. Data of frames is stored in float32 chunks, which allows reading single layers or
+        frames without reading the whole model (see `lazy` in :func:`load`).
 
         :param saveto: Path to directory with name to save the model.
+        :param compression: Compression of the data: "gzip", "lzf" or None.
         """
         with open_save_file(saveto) as file:
-            meta = file.create_dataset("meta", shape=(0,))
-            meta.attrs["position"] = self.position
-            meta.attrs["dt_start"] = self.dt_start.strftime("%Y-%m-%d %H:%M")
-            meta.attrs["dt_end"] = self.dt_end.strftime("%Y-%m-%d %H:%M")
-            meta.attrs["nside"] = self.nside
-            meta.attrs["mpf"] = self.mpf
-            meta.attrs["hbot"] = self.hbot
-            meta.attrs["htop"] = self.htop
-            meta.attrs["nlayers"] = self.nlayers
-            meta.attrs["rdeg_offset"] = self.rdeg_offset
-            meta.attrs["iriversion"] = self.iriversion
-            meta.attrs["echaim"] = self.echaim
-
+            self._write_meta(file, self.dt_end)
             for model in self.frames:
-                model.write_self_to_file(file)
+                model.write_self_to_file(file, compression)
+
+    def _write_meta(self, file, dt_end: datetime):
+        meta = file.create_dataset("meta", shape=(0,))
+        meta.attrs["position"] = self.position
+        meta.attrs["dt_start"] = self.dt_start.strftime("%Y-%m-%d %H:%M")
+        meta.attrs["dt_end"] = dt_end.strftime("%Y-%m-%d %H:%M")
+        meta.attrs["nside"] = self.nside
+        meta.attrs["mpf"] = self.mpf
+        meta.attrs["hbot"] = self.hbot
+        meta.attrs["htop"] = self.htop
+        meta.attrs["nlayers"] = self.nlayers
+        meta.attrs["rdeg_offset"] = self.rdeg_offset
+        meta.attrs["iriversion"] = self.iriversion
+        meta.attrs["echaim"] = self.echaim
+
+    def _check_meta(self, attrs, what: str):
+        for name in ("position", "nside", "hbot", "htop", "nlayers", "rdeg_offset", "iriversion", "echaim"):
+            if not np.array_equal(attrs[name], getattr(self, name)):
+                raise RuntimeError(f"The {what} does not match the model: different {name}.")
+
+    @staticmethod
+    def _last_saved(file) -> datetime | None:
+        """
+        Returns the time of the last frame of a model file within the end of the model saved in the file.
+        """
+        dt_end = datetime.strptime(file["meta"].attrs["dt_end"], "%Y-%m-%d %H:%M")
+        stored = [datetime.strptime(file[group]["meta"].attrs["dt"], "%Y-%m-%d %H:%M")
+                  for group in file if group != "meta"]
+        stored = [dt for dt in stored if dt <= dt_end]
+        return max(stored) if stored else None
+
+    def _stream_to_file(self, file, compression: str | None, lookahead: int, progress: bool) -> int:
+        """
+        Calculates frames at the times of the model and writes each of them to the file as soon as it is ready.
+        The end of the model in the file is moved to every written frame, which makes it a checkpoint.
+        """
+        nframes = 0
+        if len(self._dts) == 0:
+            return nframes
+        for frame in self.iter_frames(lookahead, progress):
+            frame.write_self_to_file(file, compression)
+            file.flush()
+            file["meta"].attrs["dt_end"] = frame.dt.strftime("%Y-%m-%d %H:%M")
+            file.flush()
+            nframes += 1
+        return nframes
+
+    def calc_to_file(self, saveto: str = "./ionmodel", compression: str | None = None, lookahead: int = 2,
+                     progress: bool = True) -> int:
+        """
+        Calculates a model created with ``autocalc=False`` directly to a file: each frame is written as soon as it is
+        calculated and becomes a checkpoint. If the file already exists, the calculation is resumed after the last
+        written frame; the file must be of a model with the same parameters and time grid (`dt_start` and `mpf`).
+        Frames are not kept in memory.
+
+        :param saveto: Path to directory with name to save the model.
+        :param compression: Compression of the data: "gzip", "lzf" or None.
+        :param lookahead: Maximum number of frames calculated ahead of writing.
+        :param progress: If True - displays a progress bar of calculated profiles.
+        :return: Number of frames written.
+        """
+        import h5py
+
+        if len(self.frames) > 0:
+            raise RuntimeError("The model is already calculated; use save() instead.")
+        path = saveto if saveto.endswith(".h5") else saveto + ".h5"
+        if os.path.exists(path):
+            with h5py.File(path, mode="r") as file:
+                meta = file["meta"].attrs
+                self._check_meta(meta, "file")
+                # Frames are appended only on the time grid of the file
+                grid = {"mpf": self.mpf, "dt_start": self.dt_start.strftime("%Y-%m-%d %H:%M")}
+                for name, value in grid.items():
+                    if meta[name] != value:
+                        raise RuntimeError(f"The file does not match the model: different {name}.")
+                last = self._last_saved(file)
+        else:
+            with open_save_file(saveto) as file:
+                # No frames are written yet
+                self._write_meta(file, self.dt_start)
+            last = None
+        if last is not None:
+            self._set_dts(np.asarray([dt for dt in self._dts if dt > last]).astype(datetime))
+        with h5py.File(path, mode="r+") as file:
+            nframes = self._stream_to_file(file, compression, lookahead, progress)
+            file["meta"].attrs["dt_end"] = self.dt_end.strftime("%Y-%m-%d %H:%M")
+        return nframes
 
     @classmethod
-    def load(cls, path: str) -> "IonModel":
+    def load(cls, path: str, lazy: bool = False, workers: int | None = None) -> "IonModel":
         """
         Load a model from file.
 
         :param path: Path to a file (file extension is not required).
+        :param lazy: If True - data of frames is not read into memory. Frames hold the datasets of the file instead,
+                     which are read only in parts accessed by calculations (e.g. frames around the time in
+                     :func:`at`). Stacked arrays (:attr:`edens`, :attr:`etemp`) are not available in this case. The
+                     file stays open while the model exists.
+        :param workers: Number of threads reading frames. If None - up to 8 threads are used.
         :return: :class:`IonModel` recovered from a file.
         """
         import h5py
 
         if not path.endswith(".h5"):
             path += ".h5"
-        with h5py.File(path, mode="r") as file:
+        file = h5py.File(path, mode="r")
+        try:
             groups = list(file.keys())
             try:
                 groups.remove("meta")
@@ -209,27 +689,113 @@ class IonModel:
                 dt_end=datetime.strptime(meta.attrs["dt_end"], "%Y-%m-%d %H:%M"),
                 **meta_attrs
             )
-            for group in groups:
-                grp = file[group]
-                obj.frames.append(IonFrame.read_self_from_file(grp))
-            return obj
+            obj._read_frames(file, groups, lazy, workers)
+        except BaseException:
+            file.close()
+            raise
+        if not lazy:
+            file.close()
+        return obj
+
+    def _next_dts(self, dt_last: datetime, dt_end: datetime) -> ndarray:
+        """
+        Returns times of frames following `dt_last` with a step of `mpf` minutes up to `dt_end`.
+        """
+        step = timedelta(minutes=float(self.mpf))
+        return np.asarray([dt_last + step * (i + 1) for i in range(int((dt_end - dt_last) / step))]).astype(datetime)
 
-    def _lr_ind(self, dt: datetime) -> [int, int]:
+    def extend(self, dt_end: datetime):
         """
-        Calculates indices on the left and on the right of the specified date
+        Extends the model in time, calculating only the new frames.
+
+        :param dt_end: New end date/time of the model.
         """
-        if (dt - self.dt_start).total_seconds() < 0 or (
-                self.dt_end - dt
-        ).total_seconds() < 0:
-            raise ValueError(
-                f"Datetime must be within precalculated range "
-                + "{str(self.dt_start)} - {str(self.dt_end)}."
-            )
-        # noinspection PyTypeChecker
-        idx = np.searchsorted(self._dts, dt)
-        if idx == 0:
-            return [idx, idx]
-        return [idx - 1, idx]
+        if self._lazy or len(self.frames) == 0:
+            raise RuntimeError("Only models calculated in memory can be extended.")
+        dts = self._next_dts(self._dts[-1], dt_end)
+        if len(dts) > 0:
+            frames = [self._empty_frame(dt) for dt in dts]
+            calc_frames(frames, self.executor, progress=True, desc="Calculating time frames")
+            self._init_stack(list(self.frames) + frames)
+        self.dt_end = max(self.dt_end, dt_end)
+
+    @classmethod
+    def append(cls, path: str, dt_end: datetime, executor: IonExecutor | None = None,
+               profile_cache: ProfileCache | None = None, compression: str | None = None) -> int:
+        """
+        Extends a saved model in time without loading it: only frames after the last saved one are calculated, and
+        each of them is written to the file as soon as it is ready. The end of the model in the file is moved to
+        every written frame, so an interrupted call leaves a valid file, and the next call continues from the last
+        written frame.
+
+        :param path: Path to a file (file extension is not required).
+        :param dt_end: New end date/time of the model.
+        :param executor: An :class:`IonExecutor` to calculate frames in.
+        :param profile_cache: A :class:`~dionpy.ProfileCache` to use in calculations.
+        :param compression: Compression of the new frames: "gzip", "lzf" or None.
+        :return: Number of frames added to the file.
+        """
+        import h5py
+
+        if not path.endswith(".h5"):
+            path += ".h5"
+        with h5py.File(path, mode="r+") as file:
+            meta = file["meta"]
+            meta_attrs = dict(meta.attrs)
+            dt_start = datetime.strptime(meta_attrs.pop("dt_start"), "%Y-%m-%d %H:%M")
+            dt_saved = datetime.strptime(meta_attrs.pop("dt_end"), "%Y-%m-%d %H:%M")
+            if dt_end <= dt_saved:
+                return 0
+            obj = cls(dt_start, dt_end, autocalc=False, executor=executor, profile_cache=profile_cache, **meta_attrs)
+            last = cls._last_saved(file)
+            if last is not None:
+                obj._set_dts(obj._next_dts(last, dt_end))
+            nframes = obj._stream_to_file(file, compression, lookahead=2, progress=True)
+            meta.attrs["dt_end"] = dt_end.strftime("%Y-%m-%d %H:%M")
+        return nframes
+
+    def _read_frames(self, file, groups: List[str], lazy: bool, workers: int | None):
+        """
+        Reads frames from groups of a model file. Metadata of all groups is checked against the model, the geometry
+        is built once and shared by all frames, and data of frames is read by a pool of threads directly into the
+        stacked arrays. Frames are sorted by time; frames after the end of the model (left by an interrupted
+        :func:`append`) are skipped.
+        """
+        dts = []
+        for group in list(groups):
+            attrs = file[group]["meta"].attrs
+            dt = datetime.strptime(attrs["dt"], "%Y-%m-%d %H:%M")
+            if dt > self.dt_end:
+                groups.remove(group)
+                continue
+            self._check_meta(attrs, f"frame {group}")
+            dts.append(dt)
+        order = np.argsort(np.asarray(dts, dtype="datetime64[us]"), kind="stable")
+        groups = [groups[i] for i in order]
+        self._set_dts(np.asarray([dts[i] for i in order]).astype(datetime))
+
+        self._template = None
+        shape = (len(self.template._obs_pixels), self.nlayers)
+        for group in groups:
+            if file[group]["edens"].shape != shape or file[group]["etemp"].shape != shape:
+                raise RuntimeError(f"The frame {group} does not match the model: data must be of shape {shape}.")
+
+        if lazy:
+            self._edens = self._etemp = None
+            self._shared = {}
+            self.frames = [self.template._view(dt, file[group]["edens"], file[group]["etemp"])
+                           for dt, group in zip(self._dts, groups)]
+            return
+
+        self._alloc_stack(len(groups))
+
+        def read(i):
+            file[groups[i]]["edens"].read_direct(self._edens[i])
+            file[groups[i]]["etemp"].read_direct(self._etemp[i])
+
+        with ThreadPoolExecutor(max_workers=workers or min(8, len(groups))) as threads:
+            list(threads.map(read, range(len(groups))))
+        self.frames = [self.template._view(dt, self._edens[i], self._etemp[i]) for i, dt in enumerate(self._dts)]
 
     def _nframes2dts(self, nframes: int | None) -> ndarray:
         """
@@ -292,7 +858,7 @@ class IonModel:
         target = [target] if isinstance(target, str) else target
         alt, az = altaz_mesh(gridsize)
         dts = self._nframes2dts(duration * fps)
-        frames = [self.at(dt_) for dt_ in dts]
+        frames = self.at_many(dts)
         nframes = len(frames)
         data_dict = {
             'atten': np.empty((nframes, *alt.shape)),
@@ -308,40 +874,31 @@ class IonModel:
             'edens': dict(cmap="plasma", barlabel=r"$m^{-3}$"),
             'etemp': dict(cmap="plasma", barlabel=r"$m^{-3}$"),
         }
-        nproc = np.min([cpu_count(), len(dts)])
-        pool = mp.get_context('fork').Pool(processes=nproc)
-
-        try:
-            print("Calculating data")
-            if "atten" in target or "refr" in target or "emiss" in target:
-                if freq is None:
-                    raise ValueError("Please specify the frequency for the simulation.")
-                for i, frame in enumerate(tqdm(frames, desc="Raytracing frames")):
-                    data_dict['refr'][i, ...], data_dict['atten'][i, ...], data_dict['emiss'][i, ...] = frame(alt, az,
-                                                                                                              freq,
-                                                                                                              _pool=pool)
-
-            if "edens" in target:
-                for i, frame in enumerate(tqdm(frames, desc="Interpolating ed")):
-                    data_dict['edens'][i, ...] = frame.ed(alt, az)
-            if "etemp" in target:
-                for i, frame in enumerate(tqdm(frames, desc="Interpolating et")):
-                    data_dict['etemp'][i, ...] = frame.et(alt, az)
-
-            plot_kwargs['pos'] = self.position
-            plot_kwargs['freq'] = freq
-
-            for key in data_dict:
-                if key in target:
-                    if 'cmap' not in plot_kwargs.keys():
-                        plot_kwargs['cmap'] = plot_data_dict[key]['cmap']
-                    if 'barlabel' not in plot_kwargs.keys():
-                        plot_kwargs['barlabel'] = plot_data_dict[key]['barlabel']
-                    tmpdir = self._render_polar_plot_frames(alt, az, data_dict[key], dts, plot_kwargs,
-                                                            desc=f"Rendering {key} frames")
-                    pic2vid(tmpdir, saveto + key, fps=fps, desc=f"Rendering {key} animation", codec=codec)
-                    shutil.rmtree(tmpdir)
-        except Exception as e:
-            pool.close()
-            raise e
+        print("Calculating data")
+        if "atten" in target or "refr" in target or "emiss" in target:
+            if freq is None:
+                raise ValueError("Please specify the frequency for the simulation.")
+            # All frames are traced in a single pool
+            data_dict['refr'], data_dict['atten'], data_dict['emiss'] = self.raytrace(dts, alt, az, freq)
+
+        if "edens" in target:
+            for i, frame in enumerate(tqdm(frames, desc="Interpolating ed")):
+                data_dict['edens'][i, ...] = frame.ed(alt, az)
+        if "etemp" in target:
+            for i, frame in enumerate(tqdm(frames, desc="Interpolating et")):
+                data_dict['etemp'][i, ...] = frame.et(alt, az)
+
+        plot_kwargs['pos'] = self.position
+        plot_kwargs['freq'] = freq
+
+        for key in data_dict:
+            if key in target:
+                if 'cmap' not in plot_kwargs.keys():
+                    plot_kwargs['cmap'] = plot_data_dict[key]['cmap']
+                if 'barlabel' not in plot_kwargs.keys():
+                    plot_kwargs['barlabel'] = plot_data_dict[key]['barlabel']
+                tmpdir = self._render_polar_plot_frames(alt, az, data_dict[key], dts, plot_kwargs,
+                                                        desc=f"Rendering {key} frames")
+                pic2vid(tmpdir, saveto + key, fps=fps, desc=f"Rendering {key} animation", codec=codec)
+                shutil.rmtree(tmpdir)
         return
@@ -0,0 +1,260 @@
+from __future__ import annotations
+
+import copy
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Literal, Sequence, Tuple
+
+from iricore.iri import indices_uptodate
+from numpy import ndarray
+
+from .IonFrame import IonFrame
+from .IonModel import IonModel
+from .executor import IonExecutor
+from .modules.cache import ProfileCache
+from .modules.scheduler import iter_calc_frames
+
+
+def utcnow() -> datetime:
+    """
+    :return: Current UTC date/time without a timezone, as used by all dionpy models.
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class NowcastModel:
+    """
+    A rolling-window model of the ionosphere following the clock. The model holds frames on a grid of `mpf` minutes
+    from `past` frames before the current time up to `ahead` frames after it. A background thread (see
+    :func:`start`) calculates upcoming frames before the clock reaches them and evicts frames which fall behind the
+    window, so queries at the current time are answered from frames in memory without waiting for IRI:
+
+    >>> with NowcastModel(position, profile_cache=cache) as model:
+    ...     model.wait()
+    ...     frame = model.at()
+    ...     refr, atten, emiss = model.raytrace(None, alt, az, freq)
+
+    Queries are served by an :class:`IonModel` of the frames in the window, which is replaced as a whole whenever
+    the window moves; :attr:`model` returns the current one. If the background calculation falls behind the clock,
+    times after the last calculated frame are served by that frame.
+
+    :param position: Geographical position of an observer. Must be a tuple containing
+                     latitude [deg], longitude [deg], and elevation [m].
+    :param mpf: Number of minutes per frame.
+    :param past: Number of frames kept before the current time.
+    :param ahead: Number of frames calculated ahead of the current time. At least one is needed for the
+                  interpolation at the current time.
+    :param nside: Resolution of healpix grid.
+    :param hbot: Lower limit in [km] of the layer of the ionosphere.
+    :param htop: Upper limit in [km] of the layer of the ionosphere.
+    :param nlayers: Number of sub-layers in the ionospheric layer for intermediate calculations.
+    :param rdeg_offset: Extends the angular horizon distance of calculated ionosphere in [degrees].
+    :param iriversion: Version of the IRI model to use.
+    :param echaim: Use ECHAIM model for electron density estimation.
+    :param executor: An :class:`IonExecutor` to calculate frames and raytrace in. If None - the model creates its own,
+                     started by :func:`start` and shut down by :func:`stop`.
+    :param profile_cache: A :class:`~dionpy.ProfileCache` to read IRI/E-CHAIM profiles from, and store newly
+                          calculated ones to.
+    :param interp: Interpolation in time: "linear" or "pchip".
+    :param interval: Time in [s] between checks of the window by the background thread.
+    :param clock: A callable returning the current UTC date/time. Defaults to the system clock.
+    """
+
+    def __init__(
+            self,
+            position: Sequence[float, float, float],
+            mpf: int = 15,
+            past: int = 1,
+            ahead: int = 2,
+            nside: int = 64,
+            hbot: float = 60,
+            htop: float = 500,
+            nlayers: int = 500,
+            rdeg_offset: float = 5,
+            iriversion: Literal[16, 20] = 20,
+            echaim: bool = False,
+            executor: IonExecutor | None = None,
+            profile_cache: ProfileCache | None = None,
+            interp: Literal["linear", "pchip"] = "linear",
+            interval: float = 10,
+            clock: Callable[[], datetime] = utcnow,
+    ):
+        if ahead < 1:
+            raise ValueError("At least one frame ahead of the current time is needed for interpolation.")
+        if past < 0:
+            raise ValueError("The number of past frames must be non-negative.")
+        self.past = past
+        self.ahead = ahead
+        self.interval = interval
+        self.clock = clock
+        self.error = None
+
+        # Workers are forked from the thread calling start(), not from the background thread on every window move
+        self._own_executor = executor is None
+        executor = IonExecutor() if executor is None else executor
+        dt = self._floor(clock(), mpf)
+        # Holds the geometry and parameters of the frames; models of the window are its copies
+        self._base = IonModel(dt, dt + timedelta(minutes=mpf), position, mpf=mpf, nside=nside, hbot=hbot, htop=htop,
+                              nlayers=nlayers, rdeg_offset=rdeg_offset, iriversion=iriversion, echaim=echaim,
+                              autocalc=False, executor=executor, profile_cache=profile_cache, interp=interp)
+        self._frames: Dict[datetime, IonFrame] = {}
+        self._model = None
+        self._published = threading.Condition()
+        self._update_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    @staticmethod
+    def _floor(dt: datetime, mpf: int) -> datetime:
+        dt = dt.replace(second=0, microsecond=0)
+        return dt - timedelta(minutes=(dt.hour * 60 + dt.minute) % mpf)
+
+    @property
+    def model(self) -> IonModel | None:
+        """
+        An :class:`IonModel` of the frames currently in the window, or None if fewer than two frames are calculated.
+        """
+        return self._model
+
+    def window(self, dt: datetime | None = None) -> List[datetime]:
+        """
+        :param dt: Date/time; defaults to the current time.
+        :return: Dates/times of frames in the window around `dt`.
+        """
+        mpf = self._base.mpf
+        floor = self._floor(self.clock() if dt is None else dt, mpf)
+        return [floor + timedelta(minutes=mpf * i) for i in range(-self.past, self.ahead + 1)]
+
+    def update(self) -> int:
+        """
+        Moves the window to the current time: calculates missing frames in time order, making each of them available
+        to queries as soon as it is ready, and evicts frames before the window. Called periodically by the background
+        thread, but may be called directly instead.
+
+        :return: Number of calculated frames.
+        """
+        with self._update_lock:
+            dts = self.window()
+            new = [self._base._empty_frame(dt) for dt in dts if dt not in self._frames]
+            if len(new) == 0:
+                self._publish(dts[0])
+                return 0
+            indices_uptodate(new[-1].dt)
+            for frame in iter_calc_frames(new, self._base.executor, lookahead=1):
+                self._frames[frame.dt] = frame
+                self._publish(dts[0])
+            return len(new)
+
+    def _publish(self, start: datetime):
+        dts = sorted(self._frames)
+        keep = [dt for dt in dts if dt >= start]
+        # Two frames are kept even if the calculation falls behind, so the model can still be queried
+        keep = keep if len(keep) >= 2 else dts[-2:]
+        self._frames = {dt: self._frames[dt] for dt in keep}
+        if len(keep) < 2:
+            return
+        model = copy.copy(self._base)
+        model.dt_start, model.dt_end = keep[0], keep[-1]
+        model._init_stack([self._frames[dt] for dt in keep])
+        with self._published:
+            self._model = model
+            self._published.notify_all()
+
+    def start(self):
+        """
+        Starts the background thread moving the window, and the executor of the model if it was not given one.
+        Returns immediately; use :func:`wait` to wait for frames at the current time.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        if self._own_executor:
+            self._base.executor.start()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="dionpy-nowcast", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the background thread after the current frame is calculated, and shuts down the executor of the model
+        if it was not given one. Frames in memory are kept.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._own_executor:
+            self._base.executor.shutdown()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.update()
+                self.error = None
+            except Exception as e:
+                # Failed calculations are repeated at the next check; queries are served by the frames in memory
+                self.error = e
+            self._stop.wait(self.interval)
+
+    def wait(self, dt: datetime | None = None, timeout: float | None = None) -> bool:
+        """
+        Blocks until the model covers the specified time.
+
+        :param dt: Date/time; defaults to the current time.
+        :param timeout: Maximum time to wait in [s]. If None - not limited.
+        :return: True if the time is covered, False if the timeout expired.
+        """
+        dt = self.clock() if dt is None else dt
+        with self._published:
+            return self._published.wait_for(lambda: self._model is not None and self._model.dt_end >= dt, timeout)
+
+    def _query(self, dts: Sequence[datetime] | None) -> Tuple[IonModel, List[datetime]]:
+        model = self._model
+        if model is None:
+            raise RuntimeError("No frames are calculated yet; call start() or update() first.")
+        dts = [self.clock()] if dts is None else dts
+        return model, [min(dt, model.dt_end) for dt in dts]
+
+    def at(self, dt: datetime | None = None, kind: str | None = None) -> IonFrame:
+        """
+        :param dt: Date/time of the frame; defaults to the current time.
+        :param kind: Interpolation in time: "linear" or "pchip". If None - the `interp` parameter of the model is
+                     used.
+        :return: :class:`IonFrame` at specified time.
+        """
+        return self.at_many(None if dt is None else [dt], kind)[0]
+
+    def at_many(self, dts: Sequence[datetime] | None, kind: str | None = None) -> List[IonFrame]:
+        """
+        See :func:`IonModel.at_many`.
+
+        :param dts: Dates/times of the frames. If None - the current time.
+        """
+        model, dts = self._query(dts)
+        return model.at_many(dts, kind)
+
+    def interp(self, dts: Sequence[datetime] | None, kind: str | None = None) -> Tuple[ndarray, ndarray]:
+        """
+        See :func:`IonModel.interp`.
+
+        :param dts: Dates/times to interpolate at. If None - the current time.
+        """
+        model, dts = self._query(dts)
+        return model.interp(dts, kind)
+
+    def raytrace(self, dts: Sequence[datetime] | None, alt: float | ndarray, az: float | ndarray,
+                 freq: float | ndarray, **kwargs) -> Tuple[ndarray, ndarray, ndarray]:
+        """
+        Raytracing through the model, see :func:`IonModel.raytrace` for the description of parameters.
+
+        :param dts: Dates/times of observation. If None - the current time.
+        :returns: (refraction, attenuation, emission) with a leading time axis: (ntime, ...).
+        """
+        model, dts = self._query(dts)
+        return model.raytrace(dts, alt, az, freq, **kwargs)
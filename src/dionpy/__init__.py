@@ -1,3 +1,6 @@
 from .IonFrame import IonFrame
 from .IonModel import IonModel
+from .NowcastModel import NowcastModel
+from .executor import IonExecutor
+from .modules.cache import ProfileCache, ResultCache
 from .modules.plotting import plot_kwargs
@@ -0,0 +1,131 @@
+"""
+Command line interface of dionpy.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+from datetime import datetime
+from typing import Sequence
+
+from .IonModel import IonModel
+from .executor import IonExecutor
+from .modules.cache import ProfileCache
+from .modules.helpers import COMPRESSIONS
+
+
+def _model_path(output: str, position: Sequence[float]) -> str:
+    lat, lon, alt = position
+    return os.path.join(output, f"ionmodel_{lat:g}_{lon:g}_{alt:g}.h5")
+
+
+def run_models(args: argparse.Namespace):
+    """
+    Calculates a model for every site in `args` to a file in the output directory. Each frame is written as soon as
+    it is calculated, and calculations of existing files are resumed after the last written frame.
+    """
+    profile_cache = None
+    if args.profile_cache is not None:
+        maxbytes = None if args.cache_size is None else int(args.cache_size * 2 ** 20)
+        profile_cache = ProfileCache(args.profile_cache, maxbytes=maxbytes)
+    os.makedirs(args.output, exist_ok=True)
+    with IonExecutor(args.workers) as executor:
+        for position in args.position:
+            path = _model_path(args.output, position)
+            model = IonModel(
+                args.start,
+                args.end,
+                position,
+                mpf=args.mpf,
+                nside=args.nside,
+                hbot=args.hbot,
+                htop=args.htop,
+                nlayers=args.nlayers,
+                rdeg_offset=args.rdeg_offset,
+                iriversion=args.iriversion,
+                echaim=args.echaim,
+                autocalc=False,
+                executor=executor,
+                profile_cache=profile_cache,
+            )
+            nframes = model.calc_to_file(path, compression=args.compression, progress=not args.quiet)
+            if not args.quiet:
+                print(f"{path}: {nframes} frames written")
+
+
+def run_server(args: argparse.Namespace):
+    """
+    Serves queries to a saved model until interrupted.
+    """
+    from .server import IonServer
+    model = IonModel.load(args.path, lazy=args.lazy)
+    with IonExecutor(args.workers) as executor:
+        server = IonServer(model, host=args.host, port=args.port, executor=executor,
+                           batch_window=args.batch_window / 1000)
+        print(f"Serving {args.path} at {server.url}", flush=True)
+        server.serve_forever()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="dionpy", description="Dynamic ionosphere model for global 21 cm "
+                                                                "experiments.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    model = commands.add_parser(
+        "model",
+        help="Calculate IonModels to files.",
+        description="Calculates an IonModel for every site to a file 'ionmodel_<lat>_<lon>_<alt>.h5' in the output "
+                    "directory. Each frame is written as soon as it is calculated; if the file exists, the "
+                    "calculation resumes after the last written frame.",
+    )
+    model.add_argument("start", type=datetime.fromisoformat, help="Start date/time in ISO format, e.g. "
+                                                                   "2024-01-01T00:00.")
+    model.add_argument("end", type=datetime.fromisoformat, help="End date/time in ISO format.")
+    model.add_argument("--position", "-p", type=float, nargs=3, action="append", required=True,
+                       metavar=("LAT", "LON", "ALT"), help="Site latitude [deg], longitude [deg] and elevation [m]. "
+                                                           "May be repeated.")
+    model.add_argument("--output", "-o", default=".", help="Output directory.")
+    model.add_argument("--mpf", type=int, default=15, help="Number of minutes per frame.")
+    model.add_argument("--nside", type=int, default=64, help="Resolution of healpix grid.")
+    model.add_argument("--hbot", type=float, default=60, help="Lower limit of the ionosphere in [km].")
+    model.add_argument("--htop", type=float, default=500, help="Upper limit of the ionosphere in [km].")
+    model.add_argument("--nlayers", type=int, default=500, help="Number of sub-layers.")
+    model.add_argument("--rdeg-offset", type=float, default=5, help="Extension of the horizon in [deg].")
+    model.add_argument("--iriversion", type=int, default=20, choices=(16, 20), help="Version of IRI.")
+    model.add_argument("--echaim", action="store_true", help="Use E-CHAIM for electron density.")
+    model.add_argument("--compression", choices=[c for c in COMPRESSIONS if c], default=None,
+                       help="Compression of saved data.")
+    model.add_argument("--workers", "-j", type=int, default=None, help="Number of worker processes. Defaults to "
+                                                                        "the number of CPUs.")
+    model.add_argument("--profile-cache", default=None, help="Path to a HDF5 cache of IRI/E-CHAIM profiles, shared "
+                                                             "by all sites and runs.")
+    model.add_argument("--cache-size", type=float, default=None, help="Size limit of the profile cache in [MB].")
+    model.add_argument("--quiet", "-q", action="store_true", help="Do not display progress.")
+    model.set_defaults(func=run_models)
+
+    serve = commands.add_parser(
+        "serve",
+        help="Serve queries to a saved IonModel over HTTP.",
+        description="Holds a saved IonModel in memory and answers electron density, temperature and raytracing "
+                    "queries over HTTP (see dionpy.server.IonServer and dionpy.server.IonClient).",
+    )
+    serve.add_argument("path", help="Path to a saved IonModel.")
+    serve.add_argument("--host", default="127.0.0.1", help="Host to listen on.")
+    serve.add_argument("--port", type=int, default=8000, help="Port to listen on.")
+    serve.add_argument("--lazy", action="store_true", help="Read frames from the file only when they are queried.")
+    serve.add_argument("--batch-window", type=float, default=5, help="Time in [ms] a query waits for other queries "
+                                                                     "to join its batch.")
+    serve.add_argument("--workers", "-j", type=int, default=None, help="Number of worker processes. Defaults to "
+                                                                        "the number of CPUs.")
+    serve.set_defaults(func=run_server)
+    return parser
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    args.func(args)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
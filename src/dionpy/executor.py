@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import multiprocessing as mp
+import weakref
+from contextlib import contextmanager
+from multiprocessing import cpu_count, resource_tracker
+from multiprocessing.pool import Pool
+from typing import Union
+
+from .modules.cache import stores_closed
+
+
+def _new_pool(processes: int | None) -> Pool:
+    # Workers must share the resource tracker of this process, otherwise each of them reports
+    # shared memory blocks created by calculations as leaked on exit
+    resource_tracker.ensure_running()
+    with stores_closed():
+        return mp.get_context("fork").Pool(processes=processes)
+
+
+def _shutdown_pool(pool: Pool):
+    pool.close()
+    pool.join()
+
+
+class IonExecutor:
+    """
+    A reusable pool of worker processes for :class:`IonFrame` and :class:`IonModel` calculations. By default,
+    every IRI/E-CHAIM calculation and raytracing call starts its own pool of processes. An executor is started
+    once, and its workers are reused by all calculations it is passed to. Use it as a context manager or call
+    :func:`shutdown` explicitly when it is no longer needed:
+
+    >>> with IonExecutor(workers=8) as executor:
+    ...     frame = IonFrame(dt, pos, executor=executor)
+    ...     refr, atten, emiss = frame.raytrace(alt, az, freq)
+
+    :param workers: Number of worker processes. Defaults to the number of CPUs.
+    """
+
+    def __init__(self, workers: int | None = None):
+        self.workers = workers or cpu_count()
+        self._pool = None
+        self._finalizer = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    def __repr__(self):
+        state = "running" if self.running else "stopped"
+        return f"IonExecutor(workers={self.workers}, {state})"
+
+    @property
+    def running(self) -> bool:
+        return self._pool is not None
+
+    @property
+    def pool(self) -> Pool:
+        """
+        The underlying :class:`multiprocessing.pool.Pool`. Workers are started on first access.
+        """
+        if self._pool is None:
+            self.start()
+        return self._pool
+
+    def start(self):
+        """
+        Starts worker processes. Does nothing if the executor is already running.
+        """
+        if self._pool is None:
+            self._pool = _new_pool(self.workers)
+            # Release workers if the executor is garbage-collected without shutdown
+            self._finalizer = weakref.finalize(self, self._pool.terminate)
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stops worker processes. The executor can be started again afterwards.
+
+        :param wait: If True - waits for running tasks to finish, otherwise terminates workers immediately.
+        """
+        if self._pool is None:
+            return
+        self._finalizer.detach()
+        if wait:
+            _shutdown_pool(self._pool)
+        else:
+            self._pool.terminate()
+            self._pool.join()
+        self._pool = None
+        self._finalizer = None
+
+
+@contextmanager
+def pool_context(executor: IonExecutor | None = None, pool: Union[Pool, None] = None, nproc: int | None = None):
+    """
+    Yields a pool of processes for a calculation: the pool of the executor, the given pool, or a temporary pool
+    with `nproc` processes, which is closed on exit.
+    """
+    if executor is not None:
+        yield executor.pool
+    elif pool is not None:
+        yield pool
+    else:
+        pool = _new_pool(nproc)
+        try:
+            yield pool
+        finally:
+            _shutdown_pool(pool)
+
+
+def nworkers(executor: IonExecutor | None = None, pool: Union[Pool, None] = None) -> int:
+    """
+    Number of processes available for a calculation.
+    """
+    if executor is not None:
+        return executor.workers
+    if pool is not None:
+        return getattr(pool, "_processes", cpu_count())
+    return cpu_count()
@@ -0,0 +1,67 @@
+"""
+Helpers of the asyncio API: blocking calculations run in threads, which dispatch work to a shared pool of processes,
+under a common limit of concurrent calculations.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+import weakref
+from typing import Any, Callable
+
+from ..executor import IonExecutor
+
+# Number of concurrent calculations of an event loop, unless a semaphore is passed explicitly
+DEFAULT_LIMIT = 4
+
+_limits = weakref.WeakKeyDictionary()
+_executor = None
+
+
+def default_executor() -> IonExecutor:
+    """
+    :return: The executor of awaitable calculations which are not given one, started on first use. Workers are forked
+             once from the thread of the event loop instead of a temporary pool being forked by every calculation
+             while other calculations are running in threads.
+    """
+    global _executor
+    if _executor is None:
+        _executor = IonExecutor()
+    _executor.start()
+    return _executor
+
+
+def default_limit() -> asyncio.Semaphore:
+    """
+    :return: The semaphore limiting concurrent calculations of the running event loop to :data:`DEFAULT_LIMIT`.
+    """
+    loop = asyncio.get_running_loop()
+    limit = _limits.get(loop)
+    if limit is None:
+        limit = _limits[loop] = asyncio.Semaphore(DEFAULT_LIMIT)
+    return limit
+
+
+async def run_cancellable(func: Callable[[threading.Event], Any], limit: asyncio.Semaphore | None = None) -> Any:
+    """
+    Runs a blocking calculation in a thread of the event loop. The calculation gets a :class:`threading.Event`, set
+    when the awaiting task is cancelled; it should stop as soon as it notices the event. The task is cancelled only
+    after the calculation has stopped, so the slot of `limit` is released when the work is actually done.
+
+    :param func: Callable (cancel event) -> result.
+    :param limit: A semaphore shared by calculations that must not run all at once. Defaults to
+                  :func:`default_limit`.
+    :return: Result of `func`.
+    """
+    async with (limit or default_limit()):
+        cancel = threading.Event()
+        future = asyncio.get_running_loop().run_in_executor(None, func, cancel)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            cancel.set()
+            try:
+                await future
+            except BaseException:
+                pass
+            raise
@@ -0,0 +1,461 @@
+from __future__ import annotations
+
+import functools
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Hashable, Sequence, Tuple
+
+import numpy as np
+
+
+def array_digest(*arrays: np.ndarray) -> str:
+    """
+    Calculates a hash of the content, shape and type of the given arrays. Used to build cache keys from numeric data.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for arr in arrays:
+        arr = np.ascontiguousarray(arr)
+        h.update(str((arr.shape, arr.dtype.str)).encode())
+        h.update(arr)
+    return h.hexdigest()
+
+
+def sizeof(value: Any) -> int:
+    """
+    Estimates the memory footprint of a cached value in bytes. Uses the `nbytes` attribute if the value has one
+    (numpy arrays and objects that report their own size), and sums over tuples and lists.
+    """
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    if isinstance(value, (tuple, list)):
+        return sum(sizeof(v) for v in value)
+    return 0
+
+
+class LRUCache:
+    """
+    A thread-safe dictionary with least-recently-used eviction.
+
+    :param maxsize: Maximum number of stored items.
+    :param maxbytes: Maximum total size of stored items in bytes (see :func:`sizeof`). If None - not limited.
+                     Values larger than the budget are not stored.
+    """
+
+    def __init__(self, maxsize: int = 8, maxbytes: int | None = None):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def __contains__(self, key: Hashable):
+        with self._lock:
+            return key in self._data
+
+    def keys(self) -> list:
+        """
+        :return: Stored keys from the least to the most recently used.
+        """
+        with self._lock:
+            return list(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Returns the stored value and marks it as recently used, or `default` if the key is not cached.
+        """
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        """
+        Stores the value and evicts the least recently used items if the cache is full. A value larger than
+        `maxbytes` is not stored, and replaces no other items.
+        """
+        with self._lock:
+            if self.maxbytes is not None and sizeof(value) > self.maxbytes:
+                self._data.pop(key, None)
+                return
+            self._data[key] = value
+            self._data.move_to_end(key)
+            self._evict()
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Total size of stored items in bytes.
+        """
+        with self._lock:
+            return sum(sizeof(v) for v in self._data.values())
+
+    def _evict(self):
+        while len(self._data) > max(self.maxsize, 0):
+            self._data.popitem(last=False)
+        if self.maxbytes is not None:
+            while len(self._data) > 0 and self.nbytes > self.maxbytes:
+                self._data.popitem(last=False)
+
+    def trim(self):
+        """
+        Evicts items to fit the limits. Call it after a stored value has grown in size.
+        """
+        with self._lock:
+            self._evict()
+
+    def resize(self, maxsize: int | None = None, maxbytes: int | None = None):
+        """
+        Changes the limits of the cache. Parameters that are None are left unchanged.
+
+        :param maxsize: Maximum number of stored items.
+        :param maxbytes: Maximum total size of stored items in bytes.
+        """
+        with self._lock:
+            if maxsize is not None:
+                self.maxsize = maxsize
+            if maxbytes is not None:
+                self.maxbytes = maxbytes
+            self._evict()
+
+    def clear(self):
+        """
+        Removes all items and resets the statistics.
+        """
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        """
+        :return: Dictionary with the number of hits, misses, stored items and their total size in bytes.
+        """
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses, size=len(self._data), maxsize=self.maxsize,
+                        nbytes=self.nbytes, maxbytes=self.maxbytes)
+
+
+# A HDF5 file open in one thread cannot be opened for writing in another, so operations on a file are serialized
+_file_locks = {}
+_file_locks_guard = threading.Lock()
+
+
+def _file_lock(path: str) -> threading.RLock:
+    with _file_locks_guard:
+        return _file_locks.setdefault(os.path.abspath(path), threading.RLock())
+
+
+@contextmanager
+def stores_closed():
+    """
+    Waits until no HDF5 store is open in this process and keeps them closed while the context is active. Used when
+    forking worker processes, which would otherwise inherit open files together with their HDF5 file locks.
+    """
+    with _file_locks_guard:
+        locks = list(_file_locks.values())
+        for lock in locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in locks:
+                lock.release()
+
+
+def _locked(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with _file_lock(self.path):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class H5Store:
+    """
+    A persistent key-value store of numpy arrays in an HDF5 file. Each key is a group with the stored arrays and the
+    time of last access, which is used to evict least recently used items when the store exceeds its budget.
+    The file is opened only for the duration of each operation, so the store can be shared between processes
+    and scripts; an operation that cannot open the file (e.g. it is locked by another process) is skipped.
+
+    :param path: Path to the HDF5 file. Created on the first write.
+    :param maxbytes: Maximum total size of stored arrays in bytes. If None - not limited. Note that HDF5 reuses
+                     the space of deleted items, but never shrinks the file.
+    """
+
+    def __init__(self, path: str, maxbytes: int | None = None):
+        self.path = path
+        self.maxbytes = maxbytes
+
+    def _open(self, mode: str):
+        import h5py
+        if mode == "r" and not os.path.exists(self.path):
+            return None
+        try:
+            return h5py.File(self.path, mode=mode)
+        except OSError:
+            return None
+
+    @_locked
+    def get(self, key: str) -> Tuple[np.ndarray, ...] | None:
+        """
+        :return: The stored arrays or None if the key is not in the store.
+        """
+        file = self._open("r")
+        if file is None:
+            return None
+        with file:
+            if key not in file:
+                return None
+            grp = file[key]
+            value = tuple(grp[str(i)][()] for i in range(grp.attrs["nitems"]))
+        self._touch(key)
+        return value
+
+    def _touch(self, key: str):
+        file = self._open("a")
+        if file is not None:
+            with file:
+                file[key].attrs["atime"] = time.time()
+
+    @_locked
+    def put(self, key: str, value: Sequence[np.ndarray], **attrs):
+        """
+        Stores arrays under the key and evicts the least recently used items if the store is full.
+
+        :param key: A valid HDF5 group name.
+        :param value: A sequence of arrays.
+        :param attrs: Additional attributes of the stored group.
+        """
+        file = self._open("a")
+        if file is None:
+            return
+        with file:
+            if key in file:
+                del file[key]
+            grp = file.create_group(key)
+            for i, arr in enumerate(value):
+                grp.create_dataset(str(i), data=arr)
+            grp.attrs["nitems"] = len(value)
+            grp.attrs["atime"] = time.time()
+            for name, attr in attrs.items():
+                grp.attrs[name] = attr
+            self._evict(file, keep=key)
+
+    @staticmethod
+    def _group_nbytes(grp) -> int:
+        return sum(ds.nbytes for ds in grp.values())
+
+    def _evict(self, file, keep: str | None = None):
+        if self.maxbytes is None:
+            return
+        sizes = {key: self._group_nbytes(file[key]) for key in file}
+        total = sum(sizes.values())
+        for key in sorted(sizes, key=lambda k: file[k].attrs["atime"]):
+            if total <= self.maxbytes:
+                break
+            if key != keep:
+                del file[key]
+                total -= sizes[key]
+
+    @_locked
+    def __contains__(self, key: str):
+        file = self._open("r")
+        if file is None:
+            return False
+        with file:
+            return key in file
+
+    @_locked
+    def __len__(self):
+        file = self._open("r")
+        if file is None:
+            return 0
+        with file:
+            return len(file)
+
+    @property
+    @_locked
+    def nbytes(self) -> int:
+        """
+        Total size of stored arrays in bytes.
+        """
+        file = self._open("r")
+        if file is None:
+            return 0
+        with file:
+            return sum(self._group_nbytes(file[key]) for key in file)
+
+    @_locked
+    def clear(self):
+        """
+        Deletes the file of the store.
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class ProfileCache(H5Store):
+    """
+    A persistent cache of ionospheric profiles (e.g. electron density and temperature calculated with IRI) in
+    healpix pixels. Profiles are grouped by a key describing the model, time, healpix resolution and height grid;
+    each group holds a list of pixels and a row of every profile array for each pixel. Since profiles depend only on
+    the coordinates of pixels, frames of different observers share them. Least recently used groups are evicted if
+    the cache exceeds its budget.
+
+    :param path: Path to the HDF5 file. Created on the first write.
+    :param maxbytes: Maximum total size of stored profiles in bytes. If None - not limited.
+    """
+
+    @_locked
+    def fetch(self, key: str, pixels: np.ndarray, names: Sequence[str]) -> Tuple[np.ndarray, Tuple[np.ndarray, ...]]:
+        """
+        Reads cached profiles for the given pixels.
+
+        :param key: Key of the profile group.
+        :param pixels: Healpix pixel indices.
+        :param names: Names of profile arrays to read.
+        :return: A mask of pixels found in the cache and the profile arrays for these pixels.
+        """
+        found = np.zeros(len(pixels), dtype=bool)
+        file = self._open("r")
+        if file is None:
+            return found, ()
+        with file:
+            if key not in file or any(name not in file[key] for name in names):
+                return found, ()
+            grp = file[key]
+            stored = grp["pixels"][()]
+            order = np.argsort(stored)
+            pos = np.clip(np.searchsorted(stored, pixels, sorter=order), 0, len(stored) - 1)
+            rows = order[pos]
+            found = stored[rows] == pixels
+            rows = rows[found]
+            profiles = tuple(grp[name][()][rows] for name in names)
+        if found.any():
+            self._touch(key)
+        return found, profiles
+
+    @_locked
+    def update(self, key: str, pixels: np.ndarray, **profiles: np.ndarray):
+        """
+        Adds profiles of new pixels to the group and evicts the least recently used groups if the cache is full.
+
+        :param key: Key of the profile group.
+        :param pixels: Healpix pixel indices, which are not in the group yet.
+        :param profiles: Profile arrays with a row for each pixel.
+        """
+        if len(pixels) == 0:
+            return
+        file = self._open("a")
+        if file is None:
+            return
+        with file:
+            if key in file and set(profiles) != set(file[key]) - {"pixels"}:
+                del file[key]
+            if key not in file:
+                grp = file.create_group(key)
+                grp.create_dataset("pixels", data=pixels, maxshape=(None,), chunks=True)
+                for name, arr in profiles.items():
+                    grp.create_dataset(name, data=arr, maxshape=(None, *arr.shape[1:]), chunks=True)
+            else:
+                grp = file[key]
+                n = len(grp["pixels"])
+                for name, arr in dict(profiles, pixels=pixels).items():
+                    grp[name].resize(n + len(pixels), axis=0)
+                    grp[name][n:] = arr
+            grp.attrs["atime"] = time.time()
+            self._evict(file, keep=key)
+
+
+class ResultCache:
+    """
+    A two-tier cache for results of expensive calculations, e.g. raytracing. Results are kept in memory in
+    an LRU cache with a byte budget and, optionally, in an :class:`H5Store` on disk, which survives restarts and can
+    be shared between scripts. Values are tuples of arrays, keys are strings (see :func:`array_digest`).
+
+    :param maxbytes: Memory budget in bytes.
+    :param path: Path to the HDF5 file of the disk store. If None - only memory is used.
+    :param maxdiskbytes: Maximum size of the disk store in bytes. If None - not limited.
+    """
+
+    def __init__(self, maxbytes: int = 128 * 2 ** 20, path: str | None = None, maxdiskbytes: int | None = None):
+        self.memory = LRUCache(maxsize=1024, maxbytes=maxbytes)
+        self.store = None
+        self.disk_hits = 0
+        self.disk_misses = 0
+        self._lock = threading.RLock()
+        if path is not None:
+            self.set_store(path, maxdiskbytes)
+
+    def set_store(self, path: str | None, maxbytes: int | None = None):
+        """
+        Sets (or removes if `path` is None) the disk store of the cache.
+
+        :param path: Path to the HDF5 file.
+        :param maxbytes: Maximum size of the disk store in bytes. If None - not limited.
+        """
+        with self._lock:
+            self.store = None if path is None else H5Store(path, maxbytes)
+
+    def get(self, key: str) -> Tuple[np.ndarray, ...] | None:
+        """
+        :return: Cached arrays or None. Values found on disk are also put to memory.
+        """
+        value = self.memory.get(key)
+        if value is not None or self.store is None:
+            return value
+        with self._lock:
+            value = self.store.get(key)
+            if value is None:
+                self.disk_misses += 1
+                return None
+            self.disk_hits += 1
+        self.memory.put(key, value)
+        return value
+
+    def put(self, key: str, value: Sequence[np.ndarray]):
+        """
+        Stores arrays in memory and in the disk store.
+        """
+        value = tuple(value)
+        self.memory.put(key, value)
+        if self.store is not None:
+            with self._lock:
+                self.store.put(key, value)
+
+    def clear(self, disk: bool = False):
+        """
+        Clears the memory cache and resets the statistics.
+
+        :param disk: If True - the disk store is deleted as well.
+        """
+        self.memory.clear()
+        with self._lock:
+            self.disk_hits = 0
+            self.disk_misses = 0
+            if disk and self.store is not None:
+                self.store.clear()
+
+    def stats(self) -> dict:
+        """
+        :return: Statistics of the memory cache (see :func:`LRUCache.stats`) extended with the number of disk hits
+                 and misses.
+        """
+        stats = self.memory.stats()
+        stats.update(disk_hits=self.disk_hits, disk_misses=self.disk_misses,
+                     disk_path=None if self.store is None else self.store.path)
+        return stats
@@ -0,0 +1,66 @@
+"""
+Observer geometry of frames, shared by all frames with the same position and grid.
+"""
+from __future__ import annotations
+
+import functools
+from typing import Sequence, Tuple
+
+import healpy as hp
+import numpy as np
+
+from .helpers import R_EARTH
+
+
+def _estimate_ahd(htop: float, hint: float = 0, r: float = R_EARTH * 1e-3):
+    """
+    Estimates the angular horizontal distance (ahd) between the top point of an atmospheric
+    layer and the Earth's surface.
+
+    :param htop: The height of the top point of the atmospheric layer in [km].
+    :param hint: The height above the Earth's surface in [km].
+    :param r: The radius of the Earth in [km].
+    """
+    return np.rad2deg(np.arccos(r / (r + hint)) + np.arccos(r / (r + htop)))
+
+
+class FrameGeometry:
+    """
+    Observed part of the healpix grid: the angular horizon distance and the observed pixels with their coordinates.
+    Instances are immutable (arrays are read-only) and memoized, get them with :func:`frame_geometry`. A geometry is
+    pickled as its parameters and restored from the memo of the receiving process, so worker processes query
+    healpix only once per geometry, and not at all if they are forked after the geometry is created.
+
+    :param position: Latitude [deg], longitude [deg], and elevation [m] of an observer.
+    :param nside: Resolution of healpix grid.
+    :param htop: Upper limit in [km] of the layer of the ionosphere.
+    :param rdeg_offset: Extends the angular horizon distance in [degrees].
+    """
+
+    def __init__(self, position: Tuple[float, float, float], nside: int, htop: float, rdeg_offset: float):
+        self.key = (position, nside, htop, rdeg_offset)
+        self.rdeg = _estimate_ahd(htop, position[-1] * 1e-3) + rdeg_offset
+        self.posvec = hp.ang2vec(position[1], position[0], lonlat=True)
+        self.obs_pixels = hp.query_disc(nside, self.posvec, np.deg2rad(self.rdeg), inclusive=True)
+        self.obs_lons, self.obs_lats = hp.pix2ang(nside, self.obs_pixels, lonlat=True)
+        for arr in (self.posvec, self.obs_pixels, self.obs_lons, self.obs_lats):
+            arr.flags.writeable = False
+
+    def __reduce__(self):
+        return _memoized, self.key
+
+    def __repr__(self):
+        return f"FrameGeometry(position={self.key[0]}, nside={self.key[1]}, htop={self.key[2]}, " \
+               f"rdeg_offset={self.key[3]})"
+
+
+@functools.lru_cache(maxsize=64)
+def _memoized(position: Tuple[float, float, float], nside: int, htop: float, rdeg_offset: float) -> FrameGeometry:
+    return FrameGeometry(position, nside, htop, rdeg_offset)
+
+
+def frame_geometry(position: Sequence[float], nside: int, htop: float, rdeg_offset: float) -> FrameGeometry:
+    """
+    :return: The :class:`FrameGeometry` of the parameters, calculated once per process.
+    """
+    return _memoized(tuple(float(x) for x in position), int(nside), float(htop), float(rdeg_offset))
@@ -1,10 +1,9 @@
 from __future__ import annotations
 
 import os
-from typing import Iterable, Sequence
+from typing import Iterable, Sequence, Tuple
 
 import h5py
-import healpy as hp
 import numpy as np
 from ffmpeg_progress_yield import FfmpegProgress
 from pymap3d import aer2geodetic, Ellipsoid
@@ -115,6 +114,7 @@ def eval_layer(
         obs_pixels: Sequence[int],
         data: float | np.ndarray,
         layer: int | None = None,
+        cache: bool = True,
 ):
     """
     Calculates interpolated values on healpix grid.
@@ -130,29 +130,19 @@ def eval_layer(
     :param data: A data to interpolate.
     :param layer: Number of sublayer from the precalculated sublayers.
                   If None - an average over all layers is returned.
+    :param cache: If True - the interpolation operator for given directions is cached and reused in the subsequent
+                  calls with the same grid.
     :return: Interpolated values at specified elevation and azimuth.
     """
+    from .interpolation import layer_interpolator, interp_cache
+
     check_elaz_shape(alt, az)
-    heights = np.linspace(hbot, htop, nlayers)
-    map_ = np.zeros(hp.nside2npix(nside)) + hp.UNSEEN
-    if layer is None:
-        res = np.empty((*alt.shape, nlayers))
-        for i in range(nlayers):
-            map_[obs_pixels] = data[:, i]
-            obs_lat, obs_lon = sky2ll(alt, az, heights[i], position)
-            res[:, :, i] = hp.pixelfunc.get_interp_val(
-                map_, obs_lon, obs_lat, lonlat=True
-            )
-        return res.mean(axis=2)
-    elif isinstance(layer, int) and layer < nlayers + 1:
-        map_[obs_pixels] = data[:, layer]
-        obs_lat, obs_lon = sky2ll(alt, az, heights[layer], position)
-        res = hp.pixelfunc.get_interp_val(map_, obs_lon, obs_lat, lonlat=True)
-        return res
-    else:
-        raise ValueError(
-            f"The layer value must be integer and be in range [0, {nlayers - 1}]"
-        )
+    interp = layer_interpolator(alt, az, nside, position, hbot, htop, nlayers, obs_pixels, cache=cache)
+    res = interp(data, layer)
+    if cache:
+        # The interpolator may have grown by new layers, possibly beyond the budget of the cache
+        interp_cache.trim()
+    return res
 
 
 def pic2vid(
@@ -202,6 +192,24 @@ def nan2zero(arr):
     return np.where(np.isnan(arr), 0, arr)
 
 
+COMPRESSIONS = (None, "gzip", "lzf")
+
+
+def frame_dataset_options(shape: Tuple[int, int], compression: str | None = None) -> dict:
+    """
+    Returns HDF5 storage options of a (npixels, nlayers) frame dataset. Chunks hold up to 1024 pixels of 16 layers
+    (64 KiB of float32), so that reading a layer or the profile of a pixel touches only a few chunks.
+
+    :param shape: Shape of the dataset.
+    :param compression: "gzip", "lzf" or None. Compressed datasets are shuffled, which improves compression of
+                        floating point data.
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"The compression parameter must be one of {COMPRESSIONS}.")
+    chunks = (max(min(shape[0], 1024), 1), max(min(shape[1], 16), 1))
+    return dict(chunks=chunks, compression=compression, shuffle=compression is not None)
+
+
 def open_save_file(saveto):
     head, tail = os.path.split(saveto)
     if not os.path.exists(head) and len(head) > 0:
@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+from typing import Sequence, Tuple
+
+import healpy as hp
+import numpy as np
+from scipy import sparse
+
+from .cache import LRUCache, array_digest
+from .helpers import sky2ll
+
+# Operators for the most recently used (frame geometry, alt/az grid) pairs. A fully built operator for a 200x200
+# grid and 100 sub-layers takes ~200 MB; operators which outgrow the budget are dropped after use instead of being
+# kept. The limits can be changed with interp_cache.resize(maxsize, maxbytes).
+interp_cache = LRUCache(maxsize=8, maxbytes=512 * 2 ** 20)
+
+
+def _obs_columns(obs_pixels: np.ndarray, pix: np.ndarray) -> np.ndarray:
+    """
+    Converts healpix pixel indices to positions in the `obs_pixels` array; unseen pixels are marked with -1.
+    """
+    order = np.argsort(obs_pixels)
+    pos = np.clip(np.searchsorted(obs_pixels, pix, sorter=order), 0, len(obs_pixels) - 1)
+    cols = order[pos]
+    return np.where(obs_pixels[cols] == pix, cols, -1)
+
+
+def interp_operator(
+        nside: int,
+        obs_pixels: np.ndarray,
+        lon: float | np.ndarray,
+        lat: float | np.ndarray,
+) -> Tuple[sparse.csr_matrix, np.ndarray]:
+    """
+    Builds a sparse operator equivalent to the bilinear interpolation of a healpix map, which is defined only in
+    the observed pixels (all other pixels are equal to hp.UNSEEN).
+
+    :param nside: Resolution of healpix grid.
+    :param obs_pixels: List of pixel indices inside the visible disk on healpix sphere.
+    :param lon: Longitude(s) of interpolated points in [deg].
+    :param lat: Latitude(s) of interpolated points in [deg].
+    :return: A (npoints, len(obs_pixels)) matrix of interpolation weights and an offset vector, which accounts for
+             unseen pixels, so that interpolated values are `matrix @ data + offset`.
+    """
+    obs_pixels = np.asarray(obs_pixels)
+    pix, weights = hp.get_interp_weights(nside, np.ravel(lon), np.ravel(lat), lonlat=True)
+    npoints = pix.shape[1]
+
+    cols = _obs_columns(obs_pixels, pix)
+    seen = cols >= 0
+    rows = np.broadcast_to(np.arange(npoints), pix.shape)
+
+    matrix = sparse.csr_matrix(
+        (weights[seen], (rows[seen], cols[seen])), shape=(npoints, len(obs_pixels))
+    )
+    offset = hp.UNSEEN * np.where(seen, 0, weights).sum(axis=0)
+    return matrix, offset
+
+
+def interp_obs(
+        nside: int,
+        obs_pixels: np.ndarray,
+        data: np.ndarray,
+        lon: float | np.ndarray,
+        lat: float | np.ndarray,
+) -> float | np.ndarray:
+    """
+    Interpolates data defined in the observed pixels of a healpix grid. Intended for one-shot lookups; see :class:`LayerInterpolator` for repeated queries on the same points.
+
+    :param nside: Resolution of healpix grid.
+    :param obs_pixels: List of pixel indices inside the visible disk on healpix sphere.
+    :param data: Values in the observed pixels.
+    :param lon: Longitude(s) of interpolated points in [deg].
+    :param lat: Latitude(s) of interpolated points in [deg].
+    :return: Interpolated values with the shape of `lon`.
+    """
+    map_ = np.full(hp.nside2npix(nside), hp.UNSEEN)
+    map_[obs_pixels] = data
+    pix, weights = hp.get_interp_weights(nside, np.ravel(lon), np.ravel(lat), lonlat=True)
+    return np.sum(map_[pix] * weights, axis=0).reshape(np.shape(lon))[()]
+
+
+class LayerInterpolator:
+    """
+    Precomputed interpolation of frame data (electron density, temperature, etc.) to a fixed set of directions.
+    Holds a sparse interpolation operator for each sub-layer; operators are built on the first use of a layer.
+
+    :param alt: Elevation of observation(s) in [deg].
+    :param az: Azimuth of observation(s) in [deg].
+    :param nside: Resolution of healpix grid.
+    :param position: Geographical position of an observer.
+    :param heights: Heights of sub-layers in [km].
+    :param obs_pixels: List of pixel indices inside the visible disk on healpix sphere.
+    :param store: If False - sparse operators are not built, and each evaluation interpolates directly. Faster for
+                  directions that are queried only once.
+    """
+
+    def __init__(
+            self,
+            alt: float | np.ndarray,
+            az: float | np.ndarray,
+            nside: int,
+            position: Sequence[float, float, float],
+            heights: np.ndarray,
+            obs_pixels: np.ndarray,
+            store: bool = True,
+    ):
+        self.shape = np.shape(alt)
+        self.nside = nside
+        self.position = tuple(position)
+        self.heights = np.asarray(heights)
+        self.obs_pixels = np.asarray(obs_pixels)
+        self._alt = np.array(alt, dtype=np.float64).ravel()
+        self._az = np.array(az, dtype=np.float64).ravel()
+        self.store = store
+        self._operators = [None] * len(self.heights)
+
+    @property
+    def nlayers(self):
+        return len(self.heights)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Memory taken by the built operators in bytes.
+        """
+        return sum(m.data.nbytes + m.indices.nbytes + m.indptr.nbytes + o.nbytes
+                   for m, o in filter(None, self._operators))
+
+    def operator(self, layer: int) -> Tuple[sparse.csr_matrix, np.ndarray]:
+        """
+        :param layer: Number of sublayer.
+        :return: Interpolation operator and offset for the given sublayer (see :func:`interp_operator`).
+        """
+        if self._operators[layer] is None:
+            obs_lat, obs_lon = sky2ll(self._alt, self._az, self.heights[layer], self.position)
+            self._operators[layer] = interp_operator(self.nside, self.obs_pixels, obs_lon, obs_lat)
+        return self._operators[layer]
+
+    def _eval(self, data: np.ndarray, layer: int) -> np.ndarray:
+        if not self.store:
+            obs_lat, obs_lon = sky2ll(self._alt, self._az, self.heights[layer], self.position)
+            return interp_obs(self.nside, self.obs_pixels, data[:, layer], obs_lon, obs_lat)
+        matrix, offset = self.operator(layer)
+        return matrix @ data[:, layer] + offset
+
+    def __call__(self, data: np.ndarray, layer: int | None = None) -> float | np.ndarray:
+        """
+        :param data: A (len(obs_pixels), nlayers) array to interpolate.
+        :param layer: Number of sublayer. If None - an average over all layers is returned.
+        :return: Interpolated values at the stored directions.
+        """
+        if layer is None:
+            res = np.zeros(self._alt.size)
+            for i in range(self.nlayers):
+                res += self._eval(data, i)
+            res /= self.nlayers
+        elif isinstance(layer, (int, np.integer)) and 0 <= layer < self.nlayers:
+            res = self._eval(data, layer)
+        else:
+            raise ValueError(
+                f"The layer value must be integer and be in range [0, {self.nlayers - 1}]"
+            )
+        return res.reshape(self.shape)[()]
+
+
+def layer_interpolator(
+        alt: float | np.ndarray,
+        az: float | np.ndarray,
+        nside: int,
+        position: Sequence[float, float, float],
+        hbot: float,
+        htop: float,
+        nlayers: int,
+        obs_pixels: np.ndarray,
+        cache: bool = True,
+) -> LayerInterpolator:
+    """
+    Returns a :class:`LayerInterpolator` for the given frame geometry and directions. If `cache` is True, the
+    interpolator is taken from (or stored in) the `interp_cache`, so that repeated queries on the same grid
+    reuse precomputed operators. Otherwise, the returned interpolator does not build operators at all.
+    """
+    heights = np.linspace(hbot, htop, nlayers)
+    if not cache:
+        return LayerInterpolator(alt, az, nside, position, heights, obs_pixels, store=False)
+
+    key = (nside, tuple(position), hbot, htop, nlayers, array_digest(obs_pixels, np.asarray(alt, dtype=np.float64),
+                                                                     np.asarray(az, dtype=np.float64)))
+    interp = interp_cache.get(key)
+    if interp is None:
+        interp = LayerInterpolator(alt, az, nside, position, heights, obs_pixels)
+        interp_cache.put(key, interp)
+    return interp
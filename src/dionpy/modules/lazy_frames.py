@@ -0,0 +1,103 @@
+"""
+On-demand calculation of frames of an :class:`IonModel`.
+"""
+from __future__ import annotations
+
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Sequence
+
+from .cache import LRUCache
+from .scheduler import calc_frames
+
+
+class LazyFrames:
+    """
+    A sequence of frames which are calculated only when accessed. Calculated frames are kept in an LRU cache with
+    a memory budget; evicted frames are restored from the profile cache of the frames (backed by disk) instead of
+    being recalculated. When frames are accessed sequentially in time, the next frames in the same direction are
+    calculated in the background.
+
+    :param dts: Date/time of each frame.
+    :param factory: Callable dt -> :class:`IonFrame` without calculated data.
+    :param executor: An :class:`IonExecutor` to calculate frames in.
+    :param maxbytes: Memory budget for calculated frames in bytes. If None - not limited.
+    :param prefetch: Number of frames to calculate ahead in the background. If 0 - prefetching is disabled.
+    """
+
+    def __init__(self, dts: Sequence, factory: Callable, executor=None, maxbytes: int | None = None,
+                 prefetch: int = 2):
+        self.dts = dts
+        self.factory = factory
+        self.executor = executor
+        self.prefetch = prefetch
+        self.cache = LRUCache(maxsize=len(dts), maxbytes=maxbytes)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._last = None
+        self._background = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dionpy-prefetch")
+
+    def __len__(self):
+        return len(self.dts)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("Frame index out of range.")
+        frame = self._get(idx)
+        self._schedule_prefetch(idx)
+        return frame
+
+    def _get(self, idx: int):
+        frame = self.cache.get(idx)
+        if frame is not None:
+            return frame
+        with self._lock:
+            future = self._pending.get(idx)
+            owner = future is None
+            if owner:
+                future = self._pending[idx] = Future()
+        if not owner:
+            # The frame is being calculated by another thread
+            return future.result()
+        try:
+            frame = self.factory(self.dts[idx])
+            calc_frames([frame], self.executor)
+            self.cache.put(idx, frame)
+            future.set_result(frame)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._pending[idx]
+        return frame
+
+    def _schedule_prefetch(self, idx: int):
+        last, self._last = self._last, idx
+        if self.prefetch <= 0 or last is None or abs(idx - last) > 1:
+            return
+        step = -1 if idx < last else 1
+        for i in range(idx + step, idx + step * (self.prefetch + 1), step):
+            if 0 <= i < len(self) and i not in self.cache and i not in self._pending:
+                self._background.submit(self._get, i)
+
+    def loaded(self) -> list:
+        """
+        :return: Indices of frames currently held in memory.
+        """
+        return self.cache.keys()
+
+    def close(self):
+        """
+        Stops background calculations and drops calculated frames from memory.
+        """
+        self._background.shutdown(wait=True, cancel_futures=True)
+        self.cache.clear()
@@ -1,27 +1,148 @@
-import ctypes
-import multiprocessing as mp
+import threading
+import weakref
 from multiprocessing import shared_memory
 
 import numpy as np
 from scipy.interpolate import interp1d
 
 
-def create_shared_block(array):
-    shm = shared_memory.SharedMemory(create=True, size=array.nbytes)
-    np_array = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
-    np_array[:] = array[:]
-    return shm, np_array
+def _release_block(shm, unlink):
+    # The memory stays mapped while arrays refer to it, and is unmapped with the last of them
+    if unlink:
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
 
 
-def shared_array(array):
+class _Mapping:
     """
-    Returns a copy of array in shared memory that may be used in different processes.
+    Exposes shared memory to numpy as the base of arrays, so that arrays keep the memory mapped.
     """
-    sharr_base = mp.Array(ctypes.c_double, int(np.prod(array.shape)))
-    sharr = np.ctypeslib.as_array(sharr_base.get_obj())
-    sharr[:] = array.ravel()[:]
-    sharr = sharr.reshape(array.shape)
-    return sharr
+
+    def __init__(self, shm, shape, dtype):
+        self.shm = shm
+        address = np.frombuffer(shm.buf, dtype=np.uint8).ctypes.data
+        self.__array_interface__ = dict(shape=tuple(shape), typestr=np.dtype(dtype).str, data=(address, False),
+                                        version=3)
+
+
+class SharedBlock:
+    """
+    A numpy array in shared memory. The process which creates the block owns it: the block is unlinked when the
+    owner closes it or the object is garbage-collected. Other processes attach to the block by its spec. Views of
+    :attr:`array` stay valid after the block is closed.
+
+    :param shape: Shape of the array.
+    :param dtype: Data type of the array.
+    :param name: Name of an existing block to attach to. If None - a new block is created.
+    """
+
+    def __init__(self, shape, dtype, name=None):
+        owner = name is None
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        self.shm = shared_memory.SharedMemory(name=name, create=owner, size=max(nbytes, 1))
+        self.array = np.asarray(_Mapping(self.shm, shape, dtype))
+        self._finalizer = weakref.finalize(self, _release_block, self.shm, owner)
+
+    @classmethod
+    def from_array(cls, array):
+        """
+        Creates a new block with a copy of the array.
+        """
+        block = cls(array.shape, array.dtype)
+        block.array[:] = array
+        return block
+
+    @classmethod
+    def attach(cls, spec):
+        """
+        Attaches to an existing block given its :attr:`spec`.
+        """
+        return cls(*spec[1:], name=spec[0])
+
+    @property
+    def spec(self):
+        """
+        A picklable (name, shape, dtype) description of the block.
+        """
+        return self.shm.name, self.array.shape, self.array.dtype.str
+
+    def close(self):
+        """
+        Detaches from the block; the owner also unlinks it. The memory is freed when no views of the array are left.
+        """
+        self.array = None
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class BatchScheduler:
+    """
+    Splits pixels into batches for parallel profile calculations (IRI, E-CHAIM). Batch size is derived from the
+    cost of a profile point measured in previous batches, so that a batch takes about `target_time` seconds.
+    Every worker gets at least `tasks_per_worker` batches, so that workers which finish early take over the rest
+    of the work instead of waiting for the slowest batch.
+
+    :param target_time: Desired duration of a batch in [s].
+    :param tasks_per_worker: Minimum number of batches per worker.
+    :param default_size: Batch size used until the cost of a calculation is measured.
+    """
+
+    def __init__(self, target_time: float = 0.5, tasks_per_worker: int = 4, default_size: int = 200):
+        self.target_time = target_time
+        self.tasks_per_worker = tasks_per_worker
+        self.default_size = default_size
+        self._cost = {}
+        self._lock = threading.Lock()
+
+    def cost(self, name):
+        """
+        :return: Measured time in [s] per profile point of the calculation, or None if it was not measured yet.
+        """
+        with self._lock:
+            return self._cost.get(name)
+
+    def split(self, name, npixels, nlayers, nworkers, total=None):
+        """
+        :param name: Name of the calculation, e.g. "iri".
+        :param npixels: Number of pixels to calculate.
+        :param nlayers: Number of points in a profile.
+        :param nworkers: Number of worker processes.
+        :param total: Total number of pixels left in the queue of workers, if the batches are a part of
+                      a larger calculation. Defaults to `npixels`.
+        :return: A list of (start, stop) indices of batches.
+        """
+        cost = self.cost(name)
+        size = self.default_size if cost is None else self.target_time / (cost * nlayers)
+        size = min(size, np.ceil((total or npixels) / (nworkers * self.tasks_per_worker)))
+        size = int(max(size, 1))
+        return [(start, min(start + size, npixels)) for start in range(0, npixels, size)]
+
+    def update(self, name, npoints, elapsed):
+        """
+        Updates the cost estimate of the calculation with a finished batch.
+
+        :param name: Name of the calculation.
+        :param npoints: Number of calculated profile points (pixels x layers).
+        :param elapsed: Time of calculation in [s].
+        """
+        if npoints == 0:
+            return
+        cost = elapsed / npoints
+        with self._lock:
+            old = self._cost.get(name)
+            # Smooth out fluctuations of single batches
+            self._cost[name] = cost if old is None else 0.7 * old + 0.3 * cost
+
+
+# Cost estimates are shared by all frames of the process
+batch_scheduler = BatchScheduler()
 
 
 def interp_val(data1, data2, dt1, dt2, dt):
@@ -1,26 +1,62 @@
+import time
+
 import echaim
 import numpy as np
-from multiprocessing import shared_memory
 import iricore
 
+from .parallel import SharedBlock
+
 
 def nan2zero(arr):
     return np.where(np.isnan(arr), 0, arr)
 
 
-def parallel_iri(dt, heights, batch_lat, batch_lon, shnm_edens, shnm_etemp, arr_shape, batch_i, iriversion):
-    shm_edens = shared_memory.SharedMemory(name=shnm_edens)
-    shm_etemp = shared_memory.SharedMemory(name=shnm_etemp)
-    shedens = np.ndarray(arr_shape, dtype=np.float32, buffer=shm_edens.buf)
-    shetemp = np.ndarray(arr_shape, dtype=np.float32, buffer=shm_etemp.buf)
+def parallel_iri(dt, heights, batch_lat, batch_lon, spec_edens, spec_etemp, batch_i, iriversion):
+    """
+    Calculates IRI profiles for a batch of points and writes them to shared blocks starting from the row `batch_i`.
+
+    :return: Number of points in the batch and the time of calculation in [s].
+    """
+    t_start = time.perf_counter()
     res = iricore.iri(dt, heights, batch_lat, batch_lon, version=iriversion)
+    elapsed = time.perf_counter() - t_start
+    with SharedBlock.attach(spec_edens) as edens, SharedBlock.attach(spec_etemp) as etemp:
+        edens.array[batch_i:batch_i + len(batch_lat)] = nan2zero(res.edens)
+        etemp.array[batch_i:batch_i + len(batch_lat)] = nan2zero(res.etemp)
+    return len(batch_lat), elapsed
+
+
+def parallel_echaim(batch_lat, batch_lon, heights, dt, spec_edens, batch_i, *args, **kwargs):
+    """
+    Calculates E-CHAIM density profiles for a batch of points and writes them to a shared block starting from
+    the row `batch_i`.
+
+    :return: Number of points in the batch and the time of calculation in [s].
+    """
+    t_start = time.perf_counter()
+    # E-CHAIM covers only latitudes >= 55 deg, and echaim.density_profile() fails if exactly one point of a batch is
+    # inside or outside of the coverage, so the model is called only for points inside, with at least two of them
+    res = np.full((len(batch_lat), len(heights)), np.nan)
+    inside = np.flatnonzero(np.asarray(batch_lat) >= 55)
+    if len(inside) > 0:
+        points = np.resize(inside, max(len(inside), 2))
+        res[inside] = echaim.density_profile(np.asarray(batch_lat)[points], np.asarray(batch_lon)[points], heights, dt,
+                                             *args, **kwargs)[:len(inside)]
+    elapsed = time.perf_counter() - t_start
+    with SharedBlock.attach(spec_edens) as edens:
+        edens.array[batch_i:batch_i + len(batch_lat)] = res
+    return len(batch_lat), elapsed
+
 
-    shedens[batch_i:batch_i + len(batch_lat)] = nan2zero(res.edens)
-    shetemp[batch_i:batch_i + len(batch_lat)] = nan2zero(res.etemp)
+def parallel_iri_star(args):
+    """
+    For parallel calculations
+    """
+    return parallel_iri(*args)
 
 
-def parallel_echaim(batch_lat, batch_lon, heights, dt, shnm_edens, arr_shape, batch_i, *args, **kwargs):
-    shm_edens = shared_memory.SharedMemory(name=shnm_edens)
-    shedens = np.ndarray(arr_shape, dtype=np.float32, buffer=shm_edens.buf)
-    shedens[batch_i:batch_i + len(batch_lat)] = echaim.density_profile(batch_lat, batch_lon, heights, dt, *args,
-                                                                       **kwargs)
+def parallel_echaim_star(args):
+    """
+    For parallel calculations
+    """
+    return parallel_echaim(*args)
@@ -0,0 +1,176 @@
+"""
+Compiled kernels for the raytracing procedure. Requires the optional `numba` dependency
+(install with `pip install dionpy[numba]`).
+
+The kernels run in numba's threading layer. TBB worker threads may hang the interpreter at exit once the process has
+forked a raytracing/IRI pool; if TBB is installed, choose another layer before the kernels are first called, e.g.
+with the environment variable ``NUMBA_THREADING_LAYER=omp`` (or ``workqueue``).
+"""
+from __future__ import annotations
+
+import healpy as hp
+import numpy as np
+from numba import njit, prange
+
+from .helpers import R_EARTH
+
+_LIGHT_SPEED = 2.99792458e8  # in [m/s]
+_PLASFREQ_COEF = 1.60217662e-19 ** 2 / (9.10938356e-31 * 8.85418782e-12)  # e^2 / (m_e * epsilon0)
+_UNSEEN = hp.UNSEEN
+
+
+@njit(inline="always")
+def _srange(theta, alt, re):
+    cost = np.cos(theta)
+    return -re * cost + np.sqrt((re * cost) ** 2 + alt ** 2 + 2 * alt * re)
+
+
+@njit(inline="always")
+def _aer2geodetic(az, el, r_slant, lat0, lon0, h0):
+    """
+    Same as pymap3d.aer2geodetic for a spherical Earth; angles in [deg], distances in [m].
+    """
+    az, el = np.deg2rad(az), np.deg2rad(el)
+    lat0, lon0 = np.deg2rad(lat0), np.deg2rad(lon0)
+    # aer -> enu
+    e = r_slant * np.cos(el) * np.sin(az)
+    n = r_slant * np.cos(el) * np.cos(az)
+    u = r_slant * np.sin(el)
+    # enu -> ecef
+    t = np.cos(lat0) * u - np.sin(lat0) * n
+    d0 = R_EARTH + h0
+    x = d0 * np.cos(lat0) * np.cos(lon0) + np.cos(lon0) * t - np.sin(lon0) * e
+    y = d0 * np.cos(lat0) * np.sin(lon0) + np.sin(lon0) * t + np.cos(lon0) * e
+    z = d0 * np.sin(lat0) + np.sin(lat0) * u + np.cos(lat0) * n
+    # ecef -> geodetic
+    return np.rad2deg(np.arctan2(z, np.hypot(x, y))), np.rad2deg(np.arctan2(y, x))
+
+
+@njit(inline="always")
+def _gather(data, layer, pix2col, pix, w, j):
+    val = 0.
+    for k in range(4):
+        p = pix[k, j]
+        c = pix2col[p] if 0 <= p < len(pix2col) else -1
+        val += w[k, j] * (data[c, layer] if c >= 0 else _UNSEEN)
+    return val
+
+
+@njit(parallel=True, cache=True, error_model="numpy")
+def _step_kernel(lat, lon, h_ray, h_next, alt_cur, az, theta_ref, first, pos, dh,
+                 lat_next, lon_next, theta_inc, lat_et, lon_et, ds):
+    """
+    Moves rays to the next sub-layer and finds the inclination angle at the interface. Also calculates the path
+    length in the sub-layer and the position where electron temperature is evaluated.
+    """
+    nbad = 0
+    d_cur = R_EARTH + h_ray
+    d_next = R_EARTH + h_next
+    for j in prange(len(alt_cur)):
+        theta = np.deg2rad(90 - alt_cur[j])
+        r_slant = _srange(theta, h_next - h_ray, d_cur)
+        lat_next[j], lon_next[j] = _aer2geodetic(az[j], alt_cur[j], r_slant, lat[j], lon[j], h_ray)
+        if first:
+            costheta_inc = (r_slant ** 2 + d_next ** 2 - d_cur ** 2) / (2 * r_slant * d_next)
+            if costheta_inc > 1:
+                nbad += 1
+            theta_inc[j] = np.arccos(costheta_inc)
+        else:
+            theta_inc[j] = np.arcsin(np.sin(np.pi - theta_ref[j]) * d_cur / d_next)
+
+        r_et = _srange(theta, h_next, R_EARTH)
+        lat_et[j], lon_et[j] = _aer2geodetic(az[j], alt_cur[j], r_et, pos[0], pos[1], pos[2])
+        ds[j] = _srange(theta, h_next + 0.5 * dh, R_EARTH) - _srange(theta, h_next - 0.5 * dh, R_EARTH)
+    return nbad
+
+
+@njit(parallel=True, cache=True, error_model="numpy")
+def _refract_kernel(layer, last, edens, etemp, pix2col, pix_ed, w_ed, pix_et, w_et, freq, freq_c, ds, theta_inc,
+                    ref_ind, theta_ref, d_theta, alt_cur, inf_mask, nan_mask, hist, atten, emiss, height_profile):
+    """
+    Applies Snell's law at the interface and accumulates absorption and emission in the sub-layer.
+    """
+    for j in prange(len(alt_cur)):
+        ed = _gather(edens, layer, pix2col, pix_ed, w_ed, j)
+        if ed < 0:
+            ed = 0.
+        et = _gather(etemp, layer, pix2col, pix_et, w_et, j)
+
+        freq_p = np.sqrt(ed * _PLASFREQ_COEF)
+        if last:
+            ref_ind_next = 1.
+        else:
+            ref_ind_next = np.sqrt(1 - (0.5 * freq_p / np.pi / freq[j]) ** 2)
+            if 0.5 * freq_p / np.pi > freq[j]:
+                nan_mask[j] += 1
+
+        sin_ref = ref_ind[j] / ref_ind_next * np.sin(theta_inc[j])
+        if np.abs(sin_ref) > 1:
+            inf_mask[j] += 1
+        theta_ref[j] = np.arcsin(sin_ref)
+        d_theta[j] += theta_ref[j] - theta_inc[j]
+        alt_cur[j] = np.rad2deg(np.pi / 2 - theta_ref[j])
+        ref_ind[j] = ref_ind_next
+
+        freq_om = freq[j] * 2 * np.pi
+        att = np.exp(-0.5 * freq_p ** 2 / (freq_om ** 2 + freq_c ** 2) * freq_c * ds[j] / _LIGHT_SPEED)
+        if height_profile:
+            hist[j, layer] = d_theta[j]
+            atten[j, layer] = att
+            emiss[j, layer] = (1 - att) * et
+        else:
+            atten[j, 0] *= att
+            emiss[j, 0] += (1 - att) * et
+
+
+def raytrace_numba(frame, alt_cur, az, freq, heights, dh, freq_c, height_profile):
+    """
+    Compiled version of the sub-layer loop of :func:`dionpy.raytracing.raytrace`. Takes and returns arrays
+    in the same form as the NumPy implementation.
+    """
+    shape = alt_cur.shape
+    nrays = alt_cur.size
+    nlayers = frame.nlayers
+
+    alt_cur = alt_cur.ravel().copy()
+    az = np.ascontiguousarray(az).ravel()
+    freq = np.broadcast_to(freq, shape).ravel().copy()
+    pos = np.asarray(frame.position, dtype=np.float64)
+
+    pix2col = np.full(hp.nside2npix(frame.nside), -1, dtype=np.int64)
+    pix2col[frame._obs_pixels] = np.arange(len(frame._obs_pixels))
+    edens = np.asarray(frame.edens)
+    etemp = np.asarray(frame.etemp)
+
+    lat, lon = np.full(nrays, pos[0]), np.full(nrays, pos[1])
+    lat_next, lon_next, lat_et, lon_et = (np.empty(nrays) for _ in range(4))
+    theta_inc, ds = np.empty(nrays), np.empty(nrays)
+    theta_ref, d_theta = np.zeros(nrays), np.zeros(nrays)
+    ref_ind = np.ones(nrays)
+    inf_mask, nan_mask = np.zeros(nrays, dtype=np.int64), np.zeros(nrays, dtype=np.int64)
+
+    ncols = nlayers if height_profile else 1
+    hist = np.empty((nrays, ncols)) if height_profile else np.empty((0, 0))
+    atten = np.empty((nrays, ncols)) if height_profile else np.ones((nrays, ncols))
+    emiss = np.empty((nrays, ncols)) if height_profile else np.zeros((nrays, ncols))
+
+    h_ray = pos[2]
+    for i in range(nlayers):
+        nbad = _step_kernel(lat, lon, h_ray, heights[i], alt_cur, az, theta_ref, i == 0, pos, dh,
+                            lat_next, lon_next, theta_inc, lat_et, lon_et, ds)
+        assert nbad == 0, (f"Cosine of inclination angle cannot be >= 1. Something is wrong with "
+                           f"coordinates at heights {h_ray * 1e-3:.1f}-{heights[i] * 1e-3:.1f} [km].")
+        pix_ed, w_ed = hp.get_interp_weights(frame.nside, lon_next, lat_next, lonlat=True)
+        pix_et, w_et = hp.get_interp_weights(frame.nside, lon_et, lat_et, lonlat=True)
+        _refract_kernel(i, i == nlayers - 1, edens, etemp, pix2col, pix_ed, w_ed, pix_et, w_et, freq,
+                        float(freq_c[i]), ds, theta_inc, ref_ind, theta_ref, d_theta, alt_cur, inf_mask, nan_mask,
+                        hist, atten, emiss, height_profile)
+        lat, lat_next = lat_next, lat
+        lon, lon_next = lon_next, lon
+        h_ray = heights[i]
+
+    d_theta = np.where(inf_mask == 0, d_theta, np.inf)
+    d_theta = np.where(nan_mask == 0, d_theta, np.nan).reshape(shape)
+    if height_profile:
+        return hist.reshape(*shape, nlayers), atten.reshape(*shape, nlayers), emiss.reshape(*shape, nlayers)
+    return d_theta, atten.reshape(shape), emiss.reshape(shape)
@@ -0,0 +1,230 @@
+"""
+Scheduling of IRI/E-CHAIM calculations for one or many frames in a single queue of worker tasks.
+"""
+from __future__ import annotations
+
+import collections
+import itertools
+import queue
+import threading
+from concurrent.futures import CancelledError
+from typing import Callable, Iterable, Iterator, Sequence
+
+import numpy as np
+from tqdm import tqdm
+
+from .parallel import SharedBlock, batch_scheduler
+from ..executor import nworkers, pool_context
+
+
+class ProfileJob:
+    """
+    Calculation of profiles (e.g. electron density and temperature with IRI) in all pixels of a frame. Profiles
+    found in the profile cache of the frame are read on creation; the rest are calculated by workers in batches,
+    which write to shared blocks. The frame data is updated only in :func:`finish`.
+
+    :param frame: An :class:`IonFrame`.
+    :param name: Name of the calculation, e.g. "iri".
+    :param key: Key of the profiles in the profile cache.
+    :param names: Names of frame arrays filled by the calculation, e.g. ("edens", "etemp").
+    :param func: Worker function; takes a tuple of arguments and returns the number of calculated pixels and the
+                 time of calculation.
+    :param make_args: Callable (lat, lon, start, specs) -> arguments of `func` for a batch, where `specs` are specs
+                      of the shared blocks for `names`.
+    """
+
+    def __init__(self, frame, name: str, key: str, names: Sequence[str], func: Callable, make_args: Callable):
+        self.frame = frame
+        self.name = name
+        self.key = key
+        self.names = tuple(names)
+        self.func = func
+        self.make_args = make_args
+        self.remaining = 0
+
+        self.found = np.zeros(len(frame._obs_pixels), dtype=bool)
+        self.cached = ()
+        if frame.profile_cache is not None:
+            self.found, self.cached = frame.profile_cache.fetch(key, frame._obs_pixels, self.names)
+        self.todo = ~self.found
+        ntodo = np.count_nonzero(self.todo)
+        self.blocks = [SharedBlock((ntodo, frame.nlayers), np.float32) for _ in self.names] if ntodo else []
+
+    @property
+    def ntodo(self) -> int:
+        return int(np.count_nonzero(self.todo))
+
+    def batches(self, workers: int, total: int | None = None):
+        """
+        Yields (job, arguments) of batches; batch sizes are chosen by the `batch_scheduler`.
+
+        :param workers: Number of workers.
+        :param total: Total number of pixels left in the queue, including this job.
+        """
+        lats, lons = self.frame._obs_lats[self.todo], self.frame._obs_lons[self.todo]
+        bounds = batch_scheduler.split(self.name, len(lats), self.frame.nlayers, workers, total)
+        self.remaining = len(bounds)
+        specs = [block.spec for block in self.blocks]
+        for i, j in bounds:
+            yield self, self.make_args(lats[i:j], lons[i:j], i, *specs)
+
+    def finish(self):
+        """
+        Copies cached and calculated profiles to the frame, stores the calculated ones in the profile cache and
+        releases shared blocks.
+        """
+        frame = self.frame
+        for name, data in zip(self.names, self.cached):
+            getattr(frame, name)[self.found] = data
+        for name, block in zip(self.names, self.blocks):
+            getattr(frame, name)[self.todo] = block.array
+            block.close()
+        if frame.profile_cache is not None and self.blocks:
+            frame.profile_cache.update(self.key, frame._obs_pixels[self.todo],
+                                       **{name: getattr(frame, name)[self.todo] for name in self.names})
+        self.blocks = []
+
+    def release(self):
+        """
+        Releases shared blocks without updating the frame, when the calculation is abandoned.
+        """
+        for block in self.blocks:
+            block.close()
+        self.blocks = []
+
+
+def _run_task(func, args):
+    return func(args)
+
+
+def calc_frames(frames: Sequence, executor=None, progress: bool = False, desc: str = "Calculating profiles",
+                _pool=None, _cancel: threading.Event | None = None):
+    """
+    Calculates profiles of all given frames (see :func:`IonFrame.calc`) in a single queue of tasks. Batches of all
+    frames are fed to workers continuously, so that no worker waits for the end of a frame, and each frame is
+    assembled as soon as all its batches are finished. Shared blocks are allocated only for frames whose batches
+    are in the queue, so memory use does not grow with the number of frames.
+
+    :param frames: A sequence of :class:`IonFrame` objects.
+    :param executor: An :class:`IonExecutor` to run the calculation in. If None - a temporary pool is used.
+    :param progress: If True - displays a progress bar of calculated profiles.
+    :param desc: Description of the progress bar.
+    """
+    if len(frames) == 0:
+        return
+    total = sum(len(frame._obs_pixels) * (1 + frame.echaim) for frame in frames)
+    for _ in iter_calc_frames(frames, executor, progress, desc, total=total, _pool=_pool, _cancel=_cancel):
+        pass
+
+
+def iter_calc_frames(frames: Iterable, executor=None, progress: bool = False, desc: str = "Calculating profiles",
+                     lookahead: int | None = None, total: int | None = None, _pool=None,
+                     _cancel: threading.Event | None = None) -> Iterator:
+    """
+    Calculates profiles of frames like :func:`calc_frames`, yielding every frame in the original order as soon as
+    it is calculated. Frames are taken from `frames` only when the queue of tasks needs more batches, so they may
+    be created on the fly by a generator.
+
+    :param frames: An iterable of :class:`IonFrame` objects.
+    :param executor: An :class:`IonExecutor` to run the calculation in. If None - a temporary pool is used.
+    :param progress: If True - displays a progress bar of calculated profiles.
+    :param desc: Description of the progress bar.
+    :param lookahead: Maximum number of frames calculated, but not yet consumed. If None - not limited.
+    :param total: Total number of profiles to calculate, used for the progress bar and sizing of batches.
+    """
+    frames = iter(frames)
+    workers = nworkers(executor, _pool)
+    left = total
+    # Frames whose jobs were created, in order; [frame, jobs, number of unfinished jobs]
+    started = collections.deque()
+    current = iter(())
+
+    def job_done(job):
+        for state in started:
+            if state[0] is job.frame:
+                state[2] -= 1
+                if state[2] == 0:
+                    # Jobs are finished in order, so that E-CHAIM density overrides IRI density
+                    for frame_job in state[1]:
+                        frame_job.finish()
+                return
+
+    def next_task():
+        nonlocal current, left
+        while True:
+            task = next(current, None)
+            if task is not None:
+                return task
+            if lookahead is not None and len(started) >= lookahead:
+                return None
+            frame = next(frames, None)
+            if frame is None:
+                return None
+            jobs = frame._profile_jobs()
+            started.append([frame, jobs, len(jobs)])
+            batches = []
+            for job in jobs:
+                ncached = len(job.todo) - job.ntodo
+                pbar.update(ncached)
+                left = None if left is None else left - ncached
+                if job.ntodo == 0:
+                    job_done(job)
+                else:
+                    batches.append(job.batches(workers, left))
+            current = itertools.chain.from_iterable(batches)
+
+    done = queue.SimpleQueue()
+    with tqdm(total=total, desc=desc, disable=not progress) as pbar, \
+            pool_context(executor, _pool, workers) as pool:
+        pending = 0
+
+        def submit():
+            nonlocal pending
+            # Keep every worker busy, with one more batch waiting for each of them
+            while pending < 2 * workers:
+                task = next_task()
+                if task is None:
+                    return
+                job, args = task
+                pool.apply_async(_run_task, (job.func, args),
+                                 callback=lambda res, job=job: done.put((job, res)),
+                                 error_callback=lambda err: done.put((None, err)))
+                pending += 1
+
+        try:
+            submit()
+            while True:
+                while started and started[0][2] == 0:
+                    frame = started.popleft()[0]
+                    # The freed slot of the look-ahead window is refilled before the consumer gets the frame, so
+                    # workers keep calculating while it is being processed
+                    submit()
+                    yield frame
+                if not pending:
+                    break
+                if _cancel is not None and _cancel.is_set():
+                    raise CancelledError("Calculation of frames was cancelled.")
+                try:
+                    job, res = done.get(timeout=None if _cancel is None else 0.1)
+                except queue.Empty:
+                    continue
+                pending -= 1
+                if job is None:
+                    raise res
+                npix, elapsed = res
+                batch_scheduler.update(job.name, npix * job.frame.nlayers, elapsed)
+                pbar.update(npix)
+                left = None if left is None else left - npix
+                job.remaining -= 1
+                if job.remaining == 0:
+                    job_done(job)
+                submit()
+        finally:
+            # On errors, cancellation or an early exit of the consumer, batches in flight still write to the shared
+            # blocks of their jobs: wait for them before the blocks are released
+            while pending:
+                done.get()
+                pending -= 1
+            for _, jobs, _ in started:
+                for job in jobs:
+                    job.release()
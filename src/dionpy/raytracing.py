@@ -1,15 +1,30 @@
+from __future__ import annotations
+
+import warnings
 from typing import Tuple
 
 import numpy as np
 import pymap3d as pm
 
 from .modules.collision_models import col_aggarwal, col_nicolet, col_setty
-from .modules.helpers import Ellipsoid, check_elaz_shape, R_EARTH
+from .modules.helpers import Ellipsoid, check_elaz_shape, eval_layer, R_EARTH
 from .modules.ion_tools import srange, refr_index, refr_angle, trop_refr, plasfreq
+from .modules.cache import ResultCache
+from .modules.parallel import SharedBlock
 
 _ROUND_ELL = Ellipsoid(R_EARTH, R_EARTH)
 _LIGHT_SPEED = 2.99792458e8  # in [m/s]
 
+BACKENDS = ("numpy", "numba")
+
+# Requests of at most this many rays (directions x frequencies x times) are traced in the calling process: starting
+# workers, copying the data to them and rebuilding the frame there costs more than tracing a few rays. If 0 - workers
+# are always used by the "numpy" backend.
+INPROCESS_MAX_RAYS = 256
+
+# Results of IonFrame.raytrace(); a disk store can be added with raytrace_cache.set_store(path, maxbytes)
+raytrace_cache = ResultCache()
+
 
 def _raytrace_sublayer(lat_ray, lon_ray, h_ray, h_next, alt_cur, az, freq, d_theta, ref_ind, n_sublayer, layer,
                        theta_ref=None):
@@ -52,47 +67,116 @@ def _raytrace_sublayer(lat_ray, lon_ray, h_ray, h_next, alt_cur, az, freq, d_the
     return lat_next, lon_next, h_next, d_theta, alt_next, ref_ind_next, theta_ref, ed, nan_theta_mask, inf_theta_mask
 
 
-def raytrace(
-        frame_init_dict: dict,
-        edens: np.ndarray,
-        etemp: np.ndarray,
+def _trace_layers(frame, alt_cur, az, freq, heights, dh, freq_c, height_profile):
+    """
+    NumPy implementation of the loop over sub-layers. Returns refraction in [rad] (or its cumulative history if
+    `height_profile` is True), attenuation and emission.
+    """
+    # - For refraction
+    delta_theta = 0 * alt_cur
+    delta_theta_hist = np.empty((*alt_cur.shape, frame.nlayers))
+    inf_theta_mask = 0 * alt_cur
+    nan_theta_mask = 0 * alt_cur
+
+    # - For absorption and emission
+    atten = np.empty((*alt_cur.shape, frame.nlayers))
+    emiss = np.empty((*alt_cur.shape, frame.nlayers))
+
+    # Init values for the first sub-layer
+    ref_ind_cur = np.ones(alt_cur.shape)
+    lat_ray, lon_ray, h_ray = frame.position
+    theta_ref = None
+    freq_om = freq * 2 * np.pi
+
+    for i in range(frame.nlayers):
+        # Calculating absorption and emission: part 1
+        # Before the first refraction all channels share the same elevation, so the lookups are done once
+        alt_lookup, az_lookup = (alt_cur[0], az[0]) if i == 0 else (alt_cur, az)
+        et = eval_layer(alt_lookup, az_lookup, frame.nside, frame.position, frame.hbot, frame.htop, frame.nlayers,
+                        frame._obs_pixels, frame.etemp, layer=i, cache=False)
+        ds = (srange(np.deg2rad(90 - alt_lookup), heights[i] + 0.5 * dh) -
+              srange(np.deg2rad(90 - alt_lookup), heights[i] - 0.5 * dh))
+
+        # Tracing change in position due to refraction
+        lat_ray, lon_ray, h_ray, delta_theta, alt_cur, ref_ind_cur, theta_ref, ed, nt_mask, it_mask = _raytrace_sublayer(
+            lat_ray, lon_ray, h_ray, heights[i], alt_cur, az, freq, delta_theta, ref_ind_cur, i, frame, theta_ref)
+        delta_theta_hist[..., i] = delta_theta
+        inf_theta_mask += it_mask
+        nan_theta_mask += nt_mask
+
+        # Calculating absorption and emission: part 2
+        freq_p = plasfreq(ed)
+        atten[..., i] = np.exp(-0.5 * freq_p ** 2 / (freq_om ** 2 + freq_c[i] ** 2) * freq_c[i] * ds / _LIGHT_SPEED)
+        emiss[..., i] = (1 - atten[..., i]) * et
+
+    if height_profile:
+        return delta_theta_hist, atten, emiss
+
+    delta_theta = np.where(inf_theta_mask == 0, delta_theta, np.inf)
+    delta_theta = np.where(nan_theta_mask == 0, delta_theta, np.nan)
+    return delta_theta, atten.prod(axis=-1), emiss.sum(axis=-1)
+
+
+def resolve_backend(backend: str) -> str:
+    """
+    Checks the name of the raytracing backend. If the "numba" backend is requested, but numba is not installed,
+    a warning is issued and "numpy" is returned instead.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"The backend parameter must be one of {BACKENDS}.")
+    if backend == "numba":
+        try:
+            from .modules.raytracing_numba import raytrace_numba  # noqa: F401
+        except ImportError:
+            warnings.warn("The numba backend requires the numba package (pip install dionpy[numba]). "
+                          "Falling back to the numpy backend.", stacklevel=3)
+            return "numpy"
+    return backend
+
+
+def _get_backend(backend: str):
+    """
+    Returns the implementation of the sub-layer loop for the specified backend.
+    """
+    if resolve_backend(backend) == "numba":
+        from .modules.raytracing_numba import raytrace_numba
+        return raytrace_numba
+    return _trace_layers
+
+
+def raytrace_frame(
+        frame,
         alt: float | np.ndarray,
         az: float | np.ndarray,
         freq: float | np.ndarray,
         col_freq: str = "default",
         troposphere: bool = True,
         height_profile: bool = False,
+        backend: str = "numpy",
 ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Performs raytracing through an :class:`IonFrame` in the current process. See :func:`IonFrame.raytrace` for
+    the description of parameters.
+    """
     # TODO: fix nans and infs
-    # IonLayer initialization with edens and etemp arrays from shared memory
-    assert frame_init_dict['autocalc'] is False, "autocalc param should be False, check IonFrame."
-
-    from .IonFrame import IonFrame
-    frame = IonFrame(**frame_init_dict)
-    frame.edens = edens
-    frame.etemp = etemp
+    trace_layers = _get_backend(backend)
 
     # Initialization of variables
     # - General
-    freq *= 1e6
     check_elaz_shape(alt, az)
-    alt_cur = np.array(alt)
-    az = np.array(az)
+    scalar_freq = np.ndim(freq) == 0
+    # Frequency axis goes first; all channels are traced together
+    freq = np.atleast_1d(np.asarray(freq, dtype=np.float64)) * 1e6
+    nfreq = len(freq)
+    alt = np.array(alt, dtype=np.float64)
+    freq = freq.reshape(nfreq, *([1] * alt.ndim))
     heights = frame.get_heights() * 1e3  # in [m]
-
-    # - For refraction
-    delta_theta = 0 * alt_cur
-    delta_theta_hist = np.empty((*alt_cur.shape, frame.nlayers))
-    inf_theta_mask = 0 * alt_cur
-    nan_theta_mask = 0 * alt_cur
-
-    # - For absorption and emission
     dh = (frame.htop - frame.hbot) / frame.nlayers * 1e3  # in [m]
-    atten = np.empty((*alt_cur.shape, frame.nlayers))
-    emiss = np.empty((*alt_cur.shape, frame.nlayers))
 
     if troposphere:
-        alt_cur -= trop_refr(alt_cur, frame.position[-1])
+        alt -= trop_refr(alt, frame.position[-1])
+    alt_cur = np.broadcast_to(alt, (nfreq, *alt.shape)).copy()
+    az = np.broadcast_to(np.asarray(az, dtype=np.float64), alt_cur.shape)
 
     col_freq_choices = {
         "default": col_aggarwal,
@@ -108,41 +192,35 @@ def raytrace(
             col_model = lambda h: np.float64(col_freq)
         else:
             raise ValueError(f"The col_freq parameter must be one of {list(col_freq_choices.keys())} or a float im Hz.")
+    freq_c = np.broadcast_to(col_model(heights * 1e-3), heights.shape)
 
-    # Init values for the first sub-layer
-    ref_ind_cur = np.ones(alt_cur.shape)
-    lat_ray, lon_ray, h_ray = frame.position
-    theta_ref = None
-
-    for i in range(frame.nlayers):
-        # Calculating absorption and emission: part 1
-        freq_c = col_model(heights[i] * 1e-3)
-        et = frame.et(alt_cur, az, layer=i)
-        freq_om = freq * 2 * np.pi
-        ds = (srange(np.deg2rad(90 - alt_cur), heights[i] + 0.5 * dh) -
-              srange(np.deg2rad(90 - alt_cur), heights[i] - 0.5 * dh))
-
-        # Tracing change in position due to refraction
-        lat_ray, lon_ray, h_ray, delta_theta, alt_cur, ref_ind_cur, theta_ref, ed, nt_mask, it_mask = _raytrace_sublayer(
-            lat_ray, lon_ray, h_ray, heights[i], alt_cur, az, freq, delta_theta, ref_ind_cur, i, frame, theta_ref)
-        delta_theta_hist[..., i] = delta_theta
-        inf_theta_mask += it_mask
-        nan_theta_mask += nt_mask
+    delta_theta, atten, emiss = trace_layers(frame, alt_cur, az, freq, heights, dh, freq_c, height_profile)
+    res = np.rad2deg(delta_theta), atten, emiss
+    if scalar_freq:
+        return tuple(x[0] for x in res)
+    return res
 
-        # Calculating absorption and emission: part 2
-        freq_p = plasfreq(ed)
-        atten[..., i] = np.exp(-0.5 * freq_p ** 2 / (freq_om ** 2 + freq_c ** 2) * freq_c * ds / _LIGHT_SPEED)
-        emiss[..., i] = (1 - atten[..., i]) * et
 
-    delta_theta = np.where(inf_theta_mask == 0, delta_theta, np.inf)
-    delta_theta = np.where(nan_theta_mask == 0, delta_theta, np.nan)
+def raytrace(
+        frame_init_dict: dict,
+        edens: np.ndarray,
+        etemp: np.ndarray,
+        alt: float | np.ndarray,
+        az: float | np.ndarray,
+        freq: float | np.ndarray,
+        col_freq: str = "default",
+        troposphere: bool = True,
+        height_profile: bool = False,
+        backend: str = "numpy",
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # IonLayer initialization with edens and etemp arrays from shared memory
+    assert frame_init_dict['autocalc'] is False, "autocalc param should be False, check IonFrame."
 
-    if not height_profile:
-        atten = atten.prod(axis=-1)
-        emiss = emiss.sum(axis=-1)
-        return np.rad2deg(delta_theta), atten, emiss
-    else:
-        return np.rad2deg(delta_theta_hist), atten, emiss
+    from .IonFrame import IonFrame
+    frame = IonFrame(**frame_init_dict)
+    frame.edens = edens
+    frame.etemp = etemp
+    return raytrace_frame(frame, alt, az, freq, col_freq, troposphere, height_profile, backend)
 
 
 def raytrace_star(args):
@@ -150,3 +228,93 @@ def raytrace_star(args):
     For parallel calculations
     """
     return raytrace(*args)
+
+
+def raytrace_shared(
+        frame_init_dict: dict,
+        data_specs: Tuple[tuple, tuple],
+        out_spec: tuple,
+        start: int,
+        alt: np.ndarray,
+        az: np.ndarray,
+        freq: np.ndarray,
+        col_freq: str = "default",
+        troposphere: bool = True,
+        height_profile: bool = False,
+        backend: str = "numpy",
+):
+    """
+    Raytracing of a chunk of directions in a worker process. Electron density and temperature are read from the
+    shared memory blocks of the frame, and (refraction, attenuation, emission) are written to the shared
+    (3, nfreq, ...) output block starting from the row `start`.
+    """
+    assert frame_init_dict['autocalc'] is False, "autocalc param should be False, check IonFrame."
+
+    from .IonFrame import IonFrame
+    frame = IonFrame(**frame_init_dict)
+    edens, etemp = (SharedBlock.attach(spec) for spec in data_specs)
+    out = SharedBlock.attach(out_spec)
+    try:
+        frame.edens, frame.etemp = edens.array, etemp.array
+        res = raytrace_frame(frame, alt, az, freq, col_freq, troposphere, height_profile, backend)
+        for i in range(3):
+            out.array[i, :, start:start + len(alt)] = res[i]
+    finally:
+        # Drop all views before closing the blocks
+        frame.edens = frame.etemp = None
+        edens.close()
+        etemp.close()
+        out.close()
+
+
+def raytrace_shared_star(args):
+    """
+    For parallel calculations
+    """
+    return raytrace_shared(*args)
+
+
+def raytrace_stack(
+        frame_init_dict: dict,
+        data_specs: Tuple[tuple, tuple],
+        out_spec: tuple,
+        itime: int,
+        irow: int,
+        start: int,
+        alt: np.ndarray,
+        az: np.ndarray,
+        freq: np.ndarray,
+        col_freq: str = "default",
+        troposphere: bool = True,
+        height_profile: bool = False,
+        backend: str = "numpy",
+):
+    """
+    Raytracing of a chunk of directions at one time of an :class:`IonModel` in a worker process. Electron density
+    and temperature are read from the row `irow` of the shared (ntime, npixels, nlayers) blocks of the model, and
+    (refraction, attenuation, emission) are written to the time `itime` of the shared (3, ntime, nfreq, nrays, ...)
+    output block.
+    """
+    assert frame_init_dict['autocalc'] is False, "autocalc param should be False, check IonFrame."
+
+    from .IonFrame import IonFrame
+    frame = IonFrame(**frame_init_dict)
+    edens, etemp = (SharedBlock.attach(spec) for spec in data_specs)
+    out = SharedBlock.attach(out_spec)
+    try:
+        frame.edens, frame.etemp = edens.array[irow], etemp.array[irow]
+        res = raytrace_frame(frame, alt, az, freq, col_freq, troposphere, height_profile, backend)
+        for i in range(3):
+            out.array[i, itime, :, start:start + len(alt)] = res[i]
+    finally:
+        frame.edens = frame.etemp = None
+        edens.close()
+        etemp.close()
+        out.close()
+
+
+def raytrace_stack_star(args):
+    """
+    For parallel calculations
+    """
+    return raytrace_stack(*args)
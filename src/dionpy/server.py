@@ -0,0 +1,312 @@
+"""
+A local query server holding a model in memory, so that many client processes share one copy of the frames and one
+pool of workers.
+"""
+from __future__ import annotations
+
+import json
+import threading
+import urllib.request
+from concurrent.futures import Future
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Hashable, List, Sequence, Tuple
+
+import numpy as np
+
+from .IonFrame import IonFrame
+from .NowcastModel import NowcastModel
+from .executor import IonExecutor
+
+ENDPOINTS = ("ed", "et", "raytrace")
+RAYTRACE_OUTPUTS = ("refr", "atten", "emiss")
+
+
+class _Batch:
+    def __init__(self):
+        self.requests: List[Tuple[np.ndarray, np.ndarray, Future]] = []
+        self.size = 0
+        self.full = threading.Event()
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent requests into vectorized calls. Requests with the same key, submitted within `window`
+    seconds of the first of them, are joined into one batch: their directions are concatenated, `func` is called once,
+    and its results are split back. The thread which opens a batch calculates it, other threads wait for their part.
+
+    :param func: Callable (key, alt, az) -> tuple of arrays with directions along the last axis.
+    :param window: Time in [s] a batch waits for more requests.
+    :param max_size: Number of directions which closes a batch before the end of the window.
+    """
+
+    def __init__(self, func: Callable, window: float = 0.005, max_size: int = 100000):
+        self.func = func
+        self.window = window
+        self.max_size = max_size
+        self.nbatches = 0
+        self._open: Dict[Hashable, _Batch] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, key: Hashable, alt: float | np.ndarray, az: float | np.ndarray) -> Tuple[np.ndarray, ...]:
+        shape = np.broadcast(alt, az).shape
+        alt, az = (np.broadcast_to(x, shape).ravel().astype(np.float64) for x in (alt, az))
+        future = Future()
+        with self._lock:
+            batch = self._open.get(key)
+            leader = batch is None
+            if leader:
+                batch = self._open[key] = _Batch()
+            batch.requests.append((alt, az, future))
+            batch.size += len(alt)
+            if batch.size >= self.max_size:
+                del self._open[key]
+                batch.full.set()
+        if leader:
+            batch.full.wait(self.window)
+            with self._lock:
+                if self._open.get(key) is batch:
+                    del self._open[key]
+            self._run(key, batch)
+        return tuple(x.reshape(x.shape[:-1] + shape) for x in future.result())
+
+    def _run(self, key: Hashable, batch: _Batch):
+        futures = [future for _, _, future in batch.requests]
+        try:
+            res = self.func(key, np.concatenate([alt for alt, _, _ in batch.requests]),
+                            np.concatenate([az for _, az, _ in batch.requests]))
+        except BaseException as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+        self.nbatches += 1
+        bounds = np.cumsum([0] + [len(alt) for alt, _, _ in batch.requests])
+        for future, start, stop in zip(futures, bounds[:-1], bounds[1:]):
+            future.set_result(tuple(np.asarray(x)[..., start:stop] for x in res))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "_HTTPServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, code: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.strip("/") != "info":
+            return self._reply(404, {"error": f"Unknown endpoint '{self.path}'."})
+        self._reply(200, self.server.ion.info())
+
+    def do_POST(self):
+        endpoint = self.path.strip("/")
+        if endpoint not in ENDPOINTS:
+            return self._reply(404, {"error": f"Unknown endpoint '{self.path}'."})
+        try:
+            query = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            res = self.server.ion.query(endpoint, query)
+        except (ValueError, KeyError, TypeError) as e:
+            return self._reply(400, {"error": str(e)})
+        except Exception as e:
+            return self._reply(500, {"error": f"{type(e).__name__}: {e}"})
+        self._reply(200, res)
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    ion: "IonServer"
+
+
+class IonServer:
+    """
+    A local HTTP server answering electron density, temperature and raytracing queries to a model held in memory.
+    Client processes send queries with :class:`IonClient` (or any HTTP client) instead of loading or calculating
+    frames themselves. Concurrent queries at the same time and with the same parameters are coalesced into a single
+    vectorized call (see :class:`MicroBatcher`).
+
+    Endpoints accept JSON objects with "alt" and "az" (numbers or nested lists) and an optional "dt" (ISO date/time):
+
+    - ``POST /ed``, ``POST /et``: optional "layer"; return {"ed": ...} or {"et": ...};
+    - ``POST /raytrace``: "freq" and optional "col_freq", "troposphere" and "backend"; return {"refr": ...,
+      "atten": ..., "emiss": ...};
+    - ``GET /info``: parameters of the model.
+
+    :param model: An :class:`IonFrame`, :class:`IonModel` or :class:`NowcastModel` to serve. For models, "dt" selects
+                  the time of a query; a :class:`NowcastModel` defaults to the current time.
+    :param host: Host to listen on.
+    :param port: Port to listen on. If 0 - a free port is chosen (see :attr:`url`).
+    :param executor: An :class:`IonExecutor` to raytrace in. Defaults to the executor of the model; if it has none,
+                     the server creates its own, started and shut down with the server.
+    :param batch_window: Time in [s] a query waits for other queries to join its batch.
+    :param max_batch: Number of directions which closes a batch before the end of the window.
+    """
+
+    def __init__(self, model, host: str = "127.0.0.1", port: int = 0, executor: IonExecutor | None = None,
+                 batch_window: float = 0.005, max_batch: int = 100000):
+        self.model = model
+        executor = executor or getattr(model, "executor", None)
+        # Workers are forked once from the thread starting the server, not by every query in a handler thread
+        self._own_executor = executor is None
+        self.executor = IonExecutor() if executor is None else executor
+        self.batcher = MicroBatcher(self._calc, window=batch_window, max_size=max_batch)
+        self._httpd = _HTTPServer((host, port), _Handler)
+        self._httpd.ion = self
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """
+        Starts serving in a background thread.
+        """
+        if self._own_executor:
+            self.executor.start()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._httpd.serve_forever, name="dionpy-server", daemon=True)
+            self._thread.start()
+
+    def serve_forever(self):
+        """
+        Serves in the current thread until interrupted.
+        """
+        if self._own_executor:
+            self.executor.start()
+        try:
+            self._httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._httpd.server_close()
+            if self._own_executor:
+                self.executor.shutdown()
+
+    def stop(self):
+        """
+        Stops the server and closes its socket.
+        """
+        if self._thread is not None:
+            self._httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._httpd.server_close()
+        if self._own_executor:
+            self.executor.shutdown()
+
+    def info(self) -> dict:
+        frame = self.model if isinstance(self.model, IonFrame) else None
+        res = {"type": type(self.model).__name__}
+        if frame is not None:
+            res["dt"] = frame.dt.isoformat()
+        elif getattr(self.model, "dt_start", None) is not None:
+            res["dt_start"] = self.model.dt_start.isoformat()
+            res["dt_end"] = self.model.dt_end.isoformat()
+        return res
+
+    def _frame(self, dt: datetime | None) -> IonFrame:
+        if isinstance(self.model, IonFrame):
+            return self.model
+        if dt is None and not isinstance(self.model, NowcastModel):
+            raise ValueError("Parameter 'dt' is required by this model.")
+        return self.model.at(dt)
+
+    def query(self, endpoint: str, query: dict) -> dict:
+        """
+        Answers a decoded query to an endpoint.
+        """
+        dt = query.get("dt")
+        dt = None if dt is None else datetime.fromisoformat(dt)
+        if endpoint == "raytrace":
+            freq = query["freq"]
+            params = (tuple(np.ravel(freq).tolist()), np.ndim(freq) == 0, query.get("col_freq", "default"),
+                      bool(query.get("troposphere", True)), query.get("backend", "numpy"))
+        else:
+            params = (query.get("layer"),)
+        res = self.batcher((endpoint, dt, params), query["alt"], query["az"])
+        keys = RAYTRACE_OUTPUTS if endpoint == "raytrace" else (endpoint,)
+        return {k: np.asarray(x).tolist() for k, x in zip(keys, res)}
+
+    def _calc(self, key: tuple, alt: np.ndarray, az: np.ndarray) -> Tuple[np.ndarray, ...]:
+        endpoint, dt, params = key
+        frame = self._frame(dt)
+        # Frames squeeze their outputs; the batcher splits them along a full axis of directions
+        if endpoint == "ed":
+            return (np.reshape(frame.ed(alt, az, layer=params[0]), alt.shape),)
+        if endpoint == "et":
+            return (np.reshape(frame.et(alt, az, layer=params[0]), alt.shape),)
+        freq, scalar, col_freq, troposphere, backend = params
+        res = frame.raytrace(alt, az, freq[0] if scalar else np.asarray(freq), col_freq=col_freq,
+                             troposphere=troposphere, backend=backend, executor=self.executor)
+        shape = alt.shape if scalar else (len(freq),) + alt.shape
+        return tuple(np.reshape(x, shape) for x in res)
+
+
+class IonClient:
+    """
+    A client of :class:`IonServer`.
+
+    :param url: Address of the server, e.g. "http://127.0.0.1:8000".
+    :param timeout: Timeout of a query in [s].
+    """
+
+    def __init__(self, url: str, timeout: float | None = None):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def _post(self, endpoint: str, query: dict) -> dict:
+        query = {k: np.asarray(v).tolist() if isinstance(v, (np.ndarray, np.generic)) else v
+                 for k, v in query.items() if v is not None}
+        if isinstance(query.get("dt"), datetime):
+            query["dt"] = query["dt"].isoformat()
+        request = urllib.request.Request(f"{self.url}/{endpoint}", data=json.dumps(query).encode(),
+                                         headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def info(self) -> dict:
+        """
+        :return: Parameters of the served model.
+        """
+        with urllib.request.urlopen(f"{self.url}/info", timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def ed(self, alt: float | np.ndarray, az: float | np.ndarray, layer: int | None = None,
+           dt: datetime | None = None) -> float | np.ndarray:
+        """
+        See :func:`IonFrame.ed`.
+        """
+        return np.asarray(self._post("ed", {"alt": alt, "az": az, "layer": layer, "dt": dt})["ed"])
+
+    def et(self, alt: float | np.ndarray, az: float | np.ndarray, layer: int | None = None,
+           dt: datetime | None = None) -> float | np.ndarray:
+        """
+        See :func:`IonFrame.et`.
+        """
+        return np.asarray(self._post("et", {"alt": alt, "az": az, "layer": layer, "dt": dt})["et"])
+
+    def raytrace(self, alt: float | np.ndarray, az: float | np.ndarray, freq: float | Sequence[float],
+                 col_freq: str = "default", troposphere: bool = True, backend: str = "numpy",
+                 dt: datetime | None = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        See :func:`IonFrame.raytrace`.
+
+        :returns: (refraction, attenuation, emission)
+        """
+        res = self._post("raytrace", {"alt": alt, "az": az, "freq": freq, "col_freq": col_freq,
+                                      "troposphere": troposphere, "backend": backend, "dt": dt})
+        return tuple(np.asarray(res[k]) for k in RAYTRACE_OUTPUTS)
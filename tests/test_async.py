@@ -0,0 +1,54 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from datetime import timedelta
+
+import numpy as np
+
+from test_config import DT, POSITION, seeded_profile_cache
+
+from dionpy import IonExecutor, IonFrame, IonModel
+
+
+class TestAsync(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        dts = [DT + timedelta(minutes=15 * i) for i in range(3)]
+        self.cache, self.frame = seeded_profile_cache(os.path.join(self.tmpdir.name, "profiles.h5"), dts)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_concurrent(self):
+        async def run():
+            limit = asyncio.Semaphore(2)
+            frames = [IonFrame(DT + timedelta(minutes=15 * i), POSITION, nside=8, htop=500, nlayers=20,
+                               autocalc=False, profile_cache=self.cache) for i in range(3)]
+            await asyncio.gather(*(frame.acalc(limit=limit) for frame in frames))
+            model = IonModel(DT, DT + timedelta(minutes=30), POSITION, nside=8, nlayers=20, autocalc=False,
+                             profile_cache=self.cache)
+            await model.acalc(limit=limit)
+            res = await frames[0].araytrace(45, 0, 40, limit=limit, parallel="thread", cache=False)
+            return frames, await model.aat(DT + timedelta(minutes=15), limit=limit), res
+
+        frames, frame, res = asyncio.run(run())
+        for i, frame_i in enumerate(frames):
+            self.assertTrue(np.allclose(frame_i.edens, self.frame.edens * (i + 1)))
+        self.assertTrue(np.allclose(frame.edens, self.frame.edens * 2))
+        ref = self.frame.raytrace(45, 0, 40, parallel="thread", cache=False)
+        for x, y in zip(res, ref):
+            self.assertTrue(np.allclose(x, y))
+
+    def test_cancel(self):
+        async def run(frame):
+            task = asyncio.create_task(frame.acalc())
+            await asyncio.sleep(0.2)
+            task.cancel()
+            await task
+
+        with IonExecutor(1) as executor:
+            frame = IonFrame(DT, POSITION, nside=16, nlayers=100, autocalc=False, executor=executor)
+            with self.assertRaises(asyncio.CancelledError):
+                asyncio.run(run(frame))
+        self.assertFalse(np.any(frame.edens))
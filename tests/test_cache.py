@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from test_config import synthetic_frame
+
+from dionpy import IonFrame, ProfileCache
+from dionpy.modules.scheduler import ProfileJob, calc_frames
+
+
+def _failing_batch(args):
+    raise RuntimeError("Worker failed.")
+
+
+class TestProfileCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "profiles.h5")
+        self.frame = synthetic_frame()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_fetch_update(self):
+        cache = ProfileCache(self.path)
+        pixels, edens = self.frame._obs_pixels, self.frame.edens
+        found, _ = cache.fetch("key", pixels, ("edens",))
+        self.assertFalse(found.any())
+        cache.update("key", pixels[::2], edens=edens[::2])
+        found, (cached,) = cache.fetch("key", pixels, ("edens",))
+        self.assertTrue(np.array_equal(found, np.arange(len(pixels)) % 2 == 0))
+        self.assertTrue(np.array_equal(cached, edens[::2]))
+        cache.update("key", pixels[1::2], edens=edens[1::2])
+        found, (cached,) = cache.fetch("key", pixels, ("edens",))
+        self.assertTrue(found.all())
+        self.assertTrue(np.array_equal(cached, edens))
+
+    def test_eviction(self):
+        edens = self.frame.edens
+        cache = ProfileCache(self.path, maxbytes=int(1.5 * edens.nbytes))
+        cache.update("first", self.frame._obs_pixels, edens=edens)
+        cache.update("second", self.frame._obs_pixels, edens=edens)
+        self.assertNotIn("first", cache)
+        self.assertIn("second", cache)
+
+    def test_calc_missing_only(self):
+        cache = ProfileCache(self.path)
+        key = self.frame._profile_key(f"iri{self.frame.iriversion}")
+        cache.update(key, self.frame._obs_pixels[:10], edens=self.frame.edens[:10], etemp=self.frame.etemp[:10])
+        frame = IonFrame(self.frame.dt, self.frame.position, hbot=self.frame.hbot, htop=self.frame.htop,
+                         nlayers=self.frame.nlayers, nside=self.frame.nside, autocalc=False, profile_cache=cache)
+        todo = frame._profile_jobs()[0].todo
+        self.assertFalse(todo[:10].any())
+        self.assertTrue(todo[10:].all())
+
+    def test_calc_from_cache(self):
+        cache = ProfileCache(self.path)
+        key = self.frame._profile_key(f"iri{self.frame.iriversion}")
+        cache.update(key, self.frame._obs_pixels, edens=self.frame.edens, etemp=self.frame.etemp)
+        frames = [IonFrame(self.frame.dt, self.frame.position, hbot=self.frame.hbot, htop=self.frame.htop,
+                           nlayers=self.frame.nlayers, nside=self.frame.nside, autocalc=False, profile_cache=cache)
+                  for _ in range(2)]
+        calc_frames(frames)
+        for frame in frames:
+            self.assertTrue(np.array_equal(frame.edens, self.frame.edens))
+            self.assertTrue(np.array_equal(frame.etemp, self.frame.etemp))
+
+    def test_worker_error(self):
+        frames = [synthetic_frame() for _ in range(3)]
+        with mock.patch("dionpy.IonFrame.parallel_iri_star", _failing_batch), \
+                mock.patch.object(ProfileJob, "release", autospec=True, side_effect=ProfileJob.release) as release:
+            with self.assertRaisesRegex(RuntimeError, "Worker failed"):
+                calc_frames(frames)
+        # Blocks of unfinished jobs are released once the batches in flight are done
+        self.assertGreater(release.call_count, 0)
+        for call in release.call_args_list:
+            self.assertEqual(call.args[0].blocks, [])
@@ -0,0 +1,47 @@
+import os
+import tempfile
+import unittest
+from datetime import timedelta
+
+import h5py
+import numpy as np
+
+from test_config import DT, POSITION, seeded_profile_cache
+
+from dionpy import IonModel, ProfileCache
+from dionpy.cli import main
+
+
+class TestCLI(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.tmpdir.name, "profiles.h5")
+        dts = [DT + timedelta(minutes=15 * i) for i in range(3)]
+        cache, self.frame = seeded_profile_cache(self.cache_path, dts)
+        self.argv = ["model", DT.isoformat(), (DT + timedelta(minutes=30)).isoformat(), "-p", *map(str, POSITION),
+                     "-o", self.tmpdir.name, "--nside", "8", "--nlayers", "20", "--profile-cache", self.cache_path,
+                     "-j", "1", "-q"]
+        self.path = os.path.join(self.tmpdir.name, "ionmodel_{:g}_{:g}_{:g}.h5".format(*POSITION))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_resume(self):
+        self.assertEqual(main(self.argv), 0)
+        model = IonModel.load(self.path)
+        self.assertEqual(len(model.frames), 3)
+        self.assertTrue(np.allclose(model.edens[2], self.frame.edens * 3))
+
+        # Interrupted after the first frame
+        with h5py.File(self.path, "a") as file:
+            file["meta"].attrs["dt_end"] = DT.strftime("%Y-%m-%d %H:%M")
+        model = IonModel(DT, DT + timedelta(minutes=30), POSITION, nside=8, nlayers=20, autocalc=False,
+                         profile_cache=ProfileCache(self.cache_path))
+        self.assertEqual(model.calc_to_file(self.path, progress=False), 2)
+        self.assertEqual(len(IonModel.load(self.path).frames), 3)
+
+        # Frames on another time grid are not appended
+        with self.assertRaisesRegex(RuntimeError, "different mpf"):
+            main(self.argv + ["--mpf", "10"])
+        with self.assertRaisesRegex(RuntimeError, "different dt_start"):
+            main(["model", (DT - timedelta(minutes=15)).isoformat(), *self.argv[2:]])
@@ -1,6 +1,13 @@
 from datetime import datetime
 import numpy as np
 
+try:
+    import numba
+    # TBB threads hang the interpreter at exit once the tests have forked pools, see dionpy.modules.raytracing_numba
+    numba.config.THREADING_LAYER_PRIORITY = ["omp", "workqueue", "tbb"]
+except ImportError:
+    pass
+
 DT = datetime(2019, 2, 12, 6, 20, 0)
 POSITION = (0, 0, 0)
 
@@ -10,3 +17,37 @@ def ref_coords():
     az = np.linspace(0, 360, 100)
     elm, azm = np.meshgrid(el, az)
     return el, az, elm, azm
+
+
+def synthetic_frame(nside=8, nlayers=20):
+    """
+    IonFrame filled with a smooth Chapman-like profile instead of IRI output, for fast tests.
+    """
+    from dionpy import IonFrame
+
+    frame = IonFrame(DT, POSITION, hbot=60, htop=500, nlayers=nlayers, nside=nside, autocalc=False)
+    heights = frame.get_heights()
+    z = (heights - 300) / 60
+    profile = np.exp(1 - z - np.exp(-z))
+    lat_factor = 1 + 0.3 * np.cos(np.deg2rad(frame._obs_lats))[:, None]
+    frame.edens = (1e12 * lat_factor * profile[None, :]).astype(np.float32)
+    frame.etemp = (500 + 2 * heights[None, :] * lat_factor).astype(np.float32)
+    return frame
+
+
+def seeded_profile_cache(path, dts, factors=None):
+    """
+    ProfileCache holding IRI profiles of a synthetic frame at the given times, so that frames and models at these
+    times are calculated without IRI. Electron density at dts[i] is scaled by factors[i], which default to i + 1.
+
+    :return: The cache and the synthetic frame.
+    """
+    from dionpy import ProfileCache
+
+    cache = ProfileCache(path)
+    frame = synthetic_frame()
+    factors = range(1, len(dts) + 1) if factors is None else factors
+    for dt, factor in zip(dts, factors):
+        key = frame._view(dt, None, None)._profile_key(f"iri{frame.iriversion}")
+        cache.update(key, frame._obs_pixels, edens=frame.edens * factor, etemp=frame.etemp)
+    return cache, frame
@@ -0,0 +1,38 @@
+import pickle
+import unittest
+from datetime import timedelta
+
+import numpy as np
+
+from test_config import DT, POSITION, synthetic_frame
+
+from dionpy import IonFrame
+
+
+class TestGeometry(unittest.TestCase):
+    def test_shared(self):
+        frame = synthetic_frame()
+        other = IonFrame(DT + timedelta(hours=1), list(POSITION), hbot=100, htop=500, nlayers=10, nside=8,
+                         autocalc=False)
+        self.assertIs(frame.geometry, other.geometry)
+        self.assertIs(frame._obs_pixels, other._obs_pixels)
+        with self.assertRaises(ValueError):
+            frame._obs_pixels[0] = 0
+
+        coarse = IonFrame(DT, POSITION, hbot=60, htop=500, nlayers=20, nside=4, autocalc=False)
+        self.assertIsNot(coarse.geometry, frame.geometry)
+        self.assertLess(len(coarse._obs_pixels), len(frame._obs_pixels))
+
+    def test_pickle(self):
+        frame = synthetic_frame()
+        data = pickle.dumps(frame.geometry)
+        self.assertLess(len(data), frame._obs_pixels.nbytes)
+        self.assertIs(pickle.loads(data), frame.geometry)
+
+        restored = pickle.loads(pickle.dumps(frame))
+        self.assertIs(restored.geometry, frame.geometry)
+        np.testing.assert_array_equal(restored.edens, frame.edens)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+
+import healpy as hp
+import numpy as np
+
+from test_config import POSITION, ref_coords
+
+from dionpy.modules.cache import LRUCache
+from dionpy.modules.helpers import sky2ll
+from dionpy.modules.interpolation import interp_cache, interp_obs, layer_interpolator
+
+
+class TestInterpolation(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super(TestInterpolation, self).__init__(*args, **kwargs)
+        self.nside = 16
+        self.hbot, self.htop, self.nlayers = 60, 500, 10
+        posvec = hp.ang2vec(POSITION[1], POSITION[0], lonlat=True)
+        self.obs_pixels = hp.query_disc(self.nside, posvec, np.deg2rad(30), inclusive=True)
+        rng = np.random.default_rng(42)
+        self.data = rng.uniform(1e9, 1e11, (len(self.obs_pixels), self.nlayers)).astype(np.float32)
+        self.el, self.az, self.elm, self.azm = ref_coords()
+
+    def _healpy_layer(self, layer):
+        map_ = np.zeros(hp.nside2npix(self.nside)) + hp.UNSEEN
+        map_[self.obs_pixels] = self.data[:, layer]
+        height = np.linspace(self.hbot, self.htop, self.nlayers)[layer]
+        lat, lon = sky2ll(self.elm, self.azm, height, POSITION)
+        return hp.get_interp_val(map_, lon, lat, lonlat=True)
+
+    def _interpolator(self, cache=True):
+        return layer_interpolator(self.elm, self.azm, self.nside, POSITION, self.hbot, self.htop, self.nlayers,
+                                  self.obs_pixels, cache=cache)
+
+    def test_single_layer(self):
+        interp = self._interpolator(cache=False)
+        for layer in [0, 5, self.nlayers - 1]:
+            self.assertTrue(np.allclose(interp(self.data, layer), self._healpy_layer(layer), rtol=1e-10))
+
+    def test_layer_average(self):
+        ref = np.mean([self._healpy_layer(i) for i in range(self.nlayers)], axis=0)
+        self.assertTrue(np.allclose(self._interpolator(cache=False)(self.data), ref, rtol=1e-10))
+
+    def test_cache_reuse(self):
+        interp_cache.clear()
+        first = self._interpolator()
+        second = self._interpolator()
+        self.assertIs(first, second)
+        self.assertEqual(interp_cache.stats()["hits"], 1)
+
+    def test_interp_obs(self):
+        map_ = np.zeros(hp.nside2npix(self.nside)) + hp.UNSEEN
+        map_[self.obs_pixels] = self.data[:, 0]
+        lon, lat = hp.pix2ang(self.nside, self.obs_pixels, lonlat=True)
+        ref = hp.get_interp_val(map_, lon, lat, lonlat=True)
+        self.assertTrue(np.allclose(interp_obs(self.nside, self.obs_pixels, self.data[:, 0], lon, lat), ref))
+
+    def test_invalid_layer(self):
+        with self.assertRaises(ValueError):
+            self._interpolator(cache=False)(self.data, self.nlayers)
+
+    def test_cache_byte_budget(self):
+        cache = LRUCache(maxsize=8, maxbytes=3000)
+        for i in range(4):
+            cache.put(i, np.zeros(100))  # 800 bytes each
+        self.assertEqual(len(cache), 3)
+        self.assertNotIn(0, cache)
+        cache.put("large", np.zeros(1000))
+        self.assertNotIn("large", cache)
+        self.assertEqual(len(cache), 3)
+        grown = [np.zeros(10)]
+        cache.put("grown", grown)
+        grown.append(np.zeros(1000))
+        cache.trim()
+        self.assertNotIn("grown", cache)
+        interp = self._interpolator(cache=False)
+        self.assertEqual(interp.nbytes, 0)
+        stored = layer_interpolator(self.elm, self.azm, self.nside, POSITION, self.hbot, self.htop, self.nlayers,
+                                    self.obs_pixels, cache=True)
+        stored(self.data, 0)
+        self.assertGreater(stored.nbytes, 0)
@@ -0,0 +1,50 @@
+import os
+import tempfile
+import time
+import unittest
+from datetime import timedelta
+
+import numpy as np
+
+from test_config import DT, POSITION, seeded_profile_cache
+
+from dionpy import IonModel
+
+
+class TestLazyModel(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        # Profiles of all frames are in the cache, so no IRI calculations are needed
+        dts = [DT + timedelta(minutes=15 * i) for i in range(7)]
+        self.cache, self.frame = seeded_profile_cache(os.path.join(self.tmpdir.name, "profiles.h5"), dts)
+        self.model = IonModel(DT, DT + timedelta(minutes=90), POSITION, mpf=15, nside=8, hbot=60, htop=500,
+                              nlayers=20, profile_cache=self.cache, lazy=True, max_memory=3 * self.frame.nbytes)
+
+    def tearDown(self):
+        self.model.frames.close()
+        self.tmpdir.cleanup()
+
+    def test_on_demand(self):
+        self.assertEqual(self.model.frames.loaded(), [])
+        frame = self.model.at(DT + timedelta(minutes=20))
+        self.assertTrue(np.allclose(frame.edens, self.frame.edens * (2 + 5 / 15), rtol=1e-6))
+        for i in range(len(self.model.frames)):
+            self.assertTrue(np.allclose(self.model.frames[i].edens, self.frame.edens * (i + 1)))
+            self.assertLessEqual(len(self.model.frames.loaded()), 3)
+
+    def test_prefetch(self):
+        self.model.frames[0]
+        self.model.frames[1]
+        deadline = time.time() + 30
+        while 3 not in self.model.frames.loaded() and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(sorted(self.model.frames.loaded()), [1, 2, 3])
+
+    def test_without_autocalc(self):
+        model = IonModel(DT, DT + timedelta(minutes=30), POSITION, mpf=15, nside=8, hbot=60, htop=500, nlayers=20,
+                         profile_cache=self.cache, lazy=True, autocalc=False)
+        try:
+            frame = model.at(DT + timedelta(minutes=15))
+            self.assertTrue(np.allclose(frame.edens, self.frame.edens * 2))
+        finally:
+            model.frames.close()
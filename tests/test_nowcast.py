@@ -0,0 +1,55 @@
+import os
+import tempfile
+import unittest
+from datetime import timedelta
+
+import numpy as np
+
+from test_config import DT, POSITION, seeded_profile_cache
+
+from dionpy import NowcastModel
+
+T0 = DT.replace(minute=0)
+
+
+class TestNowcastModel(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        dts = [T0 + timedelta(minutes=15 * i) for i in range(8)]
+        self.cache, self.frame = seeded_profile_cache(os.path.join(self.tmpdir.name, "profiles.h5"), dts)
+        self.now = DT
+        self.model = NowcastModel(POSITION, mpf=15, past=1, ahead=2, nside=8, nlayers=20, profile_cache=self.cache,
+                                  interval=0.05, clock=lambda: self.now)
+
+    def tearDown(self):
+        self.model.stop()
+        self.tmpdir.cleanup()
+
+    def test_rolling_window(self):
+        self.assertEqual(self.model.update(), 4)
+        self.assertEqual(self.model.model.dt_start, T0)
+        self.assertEqual(self.model.model.dt_end, T0 + timedelta(minutes=45))
+        # 06:20 is a third of the way between the frames at 06:15 and 06:30
+        self.assertTrue(np.allclose(self.model.at().edens, self.frame.edens * (2 + 1 / 3), rtol=1e-5))
+
+        self.now = DT + timedelta(minutes=15)
+        self.assertEqual(self.model.update(), 1)
+        self.assertEqual(self.model.model.dt_start, T0 + timedelta(minutes=15))
+        with self.assertRaises(ValueError):
+            self.model.at(T0)
+
+        # Times after the last calculated frame are served by that frame
+        self.now = DT + timedelta(hours=2)
+        self.assertTrue(np.allclose(self.model.at().edens, self.frame.edens * 5))
+
+    def test_background(self):
+        with self.model:
+            self.assertTrue(self.model.wait(timeout=60))
+            self.now = DT + timedelta(minutes=15)
+            self.assertTrue(self.model.wait(T0 + timedelta(minutes=60), timeout=60))
+            # The model runs its own executor, started from this thread
+            self.assertTrue(self.model.model.executor.running)
+        self.assertFalse(self.model.model.executor.running)
+        self.assertIsNone(self.model.error)
+        refr, _, _ = self.model.raytrace(None, 45, 0, 40)
+        self.assertEqual(refr.shape, (1,))
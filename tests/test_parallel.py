@@ -0,0 +1,33 @@
+import os
+import unittest
+
+import numpy as np
+
+from dionpy.modules.parallel import BatchScheduler, SharedBlock
+
+
+class TestBatchScheduler(unittest.TestCase):
+    def test_split(self):
+        scheduler = BatchScheduler(target_time=1, tasks_per_worker=4, default_size=200)
+        # Before the first measurement, batches are limited by the default size and the number of workers
+        self.assertEqual(len(scheduler.split("iri", 10000, 100, 4)), 50)
+        self.assertEqual(len(scheduler.split("iri", 400, 100, 4)), 16)
+        # 1 ms per point -> 10 pixels of 100 layers per second
+        scheduler.update("iri", 1000, 1.)
+        bounds = scheduler.split("iri", 1005, 100, 4)
+        self.assertEqual(bounds[0], (0, 10))
+        self.assertEqual(bounds[-1], (1000, 1005))
+        self.assertIsNone(scheduler.cost("echaim"))
+
+
+class TestSharedBlock(unittest.TestCase):
+    def test_views_outlive_block(self):
+        block = SharedBlock((3, 4), np.float64)
+        block.array[:] = np.arange(12).reshape(3, 4)
+        view = block.array[1]
+        name = block.spec[0]
+        block.close()
+        del block
+        if os.path.isdir("/dev/shm"):
+            self.assertFalse(os.path.exists(os.path.join("/dev/shm", name)))
+        np.testing.assert_array_equal(view, [4, 5, 6, 7])
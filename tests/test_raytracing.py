@@ -0,0 +1,123 @@
+import importlib.util
+import os
+import pickle
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from test_config import ref_coords, synthetic_frame
+
+from dionpy import IonExecutor, ResultCache
+
+
+# Small requests are traced in the calling process; these tests cover the parallel paths
+@mock.patch("dionpy.raytracing.INPROCESS_MAX_RAYS", 0)
+class TestRaytracing(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.frame = synthetic_frame()
+        cls.el, cls.az, cls.elm, cls.azm = ref_coords()
+        cls.elm, cls.azm = cls.elm[::10, ::10], cls.azm[::10, ::10]
+
+    def test_multifreq(self):
+        freqs = np.array([30., 45., 80.])
+        res = self.frame.raytrace(self.elm, self.azm, freqs)
+        for i, freq in enumerate(freqs):
+            single = self.frame.raytrace(self.elm, self.azm, freq)
+            for multi_arr, single_arr in zip(res, single):
+                self.assertEqual(multi_arr.shape, (len(freqs), *self.elm.shape))
+                self.assertTrue(np.allclose(multi_arr[i], single_arr, equal_nan=True))
+
+    def test_multifreq_height_profile(self):
+        freqs = np.array([30., 45.])
+        res = self.frame.raytrace(self.elm, self.azm, freqs, height_profile=True)
+        for arr in res:
+            self.assertEqual(arr.shape, (len(freqs), *self.elm.shape, self.frame.nlayers))
+
+    @unittest.skipIf(importlib.util.find_spec("numba") is None, "numba is not installed")
+    def test_numba_backend(self):
+        for kwargs in [dict(freq=40.), dict(freq=np.array([20., 80.])), dict(freq=40., col_freq="nicolet"),
+                       dict(freq=40., troposphere=False), dict(freq=40., height_profile=True)]:
+            res_np = self.frame.raytrace(self.elm, self.azm, backend="numpy", **kwargs)
+            res_nb = self.frame.raytrace(self.elm, self.azm, backend="numba", **kwargs)
+            for arr_np, arr_nb in zip(res_np, res_nb):
+                self.assertEqual(arr_np.shape, arr_nb.shape)
+                self.assertTrue(np.allclose(arr_np, arr_nb, rtol=1e-7, atol=1e-10, equal_nan=True))
+
+    def test_numba_fallback(self):
+        res_np = self.frame.raytrace(self.elm, self.azm, 40.)
+        with mock.patch.dict(sys.modules, {"dionpy.modules.raytracing_numba": None}):
+            with self.assertWarns(UserWarning):
+                res_fb = self.frame.raytrace(self.elm, self.azm, 40., backend="numba", cache=False)
+        for arr_np, arr_fb in zip(res_np, res_fb):
+            self.assertTrue(np.allclose(arr_np, arr_fb, equal_nan=True))
+
+    def test_executor(self):
+        res_ref = self.frame.raytrace(self.elm, self.azm, 40.)
+        with IonExecutor(workers=2) as executor:
+            pool = executor.pool
+            for _ in range(2):
+                res = self.frame.raytrace(self.elm, self.azm, 40., executor=executor, cache=False)
+                self.assertIs(executor.pool, pool)
+                for arr_ref, arr in zip(res_ref, res):
+                    self.assertTrue(np.allclose(arr_ref, arr, equal_nan=True))
+        self.assertFalse(executor.running)
+
+    def test_inprocess(self):
+        res_ref = self.frame.raytrace(self.elm, self.azm, 40., cache=False)
+        with mock.patch("dionpy.raytracing.INPROCESS_MAX_RAYS", self.elm.size), \
+                mock.patch("dionpy.IonFrame.pool_context", side_effect=AssertionError("A pool was started.")):
+            res = self.frame.raytrace(self.elm, self.azm, 40., cache=False)
+        for arr_ref, arr in zip(res_ref, res):
+            self.assertTrue(np.allclose(arr_ref, arr, equal_nan=True))
+
+    def test_shared_memory(self):
+        frame = synthetic_frame()
+        res_ref = self.frame.raytrace(self.elm, self.azm, 40., height_profile=True)
+        res = frame.raytrace(self.elm, self.azm, 40., height_profile=True, cache=False)
+        for arr_ref, arr in zip(res_ref, res):
+            self.assertTrue(np.allclose(arr_ref, arr, equal_nan=True))
+        # Data stays in shared memory between calls until it is released or reassigned
+        name = frame._shared["edens"].spec[0]
+        frame.raytrace(self.elm, self.azm, 40., cache=False)
+        self.assertEqual(frame._shared["edens"].spec[0], name)
+        self.assertEqual(frame.edens.dtype, np.float32)
+        restored = pickle.loads(pickle.dumps(frame))
+        self.assertTrue(np.array_equal(restored.edens, frame.edens))
+        frame.edens = np.array(frame.edens)
+        self.assertNotIn("edens", frame._shared)
+        frame.release_shared()
+        self.assertEqual(frame._shared, {})
+
+    def test_thread_parallel(self):
+        freqs = np.array([30., 80.])
+        res_proc = self.frame.raytrace(self.elm, self.azm, freqs)
+        res_thr = self.frame.raytrace(self.elm, self.azm, freqs, parallel="thread", cache=False)
+        for arr_proc, arr_thr in zip(res_proc, res_thr):
+            self.assertEqual(arr_proc.shape, arr_thr.shape)
+            self.assertTrue(np.allclose(arr_proc, arr_thr, equal_nan=True))
+        with self.assertRaises(ValueError):
+            self.frame.raytrace(self.elm, self.azm, 40., parallel="gpu")
+
+    def test_result_cache(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = ResultCache(path=os.path.join(tmpdir, "cache.h5"))
+            res = self.frame.raytrace(self.elm, self.azm, 40., cache=cache)
+            res[0][:] = 0  # returned arrays are copies
+            res_cached = self.frame.raytrace(self.elm, self.azm, 40., cache=cache)
+            self.assertEqual(cache.stats()["hits"], 1)
+            # A new cache with the same disk store survives a "restart"
+            restarted = ResultCache(path=os.path.join(tmpdir, "cache.h5"))
+            res_disk = self.frame.raytrace(self.elm, self.azm, 40., cache=restarted)
+            self.assertEqual(restarted.stats()["disk_hits"], 1)
+            for arr, arr_disk in zip(res_cached, res_disk):
+                self.assertTrue(np.array_equal(arr, arr_disk, equal_nan=True))
+            self.assertFalse(np.all(res_cached[0] == 0))
+            # Any change of the frame data invalidates the results
+            frame = synthetic_frame()
+            frame.edens *= 2
+            frame.raytrace(self.elm, self.azm, 40., cache=cache)
+            self.assertEqual(cache.stats()["misses"], 2)
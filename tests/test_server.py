@@ -0,0 +1,50 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+
+import numpy as np
+
+from test_config import synthetic_frame
+
+from dionpy.server import IonClient, IonServer
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        self.frame = synthetic_frame()
+        self.server = IonServer(self.frame, batch_window=0.2)
+        self.server.start()
+        self.client = IonClient(self.server.url, timeout=60)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_queries(self):
+        alt, az = np.array([[30., 45.], [60., 90.]]), np.array([[0., 90.], [180., 270.]])
+        self.assertTrue(np.allclose(self.client.ed(alt, az), self.frame.ed(alt, az)))
+        self.assertTrue(np.allclose(self.client.et(45, 0, layer=3), self.frame.et(45, 0, layer=3)))
+        ref = self.frame.raytrace(alt, az, [40, 80], parallel="thread", cache=False)
+        for x, y in zip(self.client.raytrace(alt, az, [40, 80]), ref):
+            self.assertTrue(np.allclose(x, y))
+        with self.assertRaises(HTTPError) as e:
+            self.client._post("ed", {"alt": 45})
+        self.assertEqual(e.exception.code, 400)
+
+    def test_micro_batching(self):
+        alts = np.linspace(20, 90, 8)
+        with ThreadPoolExecutor(8) as pool:
+            res = list(pool.map(lambda alt: self.client.raytrace(alt, 0, 40)[0], alts))
+        ref = self.frame.raytrace(alts, np.zeros_like(alts), 40, parallel="thread", cache=False)[0]
+        self.assertTrue(np.allclose(res, ref))
+        self.assertLess(self.server.batcher.nbatches, len(alts))
+
+    def test_single_direction(self):
+        # A lone request of one direction is not squeezed before it is split from its batch
+        for freq, shape in ((40, ()), ([40, 80], (2,))):
+            ref = self.frame.raytrace(45, 0, freq, parallel="thread", cache=False)
+            for x, y in zip(self.client.raytrace(45, 0, freq), ref):
+                self.assertEqual(x.shape, shape)
+                self.assertTrue(np.allclose(x, y))
+        for x in self.client.raytrace([45.], [0.], [40, 80, 120]):
+            self.assertEqual(x.shape, (3, 1))
+        self.assertEqual(self.client.ed([45.], [0.]).shape, (1,))
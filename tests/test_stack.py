@@ -0,0 +1,154 @@
+import os
+import tempfile
+import unittest
+from datetime import timedelta
+from unittest import mock
+
+import numpy as np
+
+from test_config import DT, POSITION, seeded_profile_cache
+
+from dionpy import IonModel
+from dionpy.modules.scheduler import iter_calc_frames
+
+
+class TestStackedModel(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        dts = [DT + timedelta(minutes=15 * i) for i in range(5)]
+        self.cache, self.frame = seeded_profile_cache(os.path.join(self.tmpdir.name, "profiles.h5"), dts)
+        self.model = IonModel(DT, DT + timedelta(minutes=60), POSITION, mpf=15, nside=8, hbot=60, htop=500,
+                              nlayers=20, profile_cache=self.cache)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_frames_are_views(self):
+        self.assertEqual(self.model.edens.shape, (5, *self.frame.edens.shape))
+        for i, frame in enumerate(self.model.frames):
+            self.assertTrue(np.shares_memory(frame.edens, self.model.edens))
+            self.assertIs(frame._obs_pixels, self.model.frames[0]._obs_pixels)
+            self.assertTrue(np.allclose(self.model.edens[i], self.frame.edens * (i + 1)))
+
+    def test_load(self):
+        path = os.path.join(self.tmpdir.name, "model")
+        self.model.save(path)
+        model = IonModel.load(path)
+        self.assertTrue(np.array_equal(model.edens, self.model.edens))
+        self.assertTrue(np.shares_memory(model.frames[-1].etemp, model.etemp))
+
+    def test_at_many(self):
+        dts = [DT, DT + timedelta(minutes=20), DT + timedelta(minutes=52.5), DT + timedelta(minutes=60)]
+        frames = self.model.at_many(dts)
+        self.assertIs(frames[0], self.model.frames[0])
+        self.assertIs(frames[-1], self.model.frames[-1])
+        for frame, factor in zip(frames, [1, 2 + 5 / 15, 4.5, 5]):
+            self.assertTrue(np.allclose(frame.edens, self.frame.edens * factor, rtol=1e-6))
+        edens, etemp = self.model.interp(dts)
+        self.assertEqual(edens.shape, (4, *self.frame.edens.shape))
+        self.assertTrue(np.allclose(etemp, self.frame.etemp, rtol=1e-6))
+        with self.assertRaises(ValueError):
+            self.model.at(DT - timedelta(minutes=1))
+
+    def test_iter_frames(self):
+        model = IonModel(DT, DT + timedelta(minutes=60), POSITION, mpf=15, nside=8, hbot=60, htop=500,
+                         nlayers=20, profile_cache=self.cache, autocalc=False)
+        frames = model.iter_frames(lookahead=1)
+        for i, frame in enumerate(frames):
+            self.assertEqual(frame.dt, DT + timedelta(minutes=15 * i))
+            self.assertTrue(np.allclose(frame.edens, self.frame.edens * (i + 1)))
+        self.assertEqual(i, 4)
+        self.assertEqual(model.frames, [])
+
+    def test_lookahead_refilled(self):
+        taken = []
+
+        def source():
+            for i in range(5):
+                taken.append(i)
+                yield self.model._empty_frame(DT + timedelta(minutes=15 * i))
+
+        frames = iter_calc_frames(source(), lookahead=2)
+        next(frames)
+        # The next frame is started before the first one is handed over
+        self.assertEqual(taken, [0, 1, 2])
+        self.assertEqual(len(list(frames)), 4)
+
+
+class TestAdaptiveModel(unittest.TestCase):
+    @staticmethod
+    def factor(minutes):
+        # Density is constant in the first half of an hour and grows quickly after that
+        return 1 + max(minutes - 40, 0) ** 1.5
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        dts = [DT + timedelta(minutes=i) for i in range(61)]
+        self.cache, self.frame = seeded_profile_cache(os.path.join(self.tmpdir.name, "profiles.h5"), dts,
+                                                      [self.factor(i) for i in range(61)])
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def model(self, **kwargs):
+        return IonModel(DT, DT + timedelta(minutes=60), POSITION, mpf=30, nside=8, hbot=60, htop=500, nlayers=20,
+                        profile_cache=self.cache, **kwargs)
+
+    def test_refinement(self):
+        tolerance = 0.02
+        model = self.model(tolerance=tolerance, min_mpf=1)
+        minutes = [(dt - DT).total_seconds() / 60 for dt in model._dts]
+        self.assertLess(len(minutes), 30)
+        # Frames are added only where the density changes
+        self.assertLessEqual(len([m for m in minutes if m < 30]), 2)
+        scale = np.max(self.frame.edens) * self.factor(60)
+        for i in range(61):
+            frame = model.at(DT + timedelta(minutes=i))
+            self.assertLess(np.max(np.abs(frame.edens - self.frame.edens * self.factor(i))), tolerance * scale)
+
+    def test_pchip(self):
+        model = self.model(tolerance=0.2)
+        dts = [DT + timedelta(minutes=i + 0.5) for i in range(60)]
+        truth = np.stack([self.frame.edens * self.factor(i + 0.5) for i in range(60)])
+        errors = [np.max(np.abs(model.interp(dts, kind=kind)[0] - truth)) for kind in ("linear", "pchip")]
+        self.assertLess(errors[1], errors[0])
+
+
+@mock.patch("dionpy.raytracing.INPROCESS_MAX_RAYS", 0)
+class TestModelRaytracing(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        dts = [DT + timedelta(minutes=15 * i) for i in range(3)]
+        cache, frame = seeded_profile_cache(os.path.join(self.tmpdir.name, "profiles.h5"), dts)
+        self.model = IonModel(DT, DT + timedelta(minutes=30), POSITION, mpf=15, nside=8, hbot=60, htop=500,
+                              nlayers=20, profile_cache=cache)
+        self.alt = np.array([[30., 50.], [70., 89.]])
+        self.az = np.array([[0., 90.], [180., 270.]])
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_raytrace(self):
+        dts = [DT, DT + timedelta(minutes=5), DT + timedelta(minutes=30)]
+        res = self.model.raytrace(dts, self.alt, self.az, [40, 60])
+        for i, dt in enumerate(dts):
+            ref = self.model.at(dt)(self.alt, self.az, [40, 60], cache=False, parallel="thread")
+            for x, y in zip(res, ref):
+                self.assertEqual(x[i].shape, y.shape)
+                self.assertTrue(np.allclose(x[i], y, equal_nan=True))
+
+    def test_interp_results(self):
+        refr, atten, emiss = self.model.raytrace(None, self.alt, self.az, 40)
+        self.assertEqual(atten.shape, (3, *self.alt.shape))
+        dt = DT + timedelta(minutes=10)
+        res = self.model.raytrace([dt], self.alt, self.az, 40, interp_results=True)
+        self.assertTrue(np.allclose(res[1][0], atten[0] + 2 / 3 * (atten[1] - atten[0])))
+
+    def test_shared_stack(self):
+        self.model.raytrace(None, self.alt, self.az, 40)
+        blocks = dict(self.model._shared)
+        self.assertEqual(set(blocks), {"edens", "etemp"})
+        # Data of the model is moved to shared memory once and reused by later calls
+        self.model.raytrace([DT + timedelta(minutes=10)], self.alt, self.az, 40, interp_results=True)
+        self.assertIs(self.model._shared["edens"], blocks["edens"])
+        self.assertTrue(np.shares_memory(self.model.frames[1].edens, blocks["edens"].array))
@@ -0,0 +1,95 @@
+import os
+import tempfile
+import unittest
+from datetime import timedelta
+
+import h5py
+import numpy as np
+
+from test_config import DT, POSITION, seeded_profile_cache
+
+from dionpy import IonFrame, IonModel
+from dionpy.modules.helpers import altaz_mesh
+
+
+class TestStorage(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        dts = [DT + timedelta(minutes=15 * i) for i in range(3)]
+        cache, self.frame = seeded_profile_cache(os.path.join(self.tmpdir.name, "profiles.h5"), dts)
+        self.model = IonModel(DT, DT + timedelta(minutes=30), POSITION, mpf=15, nside=8, hbot=60, htop=500,
+                              nlayers=20, profile_cache=cache)
+        self.path = os.path.join(self.tmpdir.name, "model.h5")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_layout(self):
+        self.model.save(self.path, compression="gzip")
+        with h5py.File(self.path, "r") as file:
+            ds = file[sorted(file.keys())[0]]["edens"]
+            self.assertEqual(ds.dtype, np.float32)
+            self.assertEqual(ds.compression, "gzip")
+            self.assertTrue(ds.shuffle)
+            self.assertEqual(ds.chunks, (self.frame.edens.shape[0], 16))
+        with self.assertRaises(ValueError):
+            self.model.save(self.path, compression="zip")
+
+    def test_lazy_load(self):
+        self.model.save(self.path, compression="lzf")
+        model = IonModel.load(self.path, lazy=True)
+        self.assertIsInstance(model.frames[0].edens, h5py.Dataset)
+        with self.assertRaises(RuntimeError):
+            model.edens
+        dt = DT + timedelta(minutes=20)
+        self.assertTrue(np.array_equal(model.at(dt).edens, self.model.at(dt).edens))
+        alt, az = altaz_mesh(10)
+        self.assertTrue(np.allclose(model.frames[1].ed(alt, az, layer=5), self.model.frames[1].ed(alt, az, layer=5)))
+
+        path = os.path.join(self.tmpdir.name, "frame.h5")
+        self.model.frames[1].save(path)
+        frame = IonFrame.load(path, lazy=True)
+        self.assertEqual(frame.nbytes, 0)
+        self.assertTrue(np.array_equal(frame.etemp[:, 3], self.model.frames[1].etemp[:, 3]))
+
+    def test_bulk_load(self):
+        self.model.save(self.path)
+        model = IonModel.load(self.path, workers=2)
+        self.assertEqual(list(model._dts), list(self.model._dts))
+        self.assertTrue(np.array_equal(model.edens, self.model.edens))
+        self.assertIs(model.frames[0]._obs_pixels, model.frames[-1]._obs_pixels)
+
+        with h5py.File(self.path, "a") as file:
+            file[sorted(file.keys())[0]]["meta"].attrs["nside"] = 16
+        with self.assertRaises(RuntimeError):
+            IonModel.load(self.path)
+
+
+class TestAppend(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        dts = [DT + timedelta(minutes=15 * i) for i in range(5)]
+        self.cache, self.frame = seeded_profile_cache(os.path.join(self.tmpdir.name, "profiles.h5"), dts)
+        self.model = IonModel(DT, DT + timedelta(minutes=30), POSITION, mpf=15, nside=8, hbot=60, htop=500,
+                              nlayers=20, profile_cache=self.cache)
+        self.path = os.path.join(self.tmpdir.name, "model.h5")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_extend(self):
+        self.model.extend(DT + timedelta(minutes=60))
+        self.assertEqual(len(self.model.frames), 5)
+        self.assertEqual(self.model.dt_end, DT + timedelta(minutes=60))
+        for i in range(5):
+            self.assertTrue(np.allclose(self.model.edens[i], self.frame.edens * (i + 1)))
+
+    def test_append(self):
+        self.model.save(self.path)
+        self.assertEqual(IonModel.append(self.path, DT + timedelta(minutes=60), profile_cache=self.cache), 2)
+        self.assertEqual(IonModel.append(self.path, DT + timedelta(minutes=60), profile_cache=self.cache), 0)
+        model = IonModel.load(self.path)
+        self.assertEqual(model.dt_end, DT + timedelta(minutes=60))
+        self.assertEqual(len(model.frames), 5)
+        for i in range(5):
+            self.assertTrue(np.allclose(model.edens[i], self.frame.edens * (i + 1)))